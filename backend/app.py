@@ -1,33 +1,61 @@
-from flask import Flask, jsonify
+from flask import Flask, Response, jsonify
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 from datetime import datetime
 import os
 
 # 导入配置和模型
 from config import get_config
+from hashing import HashingBusy
 from models import db
+import storage
+from cache import trip_list_cache, user_cache
+from events import broker
+from metrics import metrics
+import querylog
+import compression
+from ratelimit import limiter
+from serializers import JSONProvider
 from auth import auth_bp
 from trips import trips_bp
+from sync import sync_bp
 
 
-def create_app(config_name=None):
+def create_app(config_name=None, **config_overrides):
     """应用工厂函数"""
     app = Flask(__name__)
+    app.json = JSONProvider(app)
 
     # 加载配置
     if config_name is None:
         config_name = os.environ.get('FLASK_CONFIG', 'development')
 
-    config_class = get_config()
+    config_class = get_config(config_name)
     app.config.from_object(config_class)
+    app.config.update(config_overrides)
+
+    proxies = app.config.get('PROXY_FIX_X_FOR', 0)
+    if proxies:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxies, x_proto=proxies)
 
     # 初始化扩展
+    storage.init_app(app)
     db.init_app(app)
-    CORS(app, origins=app.config['CORS_ORIGINS'])
+    storage.configure_engine(app)
+    metrics.init_app(app)
+    querylog.init_app(app)
+    compression.init_app(app)
+    limiter.init_app(app)
+    trip_list_cache.init_app(app)
+    user_cache.init_app(app)
+    broker.init_app(app)
+    # 分页接口的下一页游标在响应头中，需要暴露给浏览器中的前端
+    CORS(app, origins=app.config['CORS_ORIGINS'], expose_headers=['X-Next-Cursor', 'Link'])
 
     # 注册蓝图
     app.register_blueprint(auth_bp, url_prefix='/api')
     app.register_blueprint(trips_bp, url_prefix='/api')
+    app.register_blueprint(sync_bp, url_prefix='/api')
 
     # 注册路由
     register_routes(app)
@@ -63,27 +91,36 @@ def register_routes(app):
             'environment': app.config.get('ENV', 'development')
         })
 
+    @app.route('/api/metrics', methods=['GET'])
+    def metrics_exposition():
+        """Prometheus 格式的请求指标"""
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
     @app.route('/api/info', methods=['GET'])
+    @storage.read_only
     def app_info():
         """应用信息"""
-        with app.app_context():
-            from models import User, Trip, RideRequest, Booking
-
-            try:
-                stats = {
-                    'users': User.query.count(),
-                    'trips': Trip.query.count(),
-                    'ride_requests': RideRequest.query.count(),
-                    'bookings': Booking.query.count()
-                }
-            except Exception:
-                stats = {
-                    'users': 0,
-                    'trips': 0,
-                    'ride_requests': 0,
-                    'bookings': 0,
-                    'note': '数据库未初始化'
-                }
+        from counters import get_stats
+
+        try:
+            counters = get_stats()
+            stats = {
+                'users': counters.get('user', 0),
+                'trips': counters.get('trip', 0),
+                'ride_requests': counters.get('ride_request', 0),
+                'bookings': counters.get('booking', 0),
+                'trips_by_status': _breakdown(counters, 'trip'),
+                'ride_requests_by_status': _breakdown(counters, 'ride_request'),
+                'bookings_by_status': _breakdown(counters, 'booking')
+            }
+        except Exception:
+            stats = {
+                'users': 0,
+                'trips': 0,
+                'ride_requests': 0,
+                'bookings': 0,
+                'note': '数据库未初始化'
+            }
 
         return jsonify({
             'app': '拼车应用',
@@ -101,6 +138,12 @@ def register_routes(app):
         })
 
 
+def _breakdown(counters, table):
+    """从统计计数器中取出某个表按分类的计数"""
+    prefix = f'{table}:'
+    return {key[len(prefix):]: value for key, value in counters.items() if key.startswith(prefix)}
+
+
 def register_error_handlers(app):
     """注册错误处理器"""
 
@@ -124,6 +167,13 @@ def register_error_handlers(app):
     def method_not_allowed(error):
         return jsonify({'error': '请求方法不被允许'}), 405
 
+    @app.errorhandler(HashingBusy)
+    def hashing_busy(error):
+        response = jsonify({'error': '服务繁忙，请稍后重试'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(app.config['PASSWORD_HASH_RETRY_AFTER'])
+        return response
+
     @app.errorhandler(500)
     def internal_error(error):
         db.session.rollback()
@@ -164,6 +214,14 @@ def register_cli_commands(app):
         with app.app_context():
             reset_database()
 
+    @app.cli.command()
+    def rebuild_counters():
+        """按消息表重建未读计数器"""
+        from counters import rebuild_unread_counters
+        with app.app_context():
+            total = rebuild_unread_counters()
+            print(f'未读计数器已重建，未读消息共 {total} 条')
+
     @app.cli.command()
     def create_admin():
         """创建管理员用户"""
@@ -1,17 +1,78 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, Response, g, request, jsonify, current_app
 from datetime import datetime, timedelta
 import jwt
 from functools import wraps
+from sqlalchemy import event
+from sqlalchemy.orm import Session, joinedload, make_transient_to_detached, object_session
 from models import db, User
+from cache import trip_list_cache, user_cache
+from events import broker, format_sse
+from counters import get_unread_total, mark_conversation_read, record_message_sent
+from pagination import CursorError, decode_cursor, encode_cursor, get_page_limit, keyset_page, set_next_cursor
+from storage import read_only
+from idempotency import idempotent
+from ratelimit import limiter
 
 auth_bp = Blueprint('auth', __name__)
 
 
+def _load_user(user_id):
+    """
+    从用户缓存加载当前用户
+
+    命中时用 merge(load=False) 把快照挂到会话上，不发出 SELECT；
+    未命中时查库并写入缓存。
+    """
+    values = user_cache.get(user_id)
+    if values is None:
+        user = db.session.get(User, user_id)
+        if user is not None:
+            user_cache.set(user_id, {c.key: getattr(user, c.key) for c in User.__table__.columns})
+        return user
+
+    snapshot = User(**values)
+    make_transient_to_detached(snapshot)
+    return db.session.merge(snapshot, load=False)
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _track_user_change(mapper, connection, target):
+    """记录本事务中被修改的用户，提交后使其缓存失效"""
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('changed_user_ids', set()).add(target.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_changed_users(session):
+    user_ids = session.info.pop('changed_user_ids', None)
+    if user_ids:
+        user_cache.invalidate(*user_ids)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_changed_users(session, previous_transaction):
+    session.info.pop('changed_user_ids', None)
+
+
 # JWT认证装饰器
-def token_required(f):
+def token_required(f=None, *, live=False, allow_query_token=False):
+    """
+    校验 JWT 并把当前用户作为第一个参数传给视图
+
+    默认从用户缓存读取；需要读取最新行再写回的视图使用
+    @token_required(live=True)，直接从数据库加载。
+    EventSource 无法设置请求头，SSE 接口用 allow_query_token 允许 ?token= 传令牌。
+    """
+    if f is None:
+        return lambda func: token_required(func, live=live, allow_query_token=allow_query_token)
+
     @wraps(f)
     def decorated(*args, **kwargs):
         token = request.headers.get('Authorization')
+        if not token and allow_query_token:
+            token = request.args.get('token')
         if not token:
             return jsonify({'message': '缺少认证令牌'}), 401
 
@@ -19,10 +80,17 @@ def token_required(f):
             if token.startswith('Bearer '):
                 token = token[7:]
             data = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
-            current_user = User.query.get(data['user_id'])
+            g.user_id = data['user_id']
+            if live:
+                current_user = db.session.get(User, data['user_id'])
+            else:
+                current_user = _load_user(data['user_id'])
         except:
             return jsonify({'message': '认证令牌无效'}), 401
 
+        if current_user is None:
+            return jsonify({'message': '认证令牌无效'}), 401
+
         return f(current_user, *args, **kwargs)
 
     return decorated
@@ -115,7 +183,7 @@ def get_profile(current_user):
 
 
 @auth_bp.route('/user/profile', methods=['PUT'])
-@token_required
+@token_required(live=True)
 def update_profile(current_user):
     """更新用户资料"""
     data = request.get_json()
@@ -132,6 +200,10 @@ def update_profile(current_user):
 
         db.session.commit()
 
+        # 行程列表中内嵌了司机信息
+        if current_user.user_type == 'driver':
+            trip_list_cache.invalidate()
+
         return jsonify({
             'message': '资料更新成功',
             'user': current_user.to_dict()
@@ -142,20 +214,193 @@ def update_profile(current_user):
         return jsonify({'error': '更新失败'}), 500
 
 
+def _merged_message_page(queries, limit, before=None):
+    """
+    对多个消息查询分别做 (created_at, id) 倒序键集分页，再合并为一页
+
+    每个查询都只做一次索引范围扫描，避免对 OR 条件的结果整体排序。
+    """
+    from models import Message
+
+    messages = []
+    has_more = False
+    for query in queries:
+        rows, next_cursor = keyset_page(
+            query, (Message.created_at, Message.id), limit, after=before, descending=True
+        )
+        messages.extend(rows)
+        has_more = has_more or next_cursor is not None
+
+    messages.sort(key=lambda m: (m.created_at, m.id), reverse=True)
+    has_more = has_more or len(messages) > limit
+    messages = messages[:limit]
+
+    next_cursor = None
+    if has_more and messages:
+        next_cursor = encode_cursor(messages[-1].created_at, messages[-1].id)
+    return messages, next_cursor
+
+
+def _get_before_cursor():
+    before = request.args.get('before')
+    return decode_cursor(before, datetime, int) if before else None
+
+
 @auth_bp.route('/messages', methods=['GET'])
+@read_only
 @token_required
 def get_messages(current_user):
-    """获取消息列表"""
+    """获取消息列表（按时间倒序游标分页）"""
+    from models import Message
+
+    try:
+        before = _get_before_cursor()
+    except CursorError:
+        return jsonify({'error': '分页游标无效'}), 400
+
+    messages, next_cursor = _merged_message_page([
+        Message.query.filter_by(sender_id=current_user.id).options(joinedload(Message.sender)),
+        Message.query.filter_by(receiver_id=current_user.id).options(joinedload(Message.sender))
+    ], get_page_limit(), before)
+
+    return set_next_cursor(jsonify([message.to_dict() for message in messages]), next_cursor, 'before')
+
+
+@auth_bp.route('/conversations', methods=['GET'])
+@read_only
+@token_required
+def get_conversations(current_user):
+    """
+    获取会话列表：每个联系人一行，带最后一条消息和未读数（按最后一条消息倒序游标分页）
+
+    会话行由 counters.record_message_sent 维护，每页只读取本页的会话，不扫描消息历史。
+    """
+    from models import ConversationUnread, Message
+
+    try:
+        before = request.args.get('before')
+        before = decode_cursor(before, int) if before else None
+    except CursorError:
+        return jsonify({'error': '分页游标无效'}), 400
+
+    rows, next_cursor = keyset_page(
+        ConversationUnread.query.filter(
+            ConversationUnread.user_id == current_user.id,
+            ConversationUnread.last_message_id.isnot(None)
+        ),
+        (ConversationUnread.last_message_id,),
+        get_page_limit(),
+        after=before,
+        descending=True
+    )
+
+    if not rows:
+        return jsonify([])
+
+    messages = {m.id: m for m in Message.query.filter(Message.id.in_([row.last_message_id for row in rows]))}
+    users = {user.id: user for user in User.query.filter(User.id.in_([row.peer_id for row in rows]))}
+
+    conversations = []
+    for row in rows:
+        other = users.get(row.peer_id)
+        conversations.append({
+            'user': other.to_dict() if other else {'id': row.peer_id},
+            'last_message': messages[row.last_message_id].to_dict(include_sender=False),
+            'unread_count': row.unread
+        })
+
+    return set_next_cursor(jsonify(conversations), next_cursor, 'before')
+
+
+@auth_bp.route('/conversations/<int:user_id>/messages', methods=['GET'])
+@read_only
+@token_required
+def get_conversation_messages(current_user, user_id):
+    """获取与某个联系人的消息（按时间倒序游标分页）"""
     from models import Message
-    messages = Message.query.filter(
-        (Message.sender_id == current_user.id) | (Message.receiver_id == current_user.id)
-    ).order_by(Message.created_at.desc()).all()
 
-    return jsonify([message.to_dict() for message in messages])
+    try:
+        before = _get_before_cursor()
+    except CursorError:
+        return jsonify({'error': '分页游标无效'}), 400
+
+    messages, next_cursor = _merged_message_page([
+        Message.query.filter_by(sender_id=current_user.id, receiver_id=user_id),
+        Message.query.filter_by(sender_id=user_id, receiver_id=current_user.id)
+    ], get_page_limit(), before)
+
+    return set_next_cursor(jsonify([message.to_dict(include_sender=False) for message in messages]),
+                           next_cursor, 'before')
+
+
+@auth_bp.route('/conversations/<int:user_id>/read', methods=['POST'])
+@token_required
+def mark_conversation_as_read(current_user, user_id):
+    """把与某个联系人的会话标记为已读，可指定截止的消息 id"""
+    data = request.get_json(silent=True) or {}
+    up_to_id = data.get('up_to_id')
+
+    # bool 是 int 的子类，true/false 不是有效的消息 id
+    if up_to_id is not None and (isinstance(up_to_id, bool) or not isinstance(up_to_id, int)):
+        return jsonify({'error': '消息ID无效'}), 400
+
+    try:
+        marked = mark_conversation_read(current_user.id, user_id, up_to_id)
+        db.session.commit()
+
+        return jsonify({
+            'message': '已标记为已读',
+            'marked': marked,
+            'unread_total': get_unread_total(current_user.id)
+        })
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': '操作失败'}), 500
+
+
+@auth_bp.route('/messages/unread', methods=['GET'])
+@read_only
+@token_required
+def get_unread_count(current_user):
+    """获取未读消息数（角标）"""
+    return jsonify({'unread_total': get_unread_total(current_user.id)})
+
+
+@auth_bp.route('/events', methods=['GET'])
+@token_required(allow_query_token=True)
+def stream_events(current_user):
+    """当前用户的 SSE 事件流：新消息、预订变化、行程结束"""
+    subscription = broker.subscribe(current_user.id)
+    if subscription is None:
+        response = jsonify({'error': '实时连接数已满，请稍后重试'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(current_app.config['SSE_RETRY_AFTER'])
+        return response
+    heartbeat = current_app.config['SSE_HEARTBEAT_SECONDS']
+
+    def generate():
+        yield 'retry: 3000\n\n'
+        while True:
+            event = subscription.get(timeout=heartbeat)
+            if event is None:
+                yield ': keepalive\n\n'
+            else:
+                yield format_sse(*event)
+
+    response = Response(generate(), mimetype='text/event-stream')
+    # 在 WSGI 服务器关闭响应时释放连接名额，生成器未开始迭代时也会调用；
+    # 连接期间一直占用线程，也计入过载保护的处理中请求数
+    response.call_on_close(lambda: broker.unsubscribe(subscription))
+    response.call_on_close(limiter.hold())
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 
 @auth_bp.route('/messages', methods=['POST'])
 @token_required
+@idempotent
 def send_message(current_user):
     """发送消息"""
     from models import Message
@@ -172,13 +417,20 @@ def send_message(current_user):
         )
 
         db.session.add(message)
+        db.session.flush()
+        record_message_sent(message)
         db.session.commit()
-
-        return jsonify({
-            'message': '消息发送成功',
-            'data': message.to_dict()
-        }), 201
+        # 事件和响应都在 try 中准备好，之后不再访问 ORM 对象
+        event_data = message.to_dict(include_sender=False)
+        message_data = dict(event_data, sender=message.sender.to_dict())
 
     except Exception as e:
         db.session.rollback()
-        return jsonify({'error': '发送失败'}), 500
\ No newline at end of file
+        return jsonify({'error': '发送失败'}), 500
+
+    broker.publish(event_data['receiver_id'], 'message', event_data)
+
+    return jsonify({
+        'message': '消息发送成功',
+        'data': message_data
+    }), 201
\ No newline at end of file
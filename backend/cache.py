@@ -0,0 +1,185 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class VersionTag:
+    """进程内版本号，单进程部署使用"""
+
+    def __init__(self):
+        self._value = 0
+        self._bumped_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        return self._value
+
+    def age(self):
+        """距上次 bump 的秒数"""
+        return time.time() - self._bumped_at
+
+    def bump(self):
+        with self._lock:
+            self._value += 1
+            self._bumped_at = time.time()
+
+
+class FileVersionTag:
+    """
+    基于文件的版本号，供多个 gunicorn 工作进程共享
+
+    每次 bump 都用 os.replace 换上一个新文件，读取时只需一次 stat，
+    (inode, mtime) 变化即视为版本变化。
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def get(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns
+
+    def age(self):
+        try:
+            return time.time() - os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return float('inf')
+
+    def bump(self):
+        tmp_path = f'{self.path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(str(time.time_ns()))
+        os.replace(tmp_path, self.path)
+
+
+class CachedResponse:
+    """缓存的响应体、ETag、分页接口的下一页游标及各编码的压缩结果 {编码: 字节}"""
+
+    __slots__ = ('version', 'body', 'etag', 'next_cursor', 'encoded')
+
+    def __init__(self, version, body, next_cursor=None):
+        self.version = version
+        self.body = body
+        self.etag = hashlib.sha1(body).hexdigest()
+        self.next_cursor = next_cursor
+        self.encoded = {}
+
+
+class ResponseCache:
+    """
+    失效驱动的响应缓存
+
+    条目只在版本号不变时有效；写操作提交后调用 invalidate() 使全部条目失效。
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.version_tag = VersionTag()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.max_entries = app.config.get('RESPONSE_CACHE_SIZE', self.max_entries)
+        version_file = app.config.get('CACHE_VERSION_FILE')
+        self.version_tag = FileVersionTag(version_file) if version_file else VersionTag()
+        self.clear()
+
+    def version(self):
+        """当前版本号；应在查询数据库之前读取，再传给 set()"""
+        return self.version_tag.get()
+
+    def version_age(self):
+        """距上次失效的秒数"""
+        return self.version_tag.age()
+
+    def get(self, key):
+        version = self.version()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.version != version:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, body, version, next_cursor=None):
+        entry = CachedResponse(version, body, next_cursor)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self):
+        self.version_tag.bump()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class UserCache:
+    """
+    已认证用户的 LRU + TTL 缓存，按用户 id 存放列值快照
+
+    写操作提交后需调用 invalidate()；TTL 限制了多进程部署下其他工作进程
+    看到旧数据的最长时间。
+    """
+
+    def __init__(self, max_entries=1024, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.max_entries = app.config.get('USER_CACHE_SIZE', self.max_entries)
+        self.ttl = app.config.get('USER_CACHE_TTL', self.ttl)
+        self.clear()
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires_at, values = entry
+            if expires_at <= now:
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return values
+
+    def set(self, user_id, values):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, values)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# 公开行程列表缓存
+trip_list_cache = ResponseCache()
+
+# token_required 使用的用户缓存
+user_cache = UserCache()
@@ -0,0 +1,91 @@
+"""
+响应压缩
+
+按 Accept-Encoding 协商 br（需安装 brotli）或 gzip，只压缩 COMPRESS_MIMETYPES 中
+不小于 COMPRESS_MIN_SIZE 字节的响应。流式响应（SSE）、已编码或带 no-transform 的
+响应不处理。压缩后强 ETag 改为弱 ETag，条件请求仍按弱比较命中。
+
+来自响应缓存的视图调用 use_cached_encodings(entry.encoded)，压缩结果存进缓存条目，
+同一条目每种编码只压缩一次，条目失效时一起丢弃。
+"""
+
+import gzip
+
+from flask import current_app, g, request
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - 未安装时只使用 gzip
+    brotli = None
+
+# 服务端支持的编码，q 值相同时靠前的优先
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def choose_encoding(accept_encodings):
+    """按客户端的 q 值选择编码，不接受任何压缩时返回 None"""
+    best, best_quality = None, 0
+    for encoding in ENCODINGS:
+        quality = accept_encodings.quality(encoding)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def encode(data, encoding, config):
+    """按配置的级别压缩"""
+    if encoding == 'br':
+        return brotli.compress(data, quality=config['COMPRESS_BROTLI_QUALITY'])
+    # mtime=0 使相同内容的压缩结果相同
+    return gzip.compress(data, compresslevel=config['COMPRESS_LEVEL'], mtime=0)
+
+
+def use_cached_encodings(encoded):
+    """本次响应体来自缓存条目，压缩结果读写该条目的 encoded"""
+    g.cached_encodings = encoded
+
+
+def _compressible(response, config):
+    if response.direct_passthrough or response.is_streamed:
+        return False
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return False
+    if 'Content-Encoding' in response.headers or 'no-transform' in response.headers.get('Cache-Control', ''):
+        return False
+    return response.mimetype in config['COMPRESS_MIMETYPES']
+
+
+def _compress_response(response):
+    config = current_app.config
+    if not _compressible(response, config):
+        return response
+
+    data = response.get_data()
+    if len(data) < config['COMPRESS_MIN_SIZE']:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+
+    cached = g.get('cached_encodings')
+    body = cached.get(encoding) if cached is not None else None
+    if body is None:
+        body = encode(data, encoding, config)
+        if cached is not None:
+            cached[encoding] = body
+    if len(body) >= len(data):
+        return response
+
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_app(app):
+    """在 metrics.init_app 之后调用，使压缩耗时计入请求耗时"""
+    app.after_request(_compress_response)
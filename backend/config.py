@@ -2,6 +2,21 @@ import os
 from datetime import timedelta
 
 
+# 生产环境的 SQLite 连接参数：WAL 让读写互不阻塞，synchronous=NORMAL 在 WAL 下
+# 只在检查点时 fsync，cache_size 为负数时单位是 KiB
+SQLITE_PRODUCTION_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -64000,
+    'mmap_size': 268435456,
+    'temp_store': 'MEMORY',
+    'busy_timeout': 5000,
+}
+
+# gunicorn 每个工作进程的线程数，由 run.py prod 通过环境变量传入
+WORKER_THREADS = int(os.environ.get('WORKER_THREADS') or 8)
+
+
 class Config:
     """基础配置类"""
     # 基本配置
@@ -11,16 +26,97 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///rideshare.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SQLALCHEMY_ECHO = False  # 设为True可以看到SQL语句
+    SQLITE_PRAGMAS = {}  # 每个 SQLite 连接建立时执行的 PRAGMA
+    SQLITE_BUSY_TIMEOUT = 5  # 秒，等待其他连接释放写锁的时间
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE') or 10)  # 以下仅用于 PostgreSQL/MySQL 等服务器数据库
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW') or 20)
+    DB_POOL_RECYCLE = 1800  # 秒，早于服务器的空闲断开时间
+    DB_POOL_TIMEOUT = 30  # 秒
+    # 读副本，逗号分隔；只读接口从副本读取
+    SQLALCHEMY_REPLICA_URIS = [uri for uri in (os.environ.get('DATABASE_REPLICA_URLS') or '').split(',') if uri]
+    REPLICA_STICKY_SECONDS = 5  # 用户/IP 提交写事务后这段时间内的读取走主库，应大于副本延迟
+    REPLICA_STICKY_STORAGE = 'memory'  # 'memory' 仅限单进程；多进程部署使用 'sqlite'
+    REPLICA_STICKY_STORAGE_PATH = os.environ.get('REPLICA_STICKY_STORAGE_PATH') or 'rideshare-writes.db'
 
     # JWT配置
     JWT_SECRET_KEY = SECRET_KEY
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(days=30)
 
+    # 密码哈希配置
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD') or 'pbkdf2:sha256:600000'
+    PASSWORD_SALT_LENGTH = 16
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS') or 2)  # 0 表示在请求线程内计算
+    PASSWORD_HASH_MAX_PENDING = 32  # 排队中的哈希任务上限，超出时登录请求等待
+    PASSWORD_HASH_TIMEOUT = 30  # 秒，排队和计算各自的等待上限，超时返回 503
+    PASSWORD_HASH_RETRY_AFTER = 5  # 秒
+
     # CORS配置
     CORS_ORIGINS = ['http://localhost:3000', 'http://127.0.0.1:3000']
 
     # 分页配置
     POSTS_PER_PAGE = 20
+    MAX_PER_PAGE = 100
+
+    # 附近搜索配置
+    GEO_MAX_RADIUS_KM = 50
+
+    # 行程匹配配置
+    MATCH_TIME_WINDOW_MINUTES = 120
+    MATCH_TOP_K = 5
+    MATCH_MAX_TOP_K = 50  # 接口 k 参数的上限
+
+    # 事件推送配置
+    EVENT_BROKER = 'memory'  # 'memory' 仅限单进程；多进程部署使用 'sqlite'
+    EVENT_BROKER_PATH = os.environ.get('EVENT_BROKER_PATH') or 'rideshare-events.db'
+    EVENT_QUEUE_SIZE = 100
+    EVENT_POLL_INTERVAL = 0.2  # 秒
+    SSE_HEARTBEAT_SECONDS = 15
+    SSE_MAX_STREAMS = None  # 单个进程同时保持的 SSE 连接数上限，None 表示不限制
+    SSE_RETRY_AFTER = 30  # 秒，连接数已满时建议客户端重连的间隔
+
+    # 增量同步配置
+    SYNC_MAX_ROWS = 500  # 每类数据单次最多返回的行数
+
+    # 响应缓存配置
+    RESPONSE_CACHE_SIZE = 256
+    CACHE_VERSION_FILE = None  # 多进程部署时设置，各工作进程通过该文件共享缓存版本
+    USER_CACHE_SIZE = 1024
+    USER_CACHE_TTL = 60  # 秒
+
+    # SQL 诊断配置
+    SLOW_QUERY_THRESHOLD_MS = 200  # 超过该耗时的语句记入慢查询日志，None 表示关闭
+    N_PLUS_ONE_THRESHOLD = 10  # 同一请求中同一语句执行超过该次数时告警，None 表示关闭
+
+    # 请求指标配置
+    METRICS_PATH = None  # 多进程部署时设置，各工作进程通过该 SQLite 文件汇总指标
+    METRICS_FLUSH_INTERVAL = 5  # 秒
+
+    # 响应压缩配置
+    COMPRESS_MIN_SIZE = 1024  # 字节，小于该大小的响应不压缩
+    COMPRESS_LEVEL = 6  # gzip 压缩级别 1-9
+    COMPRESS_BROTLI_QUALITY = 5  # brotli 压缩质量 0-11，需安装 brotli
+    COMPRESS_MIMETYPES = ('application/json', 'text/plain')
+
+    # 幂等键配置
+    IDEMPOTENCY_TTL = 24 * 3600  # 秒，保存的响应在该时间后过期
+    IDEMPOTENCY_LOCK_SECONDS = 60  # 处理中的记录超过该时间视为已放弃
+    IDEMPOTENCY_WAIT_SECONDS = 10  # 并发的重复请求等待首个请求完成的最长时间
+    IDEMPOTENCY_PURGE_INTERVAL = 300  # 秒，清理过期记录的间隔
+
+    # 限流配置
+    RATELIMIT_STORAGE = 'memory'  # 'memory' 仅限单进程；多进程部署使用 'sqlite'
+    RATELIMIT_STORAGE_PATH = os.environ.get('RATELIMIT_STORAGE_PATH') or 'rideshare-ratelimit.db'
+    RATELIMIT_DEFAULT = None  # 未单独配置的接口的 (每秒令牌数, 桶容量)，None 表示不限制
+    RATELIMITS = {}  # 端点名或蓝图名 -> (每秒令牌数, 桶容量)
+    RATELIMIT_EXEMPT = ('health_check', 'metrics_exposition')
+    # 前面的反向代理层数，>0 时按 X-Forwarded-For/Proto 还原客户端地址（限流、读副本按 IP 区分客户端）；
+    # 没有代理时必须为 0，否则客户端可以伪造地址
+    PROXY_FIX_X_FOR = int(os.environ.get('PROXY_FIX_X_FOR') or 0)
+
+    # 过载保护配置
+    SHED_MAX_IN_FLIGHT = None  # 单个进程同时处理的请求数上限，None 表示不限制
+    SHED_MAX_QUEUE_MS = None  # 请求排队时间上限（依据 X-Request-Start 头），None 表示不检查
+    SHED_RETRY_AFTER = 1  # 秒
 
     # 上传文件配置
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
@@ -45,11 +141,29 @@ class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'  # 内存数据库
     WTF_CSRF_ENABLED = False
+    PASSWORD_HASH_WORKERS = 0
 
 
 class ProductionConfig(Config):
     """生产环境配置"""
     DEBUG = False
+    CACHE_VERSION_FILE = os.environ.get('CACHE_VERSION_FILE') or 'rideshare-cache.version'
+    EVENT_BROKER = 'sqlite'
+    SQLITE_PRAGMAS = SQLITE_PRODUCTION_PRAGMAS
+    METRICS_PATH = os.environ.get('METRICS_PATH') or 'rideshare-metrics.db'
+    N_PLUS_ONE_THRESHOLD = None  # 需要对每条语句做指纹归一化，生产环境默认关闭
+    SSE_MAX_STREAMS = max(1, WORKER_THREADS // 4)  # 每个 SSE 连接占一个线程，大部分线程留给普通请求
+    REPLICA_STICKY_STORAGE = 'sqlite'
+    RATELIMIT_STORAGE = 'sqlite'
+    PROXY_FIX_X_FOR = int(os.environ.get('PROXY_FIX_X_FOR') or 1)  # 部署在一层反向代理之后
+    RATELIMIT_DEFAULT = (20, 60)
+    RATELIMITS = {
+        'auth.login': (0.5, 10),
+        'auth.register': (0.1, 5),
+        'trips.get_trips': (10, 30),
+    }
+    SHED_MAX_IN_FLIGHT = max(1, WORKER_THREADS - 1)  # 必须小于线程数，见 ratelimit.py
+    SHED_MAX_QUEUE_MS = 1000
 
     # 生产环境必须设置的环境变量
     @classmethod
@@ -72,7 +186,8 @@ config = {
 }
 
 
-def get_config():
+def get_config(config_name=None):
     """获取当前环境的配置"""
-    config_name = os.environ.get('FLASK_CONFIG', 'default')
+    if config_name is None:
+        config_name = os.environ.get('FLASK_CONFIG', 'default')
     return config.get(config_name, config['default'])
\ No newline at end of file
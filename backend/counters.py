@@ -0,0 +1,217 @@
+"""
+增量维护的计数器
+
+调用方负责提交事务，计数器和业务数据在同一事务里写入。
+"""
+
+from sqlalchemy import case, event, func, insert as insert_, inspect, literal, select, union_all, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+
+from models import (
+    db, User, Trip, RideRequest, Booking, Message, Statistic,
+    UnreadCounter, ConversationUnread, next_change_seq
+)
+
+_UPSERT_INSERTS = {
+    'sqlite': sqlite_insert,
+    'postgresql': postgresql_insert,
+}
+
+
+def _increment(model, keys, amount, column='unread', executor=None, values=None):
+    """
+    计数器加 amount，行不存在时插入；values 中的其他列同时写入
+
+    executor 默认为当前会话；在 flush 事件中调用时传入事件给出的连接。
+    没有原生 upsert 的数据库先 UPDATE，没有行时在保存点里 INSERT；并发事务抢先插入了
+    同一行时 INSERT 违反主键，回滚保存点后重新 UPDATE。
+    """
+    executor = executor if executor is not None else db.session
+    counter = getattr(model, column)
+    values = values or {}
+    dialect = getattr(executor, 'dialect', None) or executor.get_bind().dialect
+    insert = _UPSERT_INSERTS.get(dialect.name)
+    if insert is not None:
+        stmt = insert(model).values(**keys, **{column: amount}, **values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={column: counter + amount, **values}
+        )
+        executor.execute(stmt)
+        return
+
+    conditions = [getattr(model, key) == value for key, value in keys.items()]
+    increment = update(model).where(*conditions).values({column: counter + amount, **values})
+    if executor.execute(increment).rowcount:
+        return
+    try:
+        with executor.begin_nested():
+            executor.execute(insert_(model).values(**keys, **{column: amount}, **values))
+    except IntegrityError:
+        executor.execute(increment)
+
+
+def _decrement(model, keys, amount):
+    """计数器减 amount，不低于 0"""
+    model.query.filter_by(**keys).update({
+        model.unread: case((model.unread > amount, model.unread - amount), else_=0)
+    }, synchronize_session=False)
+
+
+def record_message_sent(message):
+    """发送消息后增加接收者的未读数，并更新双方会话的最后一条消息；message 需已 flush"""
+    last = {'last_message_id': message.id}
+    _increment(UnreadCounter, {'user_id': message.receiver_id}, 1)
+    _increment(ConversationUnread, {'user_id': message.receiver_id, 'peer_id': message.sender_id}, 1,
+               values=last)
+    _increment(ConversationUnread, {'user_id': message.sender_id, 'peer_id': message.receiver_id}, 0,
+               values=last)
+
+
+def mark_conversation_read(user_id, peer_id, up_to_id=None):
+    """
+    用一条 UPDATE 把与 peer_id 的会话中 up_to_id 及之前的消息标记为已读
+
+    返回被标记的消息数，未读计数器按该数量扣减。
+    """
+    query = Message.query.filter(
+        Message.sender_id == peer_id,
+        Message.receiver_id == user_id,
+        Message.is_read.is_(False)
+    )
+    if up_to_id is not None:
+        query = query.filter(Message.id <= up_to_id)
+
+    marked = query.update({Message.is_read: True, Message.change_seq: next_change_seq()},
+                          synchronize_session=False)
+    if marked:
+        _decrement(UnreadCounter, {'user_id': user_id}, marked)
+        _decrement(ConversationUnread, {'user_id': user_id, 'peer_id': peer_id}, marked)
+    return marked
+
+
+def get_unread_total(user_id):
+    """未读总数，一次主键查询"""
+    counter = db.session.get(UnreadCounter, user_id)
+    return counter.unread if counter else 0
+
+
+def rebuild_unread_counters():
+    """
+    按消息表重新计算所有未读计数器和会话的最后一条消息，用于修正历史数据
+
+    两张计数器表各用一条 INSERT ... SELECT ... GROUP BY 在库内算出，不逐行经过 ORM。
+    """
+    ConversationUnread.query.delete()
+    UnreadCounter.query.delete()
+
+    # 每条消息在收发双方的会话里各出现一次，只有接收方那一份可能计入未读；
+    # 会话的最后一条消息因此取两个方向中较新的
+    sides = union_all(
+        select(Message.receiver_id.label('user_id'), Message.sender_id.label('peer_id'),
+               Message.id.label('message_id'),
+               case((Message.is_read.is_(False), 1), else_=0).label('unread')),
+        select(Message.sender_id, Message.receiver_id, Message.id, literal(0)),
+    ).subquery()
+    db.session.execute(insert_(ConversationUnread).from_select(
+        ['user_id', 'peer_id', 'unread', 'last_message_id'],
+        select(sides.c.user_id, sides.c.peer_id, func.sum(sides.c.unread),
+               func.max(sides.c.message_id)).group_by(sides.c.user_id, sides.c.peer_id)
+    ))
+    db.session.execute(insert_(UnreadCounter).from_select(
+        ['user_id', 'unread'],
+        select(ConversationUnread.user_id, func.sum(ConversationUnread.unread)).where(
+            ConversationUnread.unread > 0
+        ).group_by(ConversationUnread.user_id)
+    ))
+    total = db.session.execute(select(func.coalesce(func.sum(UnreadCounter.unread), 0))).scalar()
+
+    db.session.commit()
+    return total
+
+
+# 统计计数器：键为 '<表名>' 和 '<表名>:<分类>'，分类取自下列字段
+STAT_CATEGORIES = {
+    User: 'user_type',
+    Trip: 'status',
+    RideRequest: 'status',
+    Booking: 'status',
+}
+
+
+def adjust_stats(model, deltas, executor=None):
+    """
+    按分类调整统计计数器，deltas 形如 {'active': -1, 'ongoing': 1}
+
+    ORM 的插入、删除和分类字段修改由事件自动统计；绕过 ORM 的批量 UPDATE
+    改变了分类字段时需要调用此函数。
+    """
+    table = model.__tablename__
+    total = 0
+    for category, amount in deltas.items():
+        if amount and category is not None:
+            _increment(Statistic, {'key': f'{table}:{category}'}, amount, column='value', executor=executor)
+        total += amount
+    if total:
+        _increment(Statistic, {'key': table}, total, column='value', executor=executor)
+
+
+def _on_insert(mapper, connection, target):
+    category = getattr(target, STAT_CATEGORIES[type(target)])
+    adjust_stats(type(target), {category: 1}, executor=connection)
+
+
+def _on_delete(mapper, connection, target):
+    category = getattr(target, STAT_CATEGORIES[type(target)])
+    adjust_stats(type(target), {category: -1}, executor=connection)
+
+
+def _on_update(mapper, connection, target):
+    history = inspect(target).attrs[STAT_CATEGORIES[type(target)]].history
+    if history.added and history.deleted and history.added[0] != history.deleted[0]:
+        adjust_stats(type(target), {history.deleted[0]: -1, history.added[0]: 1}, executor=connection)
+
+
+for _model in STAT_CATEGORIES:
+    event.listen(_model, 'after_insert', _on_insert)
+    event.listen(_model, 'after_delete', _on_delete)
+    event.listen(_model, 'after_update', _on_update)
+
+
+def get_stats():
+    """读取全部统计计数器，一次小表查询"""
+    return dict(db.session.execute(select(Statistic.key, Statistic.value)).all())
+
+
+def reconcile_stats():
+    """
+    按业务表重新计算统计计数器，修正漂移
+
+    先对统计表做一次写入以取得写锁（SQLite 下写事务串行），
+    计数和覆盖之间不会有其他事务修改业务表。返回 {键: 修正量}。
+    """
+    db.session.execute(update(Statistic).where(Statistic.key == '').values(value=0))
+
+    actual = {}
+    for model, field in STAT_CATEGORIES.items():
+        column = getattr(model, field)
+        rows = db.session.execute(select(column, func.count()).group_by(column)).all()
+        actual[model.__tablename__] = 0
+        for category, count in rows:
+            actual[model.__tablename__] += count
+            if category is not None:
+                actual[f'{model.__tablename__}:{category}'] = count
+
+    current = get_stats()
+    drift = {}
+    for key in set(current) | set(actual):
+        difference = actual.get(key, 0) - current.get(key, 0)
+        if difference:
+            drift[key] = difference
+
+    Statistic.query.delete()
+    db.session.add_all(Statistic(key=key, value=value) for key, value in actual.items())
+    db.session.commit()
+    return drift
@@ -0,0 +1,220 @@
+"""
+站内事件的发布/订阅
+
+业务接口提交事务后调用 broker.publish()，SSE 接口为每个连接订阅当前用户的事件。
+两种后端：
+- MemoryBackend：进程内直接投递，适合单进程运行；
+- SQLiteBackend：事件写入共享的 SQLite 文件，每个工作进程用一个后台线程轮询
+  新事件并投递给本进程的订阅者，多个 gunicorn 工作进程因此能看到彼此发布的事件。
+
+gthread 工作进程中每个 SSE 连接一直占用一个线程，SSE_MAX_STREAMS 限制单个进程
+同时保持的连接数，超出时 subscribe() 返回 None，接口返回 503 和 Retry-After。
+"""
+
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """一个 SSE 连接的事件队列"""
+
+    def __init__(self, user_id, maxsize):
+        self.user_id = user_id
+        self.queue = queue.Queue(maxsize=maxsize)
+
+    def get(self, timeout):
+        """取下一个事件，超时返回 None"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class MemoryBackend:
+    """进程内事件后端"""
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._next_id = 0
+
+    def subscribe(self, user_id):
+        subscription = Subscription(user_id, self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def publish(self, user_id, event_type, data):
+        with self._lock:
+            self._next_id += 1
+            event_id = self._next_id
+        self._deliver(event_id, user_id, event_type, data)
+
+    def _deliver(self, event_id, user_id, event_type, data):
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait((event_id, event_type, data))
+            except queue.Full:
+                # 客户端读得太慢，丢弃事件；客户端重连后应重新拉取数据
+                pass
+
+
+class SQLiteBackend(MemoryBackend):
+    """通过共享 SQLite 文件在多个工作进程之间传递事件"""
+
+    def __init__(self, path, queue_size=100, poll_interval=0.2, retention=60):
+        super().__init__(queue_size)
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._local = threading.local()
+        self._poller = None
+        self._poller_pid = None
+        self._poller_lock = threading.Lock()
+        self._connection().execute(
+            'CREATE TABLE IF NOT EXISTS events ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, '
+            'type TEXT NOT NULL, data TEXT NOT NULL, created_at REAL NOT NULL)'
+        )
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def subscribe(self, user_id):
+        self._ensure_poller()
+        return super().subscribe(user_id)
+
+    def publish(self, user_id, event_type, data):
+        self._connection().execute(
+            'INSERT INTO events (user_id, type, data, created_at) VALUES (?, ?, ?, ?)',
+            (user_id, event_type, json.dumps(data, ensure_ascii=False), time.time())
+        )
+
+    def _ensure_poller(self):
+        """每个进程懒启动一个轮询线程，gunicorn fork 后各自启动"""
+        with self._poller_lock:
+            if self._poller is not None and self._poller_pid == os.getpid():
+                return
+            self._poller = threading.Thread(target=self._poll, name='event-poller', daemon=True)
+            self._poller_pid = os.getpid()
+            self._poller.start()
+
+    MAX_BACKOFF = 5  # 秒，连续出错时轮询间隔的上限
+
+    def _poll(self):
+        """轮询线程不能退出，否则本进程的订阅者再也收不到事件：任何异常都记录后退避重试"""
+        last_id = None
+        last_cleanup = time.monotonic()
+        delay = self.poll_interval
+
+        while True:
+            time.sleep(delay)
+            try:
+                connection = self._connection()
+                if last_id is None:
+                    last_id = connection.execute('SELECT COALESCE(MAX(id), 0) FROM events').fetchone()[0]
+
+                rows = connection.execute(
+                    'SELECT id, user_id, type, data FROM events WHERE id > ? ORDER BY id',
+                    (last_id,)
+                ).fetchall()
+                for event_id, user_id, event_type, data in rows:
+                    # 先前移位置，无法投递的事件只跳过一次
+                    last_id = event_id
+                    self._deliver(event_id, user_id, event_type, json.loads(data))
+
+                if time.monotonic() - last_cleanup > self.retention:
+                    connection.execute('DELETE FROM events WHERE created_at < ?',
+                                       (time.time() - self.retention,))
+                    last_cleanup = time.monotonic()
+                delay = self.poll_interval
+            except sqlite3.OperationalError:
+                # 数据库暂时被锁，下一轮重试
+                continue
+            except Exception:
+                logger.exception('事件轮询失败，%.1f 秒后重试', delay)
+                delay = min(max(delay, self.poll_interval) * 2, self.MAX_BACKOFF)
+
+
+class EventBroker:
+    """事件代理，按配置选择后端"""
+
+    def __init__(self):
+        self.backend = MemoryBackend()
+        self.max_streams = None
+        self._streams = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.max_streams = app.config.get('SSE_MAX_STREAMS')
+        with self._lock:
+            self._streams = 0
+        queue_size = app.config.get('EVENT_QUEUE_SIZE', 100)
+        if app.config.get('EVENT_BROKER') == 'sqlite':
+            self.backend = SQLiteBackend(
+                app.config['EVENT_BROKER_PATH'],
+                queue_size=queue_size,
+                poll_interval=app.config.get('EVENT_POLL_INTERVAL', 0.2)
+            )
+        else:
+            self.backend = MemoryBackend(queue_size)
+
+    def publish(self, user_ids, event_type, data):
+        """
+        向一个或多个用户发布事件；应在事务提交后、视图的 try 之外调用
+
+        事件只是通知，发布失败只记录日志，不影响已经提交的写操作的响应。
+        """
+        if not isinstance(user_ids, (list, tuple, set)):
+            user_ids = [user_ids]
+        for user_id in set(user_ids):
+            try:
+                self.backend.publish(user_id, event_type, data)
+            except Exception:
+                logger.exception('事件发布失败 type=%s user=%s', event_type, user_id)
+
+    def subscribe(self, user_id):
+        """本进程的连接数达到 SSE_MAX_STREAMS 时返回 None"""
+        with self._lock:
+            if self.max_streams is not None and self._streams >= self.max_streams:
+                return None
+            self._streams += 1
+        return self.backend.subscribe(user_id)
+
+    def unsubscribe(self, subscription):
+        self.backend.unsubscribe(subscription)
+        with self._lock:
+            self._streams -= 1
+
+
+def format_sse(event_id, event_type, data):
+    """格式化为 SSE 消息"""
+    payload = json.dumps(data, ensure_ascii=False)
+    return f'id: {event_id}\nevent: {event_type}\ndata: {payload}\n\n'
+
+
+broker = EventBroker()
@@ -0,0 +1,66 @@
+"""
+经纬度网格索引
+
+把地球按 CELL_SIZE_DEG 度划分成网格，每个点落在一个整数网格编号里。
+附近搜索先算出覆盖查询圆的网格编号，用索引取出这些网格里的行，
+再按球面距离精确过滤和排序，扫描量只与查询范围内的行数有关。
+"""
+
+import math
+
+# 网格边长（度），约 5.5 公里；修改后需要重新计算已存储的网格编号
+CELL_SIZE_DEG = 0.05
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEG_LAT = 111.32
+
+_ROW_OFFSET = 2000
+_COL_OFFSET = 4000
+_COL_COUNT = 10000
+
+
+def is_valid_point(lat, lng):
+    """检查经纬度是否合法"""
+    return -90 <= lat <= 90 and -180 <= lng <= 180
+
+
+def cell_id(lat, lng):
+    """返回点所在网格的编号，坐标缺失时返回 None"""
+    if lat is None or lng is None:
+        return None
+    row = math.floor(lat / CELL_SIZE_DEG) + _ROW_OFFSET
+    col = math.floor(lng / CELL_SIZE_DEG) + _COL_OFFSET
+    return row * _COL_COUNT + col
+
+
+def covering_cells(lat, lng, radius_km):
+    """返回覆盖以 (lat, lng) 为圆心、radius_km 为半径的圆的所有网格编号"""
+    lat_delta = radius_km / KM_PER_DEG_LAT
+    min_lat = max(lat - lat_delta, -90.0)
+    max_lat = min(lat + lat_delta, 90.0)
+
+    # 圆内纬度绝对值最大处经度跨度最大
+    widest_lat = min(max(abs(min_lat), abs(max_lat)), 89.9)
+    lng_delta = min(radius_km / (KM_PER_DEG_LAT * math.cos(math.radians(widest_lat))), 180.0)
+
+    min_row = math.floor(min_lat / CELL_SIZE_DEG)
+    max_row = math.floor(max_lat / CELL_SIZE_DEG)
+    min_col = math.floor((lng - lng_delta) / CELL_SIZE_DEG)
+    max_col = math.floor((lng + lng_delta) / CELL_SIZE_DEG)
+
+    max_col_index = math.floor(180 / CELL_SIZE_DEG)
+    cells = set()
+    for row in range(min_row, max_row + 1):
+        for col in range(min_col, max_col + 1):
+            # 跨越 180° 经线时回绕
+            wrapped = (col + max_col_index) % (2 * max_col_index) - max_col_index
+            cells.add((row + _ROW_OFFSET) * _COL_COUNT + wrapped + _COL_OFFSET)
+    return sorted(cells)
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """两点之间的球面距离（公里）"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lng2 - lng1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
@@ -0,0 +1,95 @@
+"""
+密码哈希工作进程池
+
+PBKDF2 是纯 CPU 计算，放在请求线程里会占住工作进程。这里把哈希和校验
+交给一个有界的进程池执行，请求线程只等待结果（等待期间释放 GIL），
+同时用信号量限制排队中的任务数，登录高峰时登录请求排队，其他接口不受影响。
+排队或计算超过 PASSWORD_HASH_TIMEOUT 秒时抛出 HashingBusy，接口返回 503 和 Retry-After。
+"""
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+
+from flask import current_app, has_app_context
+from werkzeug.security import generate_password_hash, check_password_hash
+
+DEFAULT_METHOD = 'pbkdf2:sha256:600000'
+DEFAULT_SALT_LENGTH = 16
+
+_pool = None
+_pool_pid = None
+_pool_slots = None
+_pool_lock = threading.Lock()
+
+
+class HashingBusy(Exception):
+    """哈希进程池繁忙，未能在 PASSWORD_HASH_TIMEOUT 内完成"""
+
+
+def _settings():
+    if not has_app_context():
+        return DEFAULT_METHOD, DEFAULT_SALT_LENGTH, 0, 0, None
+    config = current_app.config
+    return (
+        config.get('PASSWORD_HASH_METHOD', DEFAULT_METHOD),
+        config.get('PASSWORD_SALT_LENGTH', DEFAULT_SALT_LENGTH),
+        config.get('PASSWORD_HASH_WORKERS', 0),
+        config.get('PASSWORD_HASH_MAX_PENDING', 0),
+        config.get('PASSWORD_HASH_TIMEOUT'),
+    )
+
+
+def _get_pool(workers, max_pending):
+    """按进程懒创建进程池，gunicorn fork 出的每个工作进程各自持有一个"""
+    global _pool, _pool_pid, _pool_slots
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            # spawn 避免在多线程进程中 fork
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+            _pool_pid = os.getpid()
+            _pool_slots = threading.BoundedSemaphore(max_pending or workers * 4)
+        return _pool, _pool_slots
+
+
+def _run(func, *args):
+    workers, max_pending, timeout = _settings()[2:]
+    if workers <= 0:
+        return func(*args)
+
+    pool, slots = _get_pool(workers, max_pending)
+    if not slots.acquire(timeout=timeout):
+        raise HashingBusy()
+    try:
+        future = pool.submit(func, *args)
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            future.cancel()
+            raise HashingBusy()
+    finally:
+        slots.release()
+
+
+def hash_password(password):
+    """生成密码哈希"""
+    method, salt_length = _settings()[:2]
+    return _run(generate_password_hash, password, method, salt_length)
+
+
+def verify_password(password_hash, password):
+    """校验密码"""
+    return _run(check_password_hash, password_hash, password)
+
+
+def shutdown():
+    """关闭进程池"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
@@ -0,0 +1,152 @@
+"""
+幂等键
+
+创建预订、行程和发送消息的接口接受 Idempotency-Key 请求头，同一用户带同一个键的
+请求只执行一次：
+
+- 首个请求先在 idempotency_key 表中登记为处理中，执行完后保存响应；
+- 之后的重试直接重放保存的响应（带 Idempotent-Replayed: true），不访问业务表；
+- 与首个请求并发到达的重复请求等待其完成后重放，超过 IDEMPOTENCY_WAIT_SECONDS 返回 409；
+- 同一个键用于不同的请求（方法、路径或请求体不同）返回 422。
+
+5xx 响应不保存，记录随之删除，客户端可以用同一个键重试。记录在 IDEMPOTENCY_TTL 秒后
+过期；处理中的记录超过 IDEMPOTENCY_LOCK_SECONDS 视为工作进程已退出，可以重新登记。
+幂等表的读写使用独立的短事务，不影响视图所用的会话。
+"""
+
+import hashlib
+import threading
+import time
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import Response, current_app, g, jsonify, request
+from sqlalchemy import and_, delete, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from models import db, IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+# 等待并发的首个请求完成时的轮询间隔（秒）
+_POLL_INTERVAL = 0.05
+
+_table = IdempotencyKey.__table__
+_last_purge = 0.0
+_purge_lock = threading.Lock()
+
+
+def _fingerprint():
+    digest = hashlib.sha256(f'{request.method} {request.path}\n'.encode('utf-8'))
+    digest.update(request.get_data())
+    return digest.hexdigest()
+
+
+def _identity(user_id, key):
+    return and_(_table.c.user_id == user_id, _table.c.key == key)
+
+
+def _purge_expired(connection, cutoff):
+    """每个进程每隔 IDEMPOTENCY_PURGE_INTERVAL 秒清理一次过期记录"""
+    global _last_purge
+    with _purge_lock:
+        now = time.monotonic()
+        if now - _last_purge < current_app.config['IDEMPOTENCY_PURGE_INTERVAL']:
+            return
+        _last_purge = now
+    connection.execute(delete(_table).where(_table.c.created_at < cutoff))
+
+
+def _load(user_id, key):
+    with db.engine.connect() as connection:
+        return connection.execute(select(_table).where(_identity(user_id, key))).first()
+
+
+def _claim(user_id, key, fingerprint):
+    """登记首个请求，返回 (是否登记成功, 已有记录)；已有记录刚被删除时为 None"""
+    config = current_app.config
+    now = datetime.utcnow()
+    expired = now - timedelta(seconds=config['IDEMPOTENCY_TTL'])
+    abandoned = now - timedelta(seconds=config['IDEMPOTENCY_LOCK_SECONDS'])
+
+    try:
+        with db.engine.begin() as connection:
+            _purge_expired(connection, expired)
+            connection.execute(delete(_table).where(_identity(user_id, key), or_(
+                _table.c.created_at < expired,
+                and_(_table.c.status_code.is_(None), _table.c.created_at < abandoned)
+            )))
+            connection.execute(insert(_table).values(
+                user_id=user_id, key=key, fingerprint=fingerprint, created_at=now))
+        return True, None
+    except IntegrityError:
+        return False, _load(user_id, key)
+
+
+def _store(user_id, key, response):
+    with db.engine.begin() as connection:
+        if response is None or response.status_code >= 500:
+            connection.execute(delete(_table).where(_identity(user_id, key)))
+        else:
+            connection.execute(update(_table).where(_identity(user_id, key)).values(
+                status_code=response.status_code,
+                mimetype=response.mimetype,
+                body=response.get_data()
+            ))
+
+
+def _replay(record):
+    response = Response(record.body, status=record.status_code, mimetype=record.mimetype)
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _wait_for_first_request(user_id, key, fingerprint):
+    """登记成功时返回 None，否则返回应直接发给客户端的响应"""
+    deadline = time.monotonic() + current_app.config['IDEMPOTENCY_WAIT_SECONDS']
+    while True:
+        claimed, record = _claim(user_id, key, fingerprint)
+        if claimed:
+            return None
+
+        while record is not None and record.status_code is None and record.fingerprint == fingerprint:
+            if time.monotonic() >= deadline:
+                response = jsonify({'error': '相同幂等键的请求正在处理'})
+                response.status_code = 409
+                response.headers['Retry-After'] = '1'
+                return response
+            time.sleep(_POLL_INTERVAL)
+            record = _load(user_id, key)
+
+        if record is None:
+            # 首个请求失败，记录已删除，重新登记
+            continue
+        if record.fingerprint != fingerprint:
+            return jsonify({'error': '幂等键已用于不同的请求'}), 422
+        return _replay(record)
+
+
+def idempotent(f):
+    """放在 @token_required 之后，按当前用户和 Idempotency-Key 去重"""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return f(*args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return jsonify({'error': '幂等键无效'}), 400
+
+        user_id = g.user_id
+        early_response = _wait_for_first_request(user_id, key, _fingerprint())
+        if early_response is not None:
+            return early_response
+
+        response = None
+        try:
+            response = current_app.make_response(f(*args, **kwargs))
+        finally:
+            _store(user_id, key, response)
+        return response
+
+    return decorated
@@ -4,15 +4,24 @@
 用于创建数据库表和初始化测试数据
 """
 
+import argparse
+import itertools
 import os
+import random
 import sys
+import time
 from datetime import datetime, timedelta
 
 # 添加当前目录到Python路径
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from app import create_app
-from models import db, User, Trip, RideRequest, Booking, Message
+from models import db, User, Trip, RideRequest, Booking, Message, next_change_seq
+from sqlalchemy import func, select
+from counters import rebuild_unread_counters, reconcile_stats
+from geo import cell_id
+from hashing import hash_password
+from querylog import slow_queries_unlogged
 
 
 def create_database():
@@ -314,8 +323,245 @@ def create_sample_bookings():
     return bookings
 
 
-def init_all_data():
-    """初始化所有测试数据"""
+# 合成数据使用的地点（上海）及坐标，靠前的地点更热门
+SYNTHETIC_PLACES = [
+    ('人民广场', 31.2330, 121.4750), ('虹桥火车站', 31.1940, 121.3200),
+    ('同济大学（嘉定校区）', 31.2856, 121.2152), ('浦东机场', 31.1443, 121.8083),
+    ('陆家嘴', 31.2397, 121.4998), ('徐家汇', 31.1950, 121.4370),
+    ('静安寺', 31.2237, 121.4453), ('五角场', 31.2990, 121.5140),
+    ('嘉定北站', 31.3946, 121.2445), ('上海南站', 31.1545, 121.4300),
+    ('虹桥机场', 31.1979, 121.3363), ('莘庄', 31.1110, 121.3850),
+    ('张江', 31.2040, 121.5900), ('中山公园', 31.2190, 121.4170),
+    ('七宝', 31.1570, 121.3530), ('南翔', 31.2980, 121.3200),
+    ('安亭地铁站', 31.2940, 121.1650), ('松江大学城', 31.0490, 121.2130),
+    ('上海迪士尼度假区', 31.1440, 121.6570), ('外滩', 31.2400, 121.4900),
+]
+# 出发时间的小时分布：早晚高峰
+SYNTHETIC_HOUR_WEIGHTS = [1, 1, 1, 1, 1, 2, 4, 10, 12, 6, 4, 4, 5, 4, 4, 5, 7, 11, 12, 7, 5, 4, 3, 2]
+SYNTHETIC_SURNAMES = '王李张刘陈杨黄赵吴周徐孙马朱胡郭何林罗高'
+SYNTHETIC_CAR_MODELS = ['大众朗逸', '本田雅阁', '丰田凯美瑞', '比亚迪秦', '特斯拉Model 3', '别克GL8']
+SYNTHETIC_MESSAGES = ['你好，请问还有座位吗？', '我已预订，谢谢！', '几点到上车点？', '我到了，在门口等你',
+                      '稍等五分钟', '好的，没问题', '路上有点堵', '行李比较多，可以吗？']
+SYNTHETIC_NOTES = [None, None, '希望准时出发', '有一个行李箱', '可以顺路接一下吗', '赶飞机']
+
+
+def _bulk_insert(table, rows, stamped):
+    """插入一批行并提交；stamped 为 True 时整批记上同一个变更序号"""
+    if not rows:
+        return
+    if stamped:
+        seq = next_change_seq()
+        for row in rows:
+            row['change_seq'] = seq
+    db.session.execute(table.insert(), rows)
+    db.session.commit()
+
+
+@slow_queries_unlogged()
+def generate_synthetic_data(users=1000, trips=5000, bookings=20000, messages=20000,
+                            ride_requests=2000, seed=42, chunk_size=20000, base_time=None,
+                            driver_share=0.2, history_days=60, future_days=30):
+    """
+    批量生成合成数据，用于在接近生产规模的数据上复现查询计划
+
+    相同的 seed 和 base_time 生成相同的数据；base_time 默认为当前整点，需要复现时应显式
+    指定。各表的 id 接着库中现有的最大 id 连续分配，因此只有在生成前库中内容相同时
+    （例如都是空库，或都是 init-db 写入的示例数据）结果才逐行相同。
+    行用 Core INSERT 按块批量写入并分块提交，
+    不经过 ORM 写入事件，因此网格编号和变更序号在这里直接写入，统计和未读计数器
+    在最后重新计算。bookings 是目标数量，每个行程的预订受座位数限制，实际数量可能略少。
+    每个批次都会超过慢查询阈值，生成期间不记慢查询日志。
+    """
+    rng = random.Random(seed)
+    if base_time is None:
+        base_time = datetime.now().replace(minute=0, second=0, microsecond=0)
+    now = base_time  # 以 base_time 为当前时间决定状态，保证结果可复现
+    started = time.perf_counter()
+
+    def next_id(model):
+        return (db.session.execute(select(func.max(model.id))).scalar() or 0) + 1
+
+    place_weights = list(itertools.accumulate(1 / (rank + 1) ** 0.8 for rank in range(len(SYNTHETIC_PLACES))))
+    hour_weights = list(itertools.accumulate(SYNTHETIC_HOUR_WEIGHTS))
+    total_days = history_days + future_days
+
+    def place():
+        name, lat, lng = rng.choices(SYNTHETIC_PLACES, cum_weights=place_weights)[0]
+        # 同一地点的坐标在约 1 公里内抖动
+        return name, lat + rng.uniform(-0.01, 0.01), lng + rng.uniform(-0.01, 0.01)
+
+    def route():
+        start = place()
+        end = place()
+        while end[0] == start[0]:
+            end = place()
+        return start, end
+
+    def departure():
+        day = rng.randrange(total_days) - history_days
+        hour = rng.choices(range(24), cum_weights=hour_weights)[0]
+        return base_time.replace(hour=0) + timedelta(days=day, hours=hour, minutes=5 * rng.randrange(12))
+
+    # 用户：前 driver_share 为司机，其余为乘客，id 连续分配
+    first_user = next_id(User)
+    password_hash = hash_password('123456')
+    driver_count = max(1, int(users * driver_share))
+    passenger_count = max(1, users - driver_count)
+    first_driver, first_passenger = first_user, first_user + driver_count
+
+    rows = []
+    for i in range(driver_count + passenger_count):
+        is_driver = i < driver_count
+        rows.append({
+            'id': first_user + i,
+            'name': rng.choice(SYNTHETIC_SURNAMES) + ('师傅' if is_driver else '同学'),
+            'phone': f'15{first_user + i:09d}',
+            'password_hash': password_hash,
+            'user_type': 'driver' if is_driver else 'passenger',
+            'created_at': base_time - timedelta(days=rng.randrange(365), minutes=rng.randrange(1440)),
+            'car_model': rng.choice(SYNTHETIC_CAR_MODELS) if is_driver else None,
+            'plate_number': f'沪{chr(65 + rng.randrange(26))}{rng.randrange(100000):05d}' if is_driver else None,
+            'rating': round(rng.uniform(4.0, 5.0), 1) if is_driver else 5.0,
+            'completed_trips': rng.randrange(300) if is_driver else 0,
+        })
+        if len(rows) >= chunk_size:
+            _bulk_insert(User.__table__, rows, stamped=False)
+            rows = []
+    _bulk_insert(User.__table__, rows, stamped=False)
+    print(f"  👥 用户 {driver_count + passenger_count} 个 ({time.perf_counter() - started:.1f}s)")
+
+    # 行程及其预订：预订数受行程座位数限制，剩余座位按未取消的预订扣减
+    first_trip, first_booking = next_id(Trip), next_id(Booking)
+    bookings_per_trip = bookings / trips if trips else 0
+    trip_rows, booking_rows = [], []
+    booking_id = first_booking
+    for i in range(trips):
+        (start, start_lat, start_lng), (end, end_lat, end_lng) = route()
+        departs_at = departure()
+        if departs_at < now - timedelta(hours=2):
+            status = 'completed' if rng.random() < 0.85 else 'cancelled'
+        else:
+            status = 'active' if rng.random() < 0.95 else 'cancelled'
+        capacity = rng.randint(2, 6)
+        price = rng.choice([15, 20, 25, 30, 35, 40, 50, 60])
+        trip_id = first_trip + i
+
+        seats_left = capacity
+        booked = min(capacity, max(0, round(rng.gauss(bookings_per_trip, 1))), passenger_count)
+        for passenger_index in rng.sample(range(passenger_count), booked):
+            seats = 1 if seats_left < 2 or rng.random() < 0.8 else 2
+            if status == 'cancelled':
+                booking_status = 'cancelled'
+            elif rng.random() < 0.1:
+                booking_status = 'cancelled'
+            else:
+                booking_status = 'completed' if status == 'completed' else 'confirmed'
+                seats_left -= seats
+            booking_rows.append({
+                'id': booking_id,
+                'trip_id': trip_id,
+                'passenger_id': first_passenger + passenger_index,
+                'seats': seats,
+                'amount': price * seats,
+                'status': booking_status,
+                'paid': booking_status == 'completed' or rng.random() < 0.5,
+                'created_at': min(departs_at - timedelta(hours=rng.randint(1, 72)), now),
+            })
+            booking_id += 1
+            if seats_left <= 0:
+                break
+
+        trip_rows.append({
+            'id': trip_id,
+            'driver_id': first_driver + rng.randrange(driver_count),
+            'start_point': start,
+            'end_point': end,
+            'departure_time': departs_at,
+            'available_seats': max(seats_left, 0),
+            'price': price,
+            'status': status,
+            'created_at': min(departs_at - timedelta(hours=rng.randint(2, 240)), now),
+            'start_lat': start_lat,
+            'start_lng': start_lng,
+            'end_lat': end_lat,
+            'end_lng': end_lng,
+            'start_cell': cell_id(start_lat, start_lng),
+        })
+        if len(trip_rows) >= chunk_size:
+            _bulk_insert(Trip.__table__, trip_rows, stamped=True)
+            _bulk_insert(Booking.__table__, booking_rows, stamped=True)
+            trip_rows, booking_rows = [], []
+    _bulk_insert(Trip.__table__, trip_rows, stamped=True)
+    _bulk_insert(Booking.__table__, booking_rows, stamped=True)
+    print(f"  🚗 行程 {trips} 个, 🎫 预订 {booking_id - first_booking} 个 ({time.perf_counter() - started:.1f}s)")
+
+    # 拼车请求
+    first_request = next_id(RideRequest)
+    rows = []
+    for i in range(ride_requests):
+        (start, start_lat, start_lng), (end, end_lat, end_lng) = route()
+        departs_at = departure()
+        if departs_at < now:
+            status = 'completed' if rng.random() < 0.7 else 'cancelled'
+        else:
+            status = 'active' if rng.random() < 0.8 else 'matched'
+        rows.append({
+            'id': first_request + i,
+            'passenger_id': first_passenger + rng.randrange(passenger_count),
+            'start_point': start,
+            'end_point': end,
+            'departure_time': departs_at,
+            'seats': 1 if rng.random() < 0.8 else 2,
+            'note': rng.choice(SYNTHETIC_NOTES),
+            'status': status,
+            'created_at': min(departs_at - timedelta(hours=rng.randint(1, 72)), now),
+            'start_lat': start_lat,
+            'start_lng': start_lng,
+            'end_lat': end_lat,
+            'end_lng': end_lng,
+            'start_cell': cell_id(start_lat, start_lng),
+        })
+        if len(rows) >= chunk_size:
+            _bulk_insert(RideRequest.__table__, rows, stamped=True)
+            rows = []
+    _bulk_insert(RideRequest.__table__, rows, stamped=True)
+    print(f"  📝 拼车请求 {ride_requests} 个 ({time.perf_counter() - started:.1f}s)")
+
+    # 消息：集中在一批乘客-司机会话中，按时间递增；一天前的消息视为已读
+    first_message = next_id(Message)
+    conversations = [
+        (first_passenger + rng.randrange(passenger_count), first_driver + rng.randrange(driver_count))
+        for _ in range(max(1, messages // 6))
+    ]
+    span = timedelta(days=history_days).total_seconds()
+    history_start = now - timedelta(days=history_days)
+    rows = []
+    for i in range(messages):
+        passenger_id, driver_id = rng.choice(conversations)
+        sender_id, receiver_id = (passenger_id, driver_id) if rng.random() < 0.5 else (driver_id, passenger_id)
+        created_at = history_start + timedelta(seconds=span * i / messages + rng.uniform(0, 60))
+        rows.append({
+            'id': first_message + i,
+            'sender_id': sender_id,
+            'receiver_id': receiver_id,
+            'content': rng.choice(SYNTHETIC_MESSAGES),
+            'is_read': created_at < now - timedelta(days=1) or rng.random() < 0.5,
+            'created_at': created_at,
+        })
+        if len(rows) >= chunk_size:
+            _bulk_insert(Message.__table__, rows, stamped=True)
+            rows = []
+    _bulk_insert(Message.__table__, rows, stamped=True)
+    print(f"  💬 消息 {messages} 条 ({time.perf_counter() - started:.1f}s)")
+
+    # 批量写入绕过了计数器维护，按表重新计算
+    rebuild_unread_counters()
+    reconcile_stats()
+    print(f"✅ 合成数据生成完成，共 {time.perf_counter() - started:.1f}s")
+
+
+def init_all_data(synthetic=None):
+    """初始化所有测试数据；synthetic 为 generate_synthetic_data 的参数时再生成合成数据"""
     print("🚀 开始初始化数据库...")
 
     try:
@@ -328,6 +574,10 @@ def init_all_data():
         requests = create_test_ride_requests()
         bookings = create_sample_bookings()
 
+        if synthetic:
+            print("正在生成合成数据...")
+            generate_synthetic_data(**synthetic)
+
         print("\n🎉 数据库初始化完成!")
         print(f"📊 数据统计:")
         print(f"   👥 用户: {User.query.count()} 个")
@@ -345,6 +595,43 @@ def init_all_data():
         raise
 
 
+def add_synthetic_arguments(parser):
+    """添加合成数据规模参数"""
+    parser.add_argument('--users', type=int, help='生成的合成用户数，指定任一规模参数即生成合成数据')
+    parser.add_argument('--trips', type=int, help='生成的合成行程数')
+    parser.add_argument('--bookings', type=int, help='生成的合成预订数（目标值）')
+    parser.add_argument('--messages', type=int, help='生成的合成消息数')
+    parser.add_argument('--ride-requests', type=int, help='生成的合成拼车请求数')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子')
+    parser.add_argument('--chunk-size', type=int, default=20000, help='每批插入的行数')
+    parser.add_argument('--base-time', type=_parse_base_time,
+                        help='视为当前时间的基准时间 YYYY-MM-DDTHH:MM，决定出发时间和行程状态；'
+                             '默认为当前整点，需要复现相同数据时指定')
+
+
+def _parse_base_time(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%dT%H:%M')
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'时间格式错误，应为 YYYY-MM-DDTHH:MM: {value}')
+
+
+def synthetic_options(args):
+    """把命令行参数转换为 generate_synthetic_data 的参数，未指定规模时返回 None"""
+    scale = {
+        'users': args.users,
+        'trips': args.trips,
+        'bookings': args.bookings,
+        'messages': args.messages,
+        'ride_requests': args.ride_requests,
+    }
+    if all(value is None for value in scale.values()):
+        return None
+    options = {name: value for name, value in scale.items() if value is not None}
+    options.update(seed=args.seed, chunk_size=args.chunk_size, base_time=args.base_time)
+    return options
+
+
 def reset_database():
     """重置数据库（删除所有数据并重新创建）"""
     print("🔄 重置数据库...")
@@ -366,15 +653,17 @@ def main():
     parser = argparse.ArgumentParser(description='数据库管理脚本')
     parser.add_argument('action', choices=['init', 'reset', 'create', 'drop'],
                         help='要执行的操作')
+    add_synthetic_arguments(parser)
 
     args = parser.parse_args()
+    synthetic = synthetic_options(args)
 
     # 创建应用上下文
     app = create_app()
 
     with app.app_context():
         if args.action == 'init':
-            init_all_data()
+            init_all_data(synthetic)
         elif args.action == 'reset':
             reset_database()
         elif args.action == 'create':
@@ -0,0 +1,348 @@
+"""
+拼车场景压测
+
+准备一份数据后，用多个虚拟用户并发执行典型操作：
+- 乘客：浏览/搜索行程、预订、给司机发消息、查看我的行程、取消预订、查看消息；
+- 司机：发布行程、查看拼车请求和消息、完成行程；
+- 每个虚拟用户开始时登录，之后按小概率重新登录。
+
+客户端可以是进程内的 Flask test client，也可以通过 HTTP 压测已启动的服务。
+按操作统计延迟分位数和吞吐量，从 /api/metrics 的前后差值得到每个端点的 SQL 语句数，
+报告可写成 JSON，便于在不同提交之间对比。
+"""
+
+import http.client
+import json
+import random
+import re
+import subprocess
+import threading
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlencode, urlsplit
+
+BENCH_PASSWORD = 'bench-password'
+
+PLACES = [
+    '同济大学（嘉定校区）', '虹桥火车站', '嘉定北站', '人民广场', '上海南站', '浦东机场',
+    '徐家汇', '五角场', '静安寺', '陆家嘴', '莘庄', '松江大学城', '安亭', '南翔', '江桥',
+]
+
+
+def seed(drivers=50, passengers=200, trips=2000, ride_requests=500, random_seed=0):
+    """
+    生成压测数据，返回 (司机手机号列表, 乘客手机号列表)；需要在应用上下文中调用
+
+    压测用户已存在时直接返回，不重复生成。
+    """
+    from hashing import hash_password
+    from models import db, User, Trip, RideRequest
+
+    driver_phones = [f'177{i:08d}' for i in range(drivers)]
+    passenger_phones = [f'188{i:08d}' for i in range(passengers)]
+    if User.query.filter_by(phone=driver_phones[0]).first():
+        return driver_phones, passenger_phones
+
+    rng = random.Random(random_seed)
+    password_hash = hash_password(BENCH_PASSWORD)
+    now = datetime.now()
+
+    users = [
+        User(name=f'司机{i}', phone=phone, user_type='driver', password_hash=password_hash,
+             car_model='大众朗逸', plate_number=f'沪A{i:05d}', rating=round(rng.uniform(4, 5), 1))
+        for i, phone in enumerate(driver_phones)
+    ] + [
+        User(name=f'乘客{i}', phone=phone, user_type='passenger', password_hash=password_hash)
+        for i, phone in enumerate(passenger_phones)
+    ]
+    db.session.add_all(users)
+    db.session.flush()
+    driver_ids = [user.id for user in users[:drivers]]
+    passenger_ids = [user.id for user in users[drivers:]]
+
+    def route():
+        start, end = rng.sample(PLACES, 2)
+        return start, end, now + timedelta(minutes=rng.randint(30, 14 * 24 * 60))
+
+    for _ in range(trips):
+        start, end, departure = route()
+        db.session.add(Trip(driver_id=rng.choice(driver_ids), start_point=start, end_point=end,
+                            departure_time=departure, available_seats=rng.randint(1, 4),
+                            price=rng.choice([15, 20, 25, 30, 40, 60])))
+    for _ in range(ride_requests):
+        start, end, departure = route()
+        db.session.add(RideRequest(passenger_id=rng.choice(passenger_ids), start_point=start,
+                                   end_point=end, departure_time=departure, seats=rng.randint(1, 2)))
+    db.session.commit()
+
+    return driver_phones, passenger_phones
+
+
+class InProcessClient:
+    """进程内客户端"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, body=None, headers=None):
+        response = self.client.open(path, method=method, json=body, headers=headers)
+        return response.status_code, response.get_data(), response.headers
+
+
+class HttpClient:
+    """HTTP 客户端，每个虚拟用户一个长连接"""
+
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip('/')
+        self.connection = None
+
+    def request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode()
+            headers['Content-Type'] = 'application/json'
+
+        for attempt in range(2):
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            try:
+                self.connection.request(method, self.prefix + path, body=payload, headers=headers)
+                response = self.connection.getresponse()
+                return response.status, response.read(), response.headers
+            except (http.client.HTTPException, ConnectionError):
+                # 服务端关闭了长连接，重连一次
+                self.connection.close()
+                self.connection = None
+                if attempt:
+                    raise
+
+
+class Recorder:
+    """按操作记录延迟和状态码"""
+
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, elapsed, status):
+        with self._lock:
+            self.samples.setdefault(name, []).append((elapsed, status))
+
+
+class VirtualUser:
+    """一个虚拟用户，按脚本循环执行操作"""
+
+    def __init__(self, client, recorder, phone, user_type, rng):
+        self.client = client
+        self.recorder = recorder
+        self.phone = phone
+        self.user_type = user_type
+        self.rng = rng
+        self.headers = {}
+        self.user_id = None
+        self.booking_ids = []
+        self.trip_ids = []
+
+    def call(self, name, method, path, body=None):
+        status, data, _ = self._call(name, method, path, body)
+        return status, data
+
+    def call_page(self, name, path):
+        """分页接口：返回 (本页的行, 下一页游标)"""
+        _, rows, headers = self._call(name, 'GET', path)
+        return rows or [], headers.get('X-Next-Cursor')
+
+    def _call(self, name, method, path, body=None):
+        started = time.perf_counter()
+        try:
+            status, data, headers = self.client.request(method, path, body, self.headers)
+        except Exception:
+            status, data, headers = 599, b'', {}
+        self.recorder.add(name, time.perf_counter() - started, status)
+        if status >= 400 or not data:
+            return status, None, headers
+        try:
+            return status, json.loads(data), headers
+        except ValueError:
+            return status, None, headers
+
+    def login(self):
+        status, data = self.call('login', 'POST', '/api/login',
+                                 {'phone': self.phone, 'password': BENCH_PASSWORD})
+        if data:
+            self.headers = {'Authorization': f"Bearer {data['token']}"}
+            self.user_id = data['user']['id']
+        return status == 200
+
+    def run(self, deadline):
+        if not self.login():
+            return
+        while time.perf_counter() < deadline:
+            if self.rng.random() < 0.05:
+                self.login()
+            if self.user_type == 'driver':
+                self.driver_iteration()
+            else:
+                self.passenger_iteration()
+
+    def passenger_iteration(self):
+        rng = self.rng
+        trips, next_cursor = self.call_page('browse_trips', '/api/trips?limit=20')
+        if next_cursor and rng.random() < 0.3:
+            query = urlencode({'limit': 20, 'after': next_cursor})
+            trips += self.call_page('browse_trips', f'/api/trips?{query}')[0]
+
+        query = urlencode({'start_point': rng.choice(PLACES), 'seats': 1, 'limit': 20})
+        trips += self.call_page('search_trips', f'/api/trips/search?{query}')[0]
+
+        if trips and rng.random() < 0.5:
+            trip = rng.choice(trips)
+            status, booked = self.call('create_booking', 'POST', '/api/bookings',
+                                       {'trip_id': trip['id'], 'seats': 1})
+            if status == 201 and booked:
+                self.booking_ids.append(booked['booking']['id'])
+                self.call('send_message', 'POST', '/api/messages',
+                          {'receiver_id': trip['driver_id'], 'content': '你好，我已预订'})
+
+        self.call('my_trips', 'GET', '/api/my-trips')
+        if self.booking_ids and rng.random() < 0.3:
+            booking_id = self.booking_ids.pop(rng.randrange(len(self.booking_ids)))
+            self.call('cancel_booking', 'PUT', f'/api/bookings/{booking_id}/cancel')
+        self.call('get_messages', 'GET', '/api/messages?limit=20')
+
+    def driver_iteration(self):
+        rng = self.rng
+        if rng.random() < 0.5:
+            start, end = rng.sample(PLACES, 2)
+            departure = datetime.now() + timedelta(minutes=rng.randint(60, 7 * 24 * 60))
+            status, created = self.call('create_trip', 'POST', '/api/trips', {
+                'start_point': start, 'end_point': end,
+                'departure_time': departure.strftime('%Y-%m-%dT%H:%M'),
+                'available_seats': rng.randint(1, 4), 'price': rng.choice([20, 25, 30])
+            })
+            if status == 201 and created:
+                self.trip_ids.append(created['trip']['id'])
+
+        self.call('ride_requests', 'GET', '/api/ride-requests?limit=20')
+        self.call('get_messages', 'GET', '/api/messages?limit=20')
+        self.call('my_trips', 'GET', '/api/my-trips')
+        if self.trip_ids and rng.random() < 0.2:
+            trip_id = self.trip_ids.pop(0)
+            self.call('complete_trip', 'PUT', f'/api/trips/{trip_id}/complete')
+
+
+_METRIC_LINE = re.compile(r'^(\w+)\{([^}]*)\} (\S+)$')
+
+
+def _scrape_endpoint_metrics(client):
+    """读取 /api/metrics 中每个端点的请求数、SQL 语句数和数据库耗时"""
+    status, data, _ = client.request('GET', '/api/metrics')
+    totals = {}
+    if status != 200:
+        return totals
+    for line in data.decode().splitlines():
+        match = _METRIC_LINE.match(line)
+        if not match:
+            continue
+        name, labels, value = match.groups()
+        endpoint = re.search(r'endpoint="([^"]*)"', labels).group(1)
+        field = {
+            'rideshare_http_request_duration_seconds_count': 'requests',
+            'rideshare_sql_statements_total': 'sql_statements',
+            'rideshare_sql_duration_seconds_total': 'sql_seconds',
+        }.get(name)
+        if field:
+            entry = totals.setdefault(endpoint, {'requests': 0, 'sql_statements': 0, 'sql_seconds': 0.0})
+            entry[field] += float(value)
+    return totals
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run(make_client, driver_phones, passenger_phones, users=16, driver_share=0.25,
+        duration=20, random_seed=0):
+    """执行压测并返回报告"""
+    rng = random.Random(random_seed)
+    recorder = Recorder()
+    metrics_client = make_client()
+    before = _scrape_endpoint_metrics(metrics_client)
+
+    drivers = max(1, round(users * driver_share))
+    virtual_users = []
+    for i in range(users):
+        if i < drivers:
+            phone, user_type = rng.choice(driver_phones), 'driver'
+        else:
+            phone, user_type = rng.choice(passenger_phones), 'passenger'
+        virtual_users.append(VirtualUser(make_client(), recorder, phone, user_type,
+                                         random.Random(random_seed * 1000 + i)))
+
+    started = time.perf_counter()
+    deadline = started + duration
+    threads = [threading.Thread(target=user.run, args=(deadline,)) for user in virtual_users]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    after = _scrape_endpoint_metrics(metrics_client)
+
+    operations = {}
+    total = 0
+    for name, samples in sorted(recorder.samples.items()):
+        latencies = sorted(elapsed_s for elapsed_s, _ in samples)
+        total += len(samples)
+        operations[name] = {
+            'count': len(samples),
+            'server_errors': sum(1 for _, status in samples if status >= 500),
+            'client_errors': sum(1 for _, status in samples if 400 <= status < 500),
+            'requests_per_second': round(len(samples) / elapsed, 2),
+            'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3),
+            'p50_ms': round(_percentile(latencies, 0.50) * 1000, 3),
+            'p95_ms': round(_percentile(latencies, 0.95) * 1000, 3),
+            'p99_ms': round(_percentile(latencies, 0.99) * 1000, 3),
+        }
+
+    endpoints = {}
+    for endpoint, values in sorted(after.items()):
+        previous = before.get(endpoint, {})
+        requests = values['requests'] - previous.get('requests', 0)
+        if requests <= 0 or endpoint == 'metrics_exposition':
+            continue
+        statements = values['sql_statements'] - previous.get('sql_statements', 0)
+        seconds = values['sql_seconds'] - previous.get('sql_seconds', 0.0)
+        endpoints[endpoint] = {
+            'requests': int(requests),
+            'sql_statements': int(statements),
+            'sql_per_request': round(statements / requests, 2),
+            'db_ms_per_request': round(seconds / requests * 1000, 3),
+        }
+
+    return {
+        'commit': _git_commit(),
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'users': users,
+        'duration_seconds': round(elapsed, 2),
+        'total_requests': total,
+        'requests_per_second': round(total / elapsed, 2),
+        'operations': operations,
+        'endpoints': endpoints,
+    }
@@ -0,0 +1,214 @@
+"""
+拼车请求与行程的批量匹配
+
+把活跃的拼车请求和行程读成 NumPy 列数组，按出发时间窗口和座位数剪枝出
+候选对，再对候选对整批计算路线相似度、时间差和价格得分，分别取出每个请求
+和每个行程的前 k 个匹配。请求按批处理，内存占用与批大小成正比。
+"""
+
+import numpy as np
+from sqlalchemy import func, select
+
+from models import db, Trip, RideRequest
+
+# 得分权重
+ROUTE_WEIGHT = 0.5
+TIME_WEIGHT = 0.3
+PRICE_WEIGHT = 0.2
+
+# 起终点距离之和为该值（公里）时，坐标路线相似度衰减到 1/e
+ROUTE_DISTANCE_SCALE_KM = 5.0
+EARTH_RADIUS_KM = 6371.0
+
+# 每批处理的请求数
+BATCH_SIZE = 2000
+
+
+class Match:
+    """一个请求与行程的匹配结果"""
+
+    __slots__ = ('request_id', 'trip_id', 'score', 'time_delta_minutes')
+
+    def __init__(self, request_id, trip_id, score, time_delta_minutes):
+        self.request_id = request_id
+        self.trip_id = trip_id
+        self.score = score
+        self.time_delta_minutes = time_delta_minutes
+
+    def to_dict(self):
+        return {
+            'request_id': self.request_id,
+            'trip_id': self.trip_id,
+            'score': round(self.score, 4),
+            'time_delta_minutes': self.time_delta_minutes
+        }
+
+
+def _minutes(values):
+    return np.array(values, dtype='datetime64[m]').astype(np.int64)
+
+
+def _floats(values):
+    return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+
+
+def _encode(values, vocabulary):
+    return np.array([vocabulary.setdefault(v, len(vocabulary)) for v in values], dtype=np.int64)
+
+
+def _columns(rows, vocabulary):
+    """把查询结果行转换为列数组"""
+    ids, start, end, departure, seats, start_lat, start_lng, end_lat, end_lng, *extra = zip(*rows)
+    columns = {
+        'id': np.array(ids, dtype=np.int64),
+        'start': _encode(start, vocabulary),
+        'end': _encode(end, vocabulary),
+        'departure': _minutes(departure),
+        'seats': np.array(seats, dtype=np.int64),
+        'start_lat': _floats(start_lat),
+        'start_lng': _floats(start_lng),
+        'end_lat': _floats(end_lat),
+        'end_lng': _floats(end_lng),
+    }
+    if extra:
+        columns['price'] = np.array(extra[0], dtype=np.float64)
+    return columns
+
+
+def load_requests(request_ids=None, departure_between=None):
+    """读取活跃拼车请求的列数组，不构造 ORM 对象；departure_between 为 (最早, 最晚) 出发时间"""
+    stmt = select(
+        RideRequest.id, RideRequest.start_point, RideRequest.end_point, RideRequest.departure_time,
+        RideRequest.seats, RideRequest.start_lat, RideRequest.start_lng,
+        RideRequest.end_lat, RideRequest.end_lng
+    ).where(RideRequest.status == 'active')
+    if request_ids is not None:
+        stmt = stmt.where(RideRequest.id.in_(request_ids))
+    if departure_between is not None:
+        stmt = stmt.where(RideRequest.departure_time.between(*departure_between))
+    return db.session.execute(stmt).all()
+
+
+def max_trip_price():
+    """可预订行程的最高价格，只加载部分行程时用于保持价格得分与全量匹配一致"""
+    return db.session.execute(
+        select(func.max(Trip.price)).where(Trip.status == 'active', Trip.available_seats > 0)
+    ).scalar()
+
+
+def load_trips(trip_ids=None, departure_between=None):
+    """读取可预订行程的列数组，不构造 ORM 对象；departure_between 为 (最早, 最晚) 出发时间"""
+    stmt = select(
+        Trip.id, Trip.start_point, Trip.end_point, Trip.departure_time,
+        Trip.available_seats, Trip.start_lat, Trip.start_lng,
+        Trip.end_lat, Trip.end_lng, Trip.price
+    ).where(Trip.status == 'active', Trip.available_seats > 0)
+    if trip_ids is not None:
+        stmt = stmt.where(Trip.id.in_(trip_ids))
+    if departure_between is not None:
+        stmt = stmt.where(Trip.departure_time.between(*departure_between))
+    return db.session.execute(stmt).all()
+
+
+def _haversine(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(np.radians, (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def _top_k(groups, scores, k):
+    """返回每个分组得分最高的 k 个元素的下标"""
+    if len(groups) == 0:
+        return np.empty(0, dtype=np.int64)
+    order = np.lexsort((-scores, groups))
+    sorted_groups = groups[order]
+    starts = np.flatnonzero(np.r_[True, sorted_groups[1:] != sorted_groups[:-1]])
+    counts = np.diff(np.r_[starts, len(order)])
+    rank = np.arange(len(order)) - np.repeat(starts, counts)
+    return order[rank < k]
+
+
+def _score_batch(req, trips, lo, hi, window, max_price):
+    """计算一批请求的所有候选对，返回 (请求下标, 行程下标, 得分, 时间差)"""
+    counts = hi - lo
+    total = int(counts.sum())
+    if total == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, np.empty(0), empty
+
+    # 展开成候选对：第 i 个请求对应排序后行程的 [lo[i], hi[i]) 区间
+    r_idx = np.repeat(np.arange(len(lo)), counts)
+    t_idx = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(lo, counts)
+
+    keep = trips['seats'][t_idx] >= req['seats'][r_idx]
+
+    # 路线相似度：有坐标时按起终点距离，否则按地名是否一致
+    text_sim = 0.5 * (req['start'][r_idx] == trips['start'][t_idx]) + \
+        0.5 * (req['end'][r_idx] == trips['end'][t_idx])
+    distance = _haversine(req['start_lat'][r_idx], req['start_lng'][r_idx],
+                          trips['start_lat'][t_idx], trips['start_lng'][t_idx]) + \
+        _haversine(req['end_lat'][r_idx], req['end_lng'][r_idx],
+                   trips['end_lat'][t_idx], trips['end_lng'][t_idx])
+    route_sim = np.where(np.isnan(distance), text_sim, np.exp(-distance / ROUTE_DISTANCE_SCALE_KM))
+    keep &= route_sim > 0.01
+
+    time_delta = trips['departure'][t_idx] - req['departure'][r_idx]
+    time_score = 1.0 - np.abs(time_delta) / window
+    price_score = 1.0 - trips['price'][t_idx] / max_price
+
+    scores = ROUTE_WEIGHT * route_sim + TIME_WEIGHT * time_score + PRICE_WEIGHT * price_score
+    return r_idx[keep], t_idx[keep], scores[keep], time_delta[keep]
+
+
+def match(request_rows, trip_rows, top_k=5, window_minutes=120, batch_size=BATCH_SIZE, max_price=None):
+    """
+    匹配拼车请求和行程
+
+    max_price 为价格得分的归一化基准，默认取 trip_rows 中的最高价格。
+    返回 (by_request, by_trip)：分别以请求 id、行程 id 为键，值为按得分降序的 Match 列表。
+    """
+    if not request_rows or not trip_rows:
+        return {}, {}
+
+    vocabulary = {}
+    req = _columns(request_rows, vocabulary)
+    trips = _columns(trip_rows, vocabulary)
+
+    # 行程按出发时间排序，每个请求的时间窗口对应一段连续区间
+    order = np.argsort(trips['departure'], kind='stable')
+    trips = {name: column[order] for name, column in trips.items()}
+    max_price = max(float(trips['price'].max() if max_price is None else max_price), 1e-9)
+
+    window = max(int(window_minutes), 1)
+    lo_all = np.searchsorted(trips['departure'], req['departure'] - window, side='left')
+    hi_all = np.searchsorted(trips['departure'], req['departure'] + window, side='right')
+
+    request_parts = []
+    trip_parts = []
+    for start in range(0, len(req['id']), batch_size):
+        stop = start + batch_size
+        batch = {name: column[start:stop] for name, column in req.items()}
+        r_idx, t_idx, scores, deltas = _score_batch(batch, trips, lo_all[start:stop], hi_all[start:stop],
+                                                    window, max_price)
+        r_idx = r_idx + start
+
+        # 每批内先各自取前 k 个，跨批只需合并这些候选
+        picked = _top_k(r_idx, scores, top_k)
+        request_parts.append((r_idx[picked], t_idx[picked], scores[picked], deltas[picked]))
+        picked = _top_k(t_idx, scores, top_k)
+        trip_parts.append((r_idx[picked], t_idx[picked], scores[picked], deltas[picked]))
+
+    def collect(parts, by_trip):
+        r_idx, t_idx, scores, deltas = (np.concatenate(column) for column in zip(*parts))
+        groups = t_idx if by_trip else r_idx
+        picked = _top_k(groups, scores, top_k)
+        picked = picked[np.lexsort((-scores[picked], groups[picked]))]
+
+        result = {}
+        for r, t, score, delta in zip(r_idx[picked].tolist(), t_idx[picked].tolist(),
+                                      scores[picked].tolist(), deltas[picked].tolist()):
+            m = Match(int(req['id'][r]), int(trips['id'][t]), score, delta)
+            result.setdefault(m.trip_id if by_trip else m.request_id, []).append(m)
+        return result
+
+    return collect(request_parts, False), collect(trip_parts, True)
@@ -0,0 +1,202 @@
+"""
+请求指标
+
+每个请求按端点记录：请求数（按状态码）、延迟直方图、SQL 语句数和数据库耗时。
+SQL 语句数和耗时通过 SQLAlchemy 引擎的 cursor 事件累加到当前请求上。
+
+所有指标都是累加值。配置 METRICS_PATH 后，各工作进程每隔 METRICS_FLUSH_INTERVAL 秒
+把本进程的增量累加进共享的 SQLite 文件，/api/metrics 读取合计值，输出 Prometheus
+文本格式；未配置时只统计本进程。
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+# 延迟直方图的桶上限（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRIC_FAMILIES = {
+    'rideshare_http_requests_total': ('counter', '按端点、方法和状态码统计的请求数'),
+    'rideshare_http_request_duration_seconds': ('histogram', '请求处理耗时'),
+    'rideshare_sql_statements_total': ('counter', '请求执行的 SQL 语句数'),
+    'rideshare_sql_duration_seconds_total': ('counter', '请求在数据库上花费的时间'),
+}
+
+
+def _labels(**labels):
+    return ','.join(f'{name}="{value}"' for name, value in sorted(labels.items()))
+
+
+def _family(name):
+    for suffix in ('_bucket', '_sum', '_count'):
+        if name.endswith(suffix) and name[:-len(suffix)] in METRIC_FAMILIES:
+            return name[:-len(suffix)]
+    return name
+
+
+def _sort_key(item):
+    (name, labels), _ = item
+    # 同一组标签的桶、_sum、_count 放在一起，桶按上限数值排序
+    pairs = labels.split(',')
+    le = [pair[4:-1] for pair in pairs if pair.startswith('le=')]
+    rest = ','.join(pair for pair in pairs if not pair.startswith('le='))
+    return _family(name), rest, name, float(le[0]) if le else 0.0
+
+
+class Metrics:
+    """按端点聚合的请求指标"""
+
+    def __init__(self):
+        self.path = None
+        self.flush_interval = 5
+        self._values = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._local = threading.local()
+
+    def init_app(self, app):
+        """在 db.init_app 之后调用"""
+        self.path = app.config.get('METRICS_PATH')
+        self.flush_interval = app.config.get('METRICS_FLUSH_INTERVAL', 5)
+        with self._lock:
+            self._values.clear()
+            self._pending.clear()
+        if self.path:
+            self._connection().execute(
+                'CREATE TABLE IF NOT EXISTS metrics ('
+                'name TEXT NOT NULL, labels TEXT NOT NULL, value REAL NOT NULL, '
+                'PRIMARY KEY (name, labels))'
+            )
+
+        with app.app_context():
+            for engine in app.extensions['sqlalchemy'].engines.values():
+                event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+                event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+                event.listen(engine, 'handle_error', _discard_cursor_timer)
+
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _start_request(self):
+        g.metrics_started = time.perf_counter()
+        g.sql_count = 0
+        g.sql_time = 0.0
+
+    def _finish_request(self, response):
+        started = g.get('metrics_started')
+        if started is None:
+            return response
+
+        elapsed = time.perf_counter() - started
+        endpoint = request.endpoint or 'unmatched'
+        self.observe_request(endpoint, request.method, response.status_code, elapsed,
+                             g.get('sql_count', 0), g.get('sql_time', 0.0))
+        return response
+
+    def observe_request(self, endpoint, method, status, elapsed, sql_count, sql_time):
+        """记录一个请求"""
+        increments = [
+            ('rideshare_http_requests_total', _labels(endpoint=endpoint, method=method, status=status), 1),
+            ('rideshare_http_request_duration_seconds_sum', _labels(endpoint=endpoint, method=method), elapsed),
+            ('rideshare_http_request_duration_seconds_count', _labels(endpoint=endpoint, method=method), 1),
+            ('rideshare_sql_statements_total', _labels(endpoint=endpoint), sql_count),
+            ('rideshare_sql_duration_seconds_total', _labels(endpoint=endpoint), sql_time),
+        ]
+        # 桶是累积的；耗时超过上限的桶也写入 0，保证序列存在
+        bucket_labels = dict(endpoint=endpoint, method=method)
+        for bound in LATENCY_BUCKETS:
+            increments.append(('rideshare_http_request_duration_seconds_bucket',
+                               _labels(le=repr(bound), **bucket_labels), int(elapsed <= bound)))
+        increments.append(('rideshare_http_request_duration_seconds_bucket',
+                           _labels(le='+Inf', **bucket_labels), 1))
+
+        with self._lock:
+            target = self._pending if self.path else self._values
+            for name, labels, value in increments:
+                key = (name, labels)
+                target[key] = target.get(key, 0) + value
+
+        if self.path and time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """把本进程的增量累加进共享文件"""
+        if not self.path:
+            return
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+        if not pending:
+            return
+
+        try:
+            self._connection().executemany(
+                'INSERT INTO metrics (name, labels, value) VALUES (?, ?, ?) '
+                'ON CONFLICT (name, labels) DO UPDATE SET value = value + excluded.value',
+                [(name, labels, value) for (name, labels), value in pending.items()]
+            )
+        except sqlite3.OperationalError:
+            # 文件暂时被锁，增量放回下次再写
+            with self._lock:
+                for key, value in pending.items():
+                    self._pending[key] = self._pending.get(key, 0) + value
+
+    def collect(self):
+        """返回所有指标的合计值 {(name, labels): value}"""
+        if not self.path:
+            with self._lock:
+                return dict(self._values)
+
+        self.flush()
+        rows = self._connection().execute('SELECT name, labels, value FROM metrics').fetchall()
+        return {(name, labels): value for name, labels, value in rows}
+
+    def render(self):
+        """输出 Prometheus 文本格式"""
+        lines = []
+        current_family = None
+        for (name, labels), value in sorted(self.collect().items(), key=_sort_key):
+            family = _family(name)
+            if family != current_family:
+                metric_type, help_text = METRIC_FAMILIES.get(family, ('untyped', ''))
+                lines.append(f'# HELP {family} {help_text}')
+                lines.append(f'# TYPE {family} {metric_type}')
+                current_family = family
+            value = int(value) if float(value).is_integer() else value
+            lines.append(f'{name}{{{labels}}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_started'].pop()
+    if has_request_context() and 'sql_count' in g:
+        g.sql_count += 1
+        g.sql_time += time.perf_counter() - started
+
+
+def _discard_cursor_timer(context):
+    started = context.connection.info.get('query_started') if context.connection is not None else None
+    if started:
+        started.pop()
+
+
+metrics = Metrics()
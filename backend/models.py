@@ -1,8 +1,12 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import DDL, event, select, update
+from sqlalchemy.orm import Session
+from geo import cell_id
+from hashing import hash_password, verify_password
+from storage import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 
 class User(db.Model):
@@ -20,10 +24,10 @@ class User(db.Model):
     completed_trips = db.Column(db.Integer, default=0)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
 
     def to_dict(self):
         return {
@@ -39,6 +43,17 @@ class User(db.Model):
 
 
 class Trip(db.Model):
+    __table_args__ = (
+        # 行程列表按 (status, departure_time, id) 游标分页，也服务只按时间窗口的搜索
+        db.Index('ix_trip_status_departure_id', 'status', 'departure_time', 'id'),
+        # 行程搜索：起点/终点等值过滤后按出发时间范围扫描
+        db.Index('ix_trip_search_start_end', 'status', 'start_point', 'end_point', 'departure_time', 'id'),
+        db.Index('ix_trip_search_start', 'status', 'start_point', 'departure_time', 'id'),
+        db.Index('ix_trip_search_end', 'status', 'end_point', 'departure_time', 'id'),
+        # 附近行程搜索按起点网格取行
+        db.Index('ix_trip_status_start_cell', 'status', 'start_cell'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     driver_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     start_point = db.Column(db.String(200), nullable=False)
@@ -48,6 +63,13 @@ class Trip(db.Model):
     price = db.Column(db.Float, nullable=False)
     status = db.Column(db.String(20), default='active')  # 'active', 'ongoing', 'completed', 'cancelled'
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    change_seq = db.Column(db.Integer, index=True)  # 最后一次写入的变更序号，见 sync.py
+    # 可选坐标，start_cell 为起点所在网格编号（见 geo.py），由写入事件维护
+    start_lat = db.Column(db.Float)
+    start_lng = db.Column(db.Float)
+    end_lat = db.Column(db.Float)
+    end_lng = db.Column(db.Float)
+    start_cell = db.Column(db.Integer)
 
     # 关联
     driver = db.relationship('User', backref='driver_trips')
@@ -62,6 +84,10 @@ class Trip(db.Model):
             'available_seats': self.available_seats,
             'price': self.price,
             'status': self.status,
+            'start_lat': self.start_lat,
+            'start_lng': self.start_lng,
+            'end_lat': self.end_lat,
+            'end_lng': self.end_lng,
             'driver': {
                 'name': self.driver.name,
                 'car_model': self.driver.car_model,
@@ -72,6 +98,12 @@ class Trip(db.Model):
 
 
 class RideRequest(db.Model):
+    __table_args__ = (
+        db.Index('ix_ride_request_status_start_cell', 'status', 'start_cell'),
+        # 单个行程的匹配按出发时间窗口读取拼车请求
+        db.Index('ix_ride_request_status_departure', 'status', 'departure_time'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     passenger_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     start_point = db.Column(db.String(200), nullable=False)
@@ -81,6 +113,13 @@ class RideRequest(db.Model):
     note = db.Column(db.Text)
     status = db.Column(db.String(20), default='active')  # 'active', 'matched', 'completed', 'cancelled'
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    change_seq = db.Column(db.Integer, index=True)  # 最后一次写入的变更序号，见 sync.py
+    # 可选坐标，start_cell 为起点所在网格编号（见 geo.py），由写入事件维护
+    start_lat = db.Column(db.Float)
+    start_lng = db.Column(db.Float)
+    end_lat = db.Column(db.Float)
+    end_lng = db.Column(db.Float)
+    start_cell = db.Column(db.Integer)
 
     # 关联
     passenger = db.relationship('User', backref='ride_requests')
@@ -95,11 +134,29 @@ class RideRequest(db.Model):
             'departure_time': self.departure_time.strftime('%Y-%m-%d %H:%M'),
             'seats': self.seats,
             'note': self.note,
-            'status': self.status
+            'status': self.status,
+            'start_lat': self.start_lat,
+            'start_lng': self.start_lng,
+            'end_lat': self.end_lat,
+            'end_lng': self.end_lng
         }
 
 
+@event.listens_for(Trip, 'before_insert')
+@event.listens_for(Trip, 'before_update')
+@event.listens_for(RideRequest, 'before_insert')
+@event.listens_for(RideRequest, 'before_update')
+def _update_start_cell(mapper, connection, target):
+    """根据起点坐标维护网格编号"""
+    target.start_cell = cell_id(target.start_lat, target.start_lng)
+
+
 class Booking(db.Model):
+    __table_args__ = (
+        # 每位乘客对同一行程只能预订一次
+        db.UniqueConstraint('trip_id', 'passenger_id', name='uq_booking_trip_passenger'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     trip_id = db.Column(db.Integer, db.ForeignKey('trip.id'), nullable=False)
     passenger_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -108,6 +165,7 @@ class Booking(db.Model):
     status = db.Column(db.String(20), default='confirmed')  # 'confirmed', 'completed', 'cancelled'
     paid = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    change_seq = db.Column(db.Integer, index=True)  # 最后一次写入的变更序号，见 sync.py
 
     # 关联
     trip = db.relationship('Trip', backref='bookings')
@@ -128,24 +186,167 @@ class Booking(db.Model):
 
 
 class Message(db.Model):
+    __table_args__ = (
+        # 收件箱/发件箱及会话列表按时间游标分页
+        db.Index('ix_message_receiver_created', 'receiver_id', 'created_at', 'id'),
+        db.Index('ix_message_sender_created', 'sender_id', 'created_at', 'id'),
+        # 单个会话中一个方向的消息
+        db.Index('ix_message_pair_created', 'sender_id', 'receiver_id', 'created_at', 'id'),
+        # 增量同步按发送方或接收方读取变更
+        db.Index('ix_message_sender_change', 'sender_id', 'change_seq'),
+        db.Index('ix_message_receiver_change', 'receiver_id', 'change_seq'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     sender_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     receiver_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     content = db.Column(db.Text, nullable=False)
     is_read = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    change_seq = db.Column(db.Integer, index=True)  # 最后一次写入的变更序号，见 sync.py
 
     # 关联
     sender = db.relationship('User', foreign_keys=[sender_id], backref='sent_messages')
     receiver = db.relationship('User', foreign_keys=[receiver_id], backref='received_messages')
 
-    def to_dict(self):
-        return {
+    def to_dict(self, include_sender=True):
+        data = {
             'id': self.id,
             'sender_id': self.sender_id,
             'receiver_id': self.receiver_id,
             'content': self.content,
             'is_read': self.is_read,
-            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M'),
-            'sender': self.sender.to_dict()
-        }
\ No newline at end of file
+            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M')
+        }
+        if include_sender:
+            data['sender'] = self.sender.to_dict()
+        return data
+
+
+class UnreadCounter(db.Model):
+    """用户未读消息总数，随发送和标记已读在同一事务中维护"""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    unread = db.Column(db.Integer, nullable=False, default=0)
+
+
+class ConversationUnread(db.Model):
+    """用户的一个会话：未读消息数和最后一条消息，收发双方各一行"""
+    __table_args__ = (
+        # 会话列表按最后一条消息倒序游标分页
+        db.Index('ix_conversation_unread_user_last', 'user_id', 'last_message_id'),
+    )
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    peer_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    unread = db.Column(db.Integer, nullable=False, default=0)
+    last_message_id = db.Column(db.Integer, db.ForeignKey('message.id'))
+
+
+class Statistic(db.Model):
+    """统计计数器，由 counters.py 中的写入事件维护"""
+    key = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+
+class ChangeSequence(db.Model):
+    """全局变更序号，单行表；每个写事务分配一个新序号"""
+    id = db.Column(db.Integer, primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+
+event.listen(
+    ChangeSequence.__table__,
+    'after_create',
+    DDL('INSERT INTO change_sequence (id, value) VALUES (1, 0)')
+)
+
+
+class SyncTombstone(db.Model):
+    """被删除行的墓碑记录，供增量同步告知能看到该行的客户端删除"""
+    id = db.Column(db.Integer, primary_key=True)
+    table_name = db.Column(db.String(50), nullable=False)
+    row_id = db.Column(db.Integer, nullable=False)
+    change_seq = db.Column(db.Integer, nullable=False, index=True)
+    # 被删除行的参与者，见 SYNC_PARTICIPANTS
+    owner_id = db.Column(db.Integer)
+    other_id = db.Column(db.Integer)
+
+
+class IdempotencyKey(db.Model):
+    """幂等键及其首次请求的响应，见 idempotency.py"""
+    user_id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(255), primary_key=True)
+    fingerprint = db.Column(db.String(64), nullable=False)  # 请求方法、路径和请求体的摘要
+    status_code = db.Column(db.Integer)  # None 表示首次请求仍在处理
+    mimetype = db.Column(db.String(100))
+    body = db.Column(db.LargeBinary)
+    created_at = db.Column(db.DateTime, nullable=False, index=True)
+
+
+# 参与同步的模型及其在响应中的名称
+SYNC_MODELS = {
+    Trip: 'trips',
+    Booking: 'bookings',
+    RideRequest: 'ride_requests',
+    Message: 'messages',
+}
+
+# 被删除行的 (owner_id, other_id)，与 /api/sync 对未删除行的过滤条件对应
+SYNC_PARTICIPANTS = {
+    Trip: lambda trip: (trip.driver_id, None),
+    Booking: lambda booking: (booking.passenger_id, booking.trip.driver_id),
+    RideRequest: lambda ride_request: (ride_request.passenger_id, None),
+    Message: lambda message: (message.sender_id, message.receiver_id),
+}
+
+
+def next_change_seq(session=None):
+    """
+    返回当前事务的变更序号，首次调用时分配
+
+    ORM 写入由 before_flush 自动记录；绕过 ORM 的批量 UPDATE 需要显式写入该序号。
+
+    所有写事务都更新 change_sequence 的同一行，行锁一直持有到提交。SQLite 的写事务
+    本来就由库级写锁串行，这一行不增加额外的等待，只多一条语句（支持 RETURNING 时
+    更新和读取合为一条）。换用支持行级并发写入的数据库后，它会把所有写事务串行化，
+    包括座位扣减；届时改用数据库序列并另行保证提交顺序（见 sync.py）。
+    """
+    session = session or db.session
+    seq = session.info.get('change_seq')
+    if seq is None:
+        stmt = update(ChangeSequence).where(ChangeSequence.id == 1).values(value=ChangeSequence.value + 1)
+        if session.get_bind().dialect.update_returning:
+            seq = session.execute(stmt.returning(ChangeSequence.value)).scalar_one()
+        else:
+            session.execute(stmt)
+            seq = session.execute(select(ChangeSequence.value).where(ChangeSequence.id == 1)).scalar_one()
+        session.info['change_seq'] = seq
+    return seq
+
+
+@event.listens_for(Session, 'before_flush')
+def _stamp_changes(session, flush_context, instances):
+    """给新增和修改的行记上变更序号，给删除的行写墓碑"""
+    changed = [
+        obj for obj in session.new if type(obj) in SYNC_MODELS
+    ] + [
+        obj for obj in session.dirty if type(obj) in SYNC_MODELS and session.is_modified(obj)
+    ]
+    deleted = [obj for obj in session.deleted if type(obj) in SYNC_MODELS]
+    if not changed and not deleted:
+        return
+
+    seq = next_change_seq(session)
+    for obj in changed:
+        obj.change_seq = seq
+    with session.no_autoflush:
+        for obj in deleted:
+            owner_id, other_id = SYNC_PARTICIPANTS[type(obj)](obj)
+            session.add(SyncTombstone(table_name=SYNC_MODELS[type(obj)], row_id=obj.id, change_seq=seq,
+                                      owner_id=owner_id, other_id=other_id))
+
+
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_rollback')
+def _reset_change_seq(session):
+    session.info.pop('change_seq', None)
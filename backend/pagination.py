@@ -0,0 +1,83 @@
+"""
+键集（游标）分页
+
+所有游标分页的列表接口遵循同一约定：响应体是数组，下一页游标由 set_next_cursor 放在
+X-Next-Cursor 响应头中，同时给出 Link: <下一页地址>; rel="next"；没有下一页时不带这两个头。
+客户端把游标原样作为 after（按出发时间正序的行程列表）或 before（按时间倒序的消息和会话）
+参数传回。
+"""
+
+import base64
+import json
+from datetime import datetime
+from urllib.parse import urlencode
+
+from flask import current_app, request
+from sqlalchemy import tuple_
+
+
+class CursorError(ValueError):
+    """游标格式无效"""
+
+
+def encode_cursor(*values):
+    """把排序键编码为不透明游标"""
+    payload = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, *types):
+    """把游标解码为排序键，types 指定每个位置的类型"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        if not isinstance(payload, list) or len(payload) != len(types):
+            raise CursorError(cursor)
+        return tuple(
+            datetime.fromisoformat(v) if t is datetime else t(v)
+            for v, t in zip(payload, types)
+        )
+    except (ValueError, TypeError):
+        raise CursorError(cursor)
+
+
+def set_next_cursor(response, next_cursor, param='after'):
+    """设置 X-Next-Cursor 和 Link 头，下一页地址是相对地址，其余查询参数不变"""
+    if next_cursor is not None:
+        args = request.args.copy()
+        args[param] = next_cursor
+        response.headers['X-Next-Cursor'] = next_cursor
+        response.headers['Link'] = f'<{request.path}?{urlencode(list(args.items(multi=True)))}>; rel="next"'
+    return response
+
+
+def get_page_limit():
+    """读取 limit 参数，限制在 [1, MAX_PER_PAGE] 之间"""
+    default = current_app.config['POSTS_PER_PAGE']
+    maximum = current_app.config['MAX_PER_PAGE']
+    limit = request.args.get('limit', default, type=int)
+    return max(1, min(limit or default, maximum))
+
+
+def keyset_page(query, columns, limit, after=None, descending=False):
+    """
+    按 columns 做键集分页，返回 (rows, next_cursor)
+
+    after 为上一页最后一行的排序键；多取一行用于判断是否还有下一页，
+    这样每页都是索引上的一次有界范围扫描。
+    """
+    key = tuple_(*columns)
+    if after is not None:
+        query = query.filter(key < after if descending else key > after)
+
+    order = [c.desc() for c in columns] if descending else list(columns)
+    rows = query.order_by(*order).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(*(getattr(last, c.key) for c in columns))
+
+    return rows, next_cursor
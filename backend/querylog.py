@@ -0,0 +1,167 @@
+"""
+SQL 诊断：慢查询日志和 N+1 检测
+
+- 慢查询：耗时超过 SLOW_QUERY_THRESHOLD_MS 的语句记一条警告，包含语句指纹
+  （字面量和 IN 列表归一化）、参数类型、耗时和所在端点；
+- N+1：同一请求中同一指纹的语句执行超过 N_PLUS_ONE_THRESHOLD 次时，请求结束后记一条
+  警告。若这些语句来自关系的懒加载，同时给出关系名和触发懒加载的代码位置，
+  例如 Trip.driver，由 Trip.to_dict 触发。
+"""
+
+import logging
+import os
+import re
+import sys
+import time
+from contextlib import contextmanager
+
+from flask import current_app, g, has_app_context, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+_BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_WHITESPACE = re.compile(r'\s+')
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+
+
+def fingerprint(statement):
+    """归一化语句：合并空白，字面量替换为 ?，IN 列表折叠为 (...)"""
+    statement = _WHITESPACE.sub(' ', statement.strip())
+    statement = _STRING.sub('?', statement)
+    statement = _NUMBER.sub('?', statement)
+    return _PLACEHOLDER_LIST.sub('(...)', statement)
+
+
+def _type_names(values):
+    """类型名列表，连续相同的类型合并为 int×3"""
+    names = []
+    for value in values:
+        name = type(value).__name__
+        if names and names[-1][0] == name:
+            names[-1][1] += 1
+        else:
+            names.append([name, 1])
+    return ', '.join(name if count == 1 else f'{name}×{count}' for name, count in names)
+
+
+def param_shape(parameters, executemany=False):
+    """参数的类型结构，不包含参数值"""
+    if executemany and parameters and isinstance(parameters[0], (list, tuple, dict)):
+        return f'{len(parameters)}×{param_shape(parameters[0])}'
+    if isinstance(parameters, dict):
+        return '{' + ', '.join(f'{key}: {type(value).__name__}' for key, value in parameters.items()) + '}'
+    return f'({_type_names(parameters or ())})'
+
+
+def _caller():
+    """触发当前语句的第一个业务代码位置，如 Trip.to_dict (models.py:78)"""
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(_BACKEND_DIR) and filename != __file__:
+            owner = frame.f_locals.get('self')
+            name = frame.f_code.co_name
+            if owner is not None:
+                name = f'{type(owner).__name__}.{name}'
+            return f'{name} ({os.path.basename(filename)}:{frame.f_lineno})'
+        frame = frame.f_back
+    return None
+
+
+def _endpoint():
+    return (request.endpoint or 'unmatched') if has_request_context() else '-'
+
+
+def _logger():
+    return current_app.logger if has_app_context() else logger
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _remember_relationship_load(orm_execute_state):
+    """记下即将执行的懒加载属于哪个关系，供 N+1 检测使用"""
+    if orm_execute_state.is_relationship_load and has_request_context() and 'query_counts' in g:
+        prop = orm_execute_state.loader_strategy_path[-1]
+        g.pending_relationship = f'{prop.parent.class_.__name__}.{prop.key}'
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('querylog_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed_ms = (time.perf_counter() - conn.info['querylog_started'].pop()) * 1000
+    config = current_app.config if has_app_context() else {}
+
+    threshold = config.get('SLOW_QUERY_THRESHOLD_MS')
+    if threshold is not None and elapsed_ms >= threshold:
+        _logger().warning('慢查询 %.1fms [%s] %s 参数=%s', elapsed_ms, _endpoint(),
+                          fingerprint(statement), param_shape(parameters, executemany))
+
+    if has_request_context() and 'query_counts' in g:
+        relationship = g.pop('pending_relationship', None)
+        key = fingerprint(statement)
+        count = g.query_counts.get(key, 0) + 1
+        g.query_counts[key] = count
+        if relationship is not None and key not in g.query_sources and \
+                count >= config['N_PLUS_ONE_THRESHOLD']:
+            g.query_sources[key] = (relationship, _caller())
+
+
+def _discard_cursor_timer(context):
+    started = context.connection.info.get('querylog_started') if context.connection is not None else None
+    if started:
+        started.pop()
+
+
+def _start_request():
+    g.query_counts = {}
+    g.query_sources = {}
+
+
+def _report_repeated_queries(response):
+    threshold = current_app.config.get('N_PLUS_ONE_THRESHOLD')
+    for key, count in g.get('query_counts', {}).items():
+        if count <= threshold:
+            continue
+        relationship, caller = g.query_sources.get(key, (None, None))
+        if relationship is not None:
+            _logger().warning('疑似 N+1 [%s] %s 执行 %d 次：懒加载 %s，由 %s 触发',
+                              _endpoint(), key, count, relationship, caller or '未知位置')
+        else:
+            _logger().warning('疑似 N+1 [%s] %s 执行 %d 次', _endpoint(), key, count)
+    return response
+
+
+@contextmanager
+def slow_queries_unlogged():
+    """在当前应用内暂停慢查询日志，用于批量导入等预期会很慢的维护操作"""
+    config = current_app.config
+    threshold = config.get('SLOW_QUERY_THRESHOLD_MS')
+    config['SLOW_QUERY_THRESHOLD_MS'] = None
+    try:
+        yield
+    finally:
+        config['SLOW_QUERY_THRESHOLD_MS'] = threshold
+
+
+def init_app(app):
+    """在 db.init_app 之后调用"""
+    slow_queries = app.config.get('SLOW_QUERY_THRESHOLD_MS') is not None
+    n_plus_one = app.config.get('N_PLUS_ONE_THRESHOLD') is not None
+    if not slow_queries and not n_plus_one:
+        return
+
+    with app.app_context():
+        for engine in app.extensions['sqlalchemy'].engines.values():
+            event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+            event.listen(engine, 'handle_error', _discard_cursor_timer)
+
+    if n_plus_one:
+        app.before_request(_start_request)
+        app.after_request(_report_repeated_queries)
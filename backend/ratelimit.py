@@ -0,0 +1,233 @@
+"""
+限流和过载保护
+
+- 令牌桶限流：RATELIMITS 按端点名（如 'auth.login'）或蓝图名（如 'trips'）配置
+  (每秒补充的令牌数, 桶容量)，未配置的接口使用 RATELIMIT_DEFAULT，None 表示不限制。
+  带有效令牌的请求按用户计数，否则按 IP；超出时返回 429 和 Retry-After。部署在反向代理
+  之后时需设置 PROXY_FIX_X_FOR，否则所有匿名请求的 IP 都是代理的地址，共用一个桶。
+  桶存放在进程内（RATELIMIT_STORAGE='memory'，仅限单进程），或存放在
+  RATELIMIT_STORAGE_PATH 指定的 SQLite 文件中，由多个工作进程共享（'sqlite'）。
+- 准入控制：本进程正在处理的请求数达到 SHED_MAX_IN_FLIGHT，或请求在反向代理后排队的
+  时间（X-Request-Start 头）超过 SHED_MAX_QUEUE_MS 时直接返回 503 和 Retry-After，
+  过载时尽快拒绝多出的请求，而不是让所有请求一起变慢。
+  gthread 工作进程同时最多处理 --threads 个请求，多出的连接在 gunicorn 中排队，
+  不会进入应用，所以 SHED_MAX_IN_FLIGHT 必须小于线程数才会生效（生产配置为线程数减一，
+  最后一个线程用来快速拒绝）。SSE 长连接通过 hold() 在整个连接期间计入处理中的请求数。
+
+RATELIMIT_EXEMPT 中的端点（健康检查、指标）和 CORS 预检请求不受限制。
+"""
+
+import math
+import os
+import sqlite3
+import threading
+import time
+
+import jwt
+from flask import current_app, g, jsonify, request
+
+
+class MemoryBucketStore:
+    """进程内的令牌桶，仅限单进程部署"""
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self._buckets = {}  # 键 -> (令牌数, 更新时间, 补满时间)
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, capacity, now):
+        """取一个令牌，成功返回 0，否则返回需要等待的秒数"""
+        with self._lock:
+            tokens, updated, _ = self._buckets.get(key, (capacity, now, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / rate
+
+            if key not in self._buckets and len(self._buckets) >= self.max_entries:
+                # 已补满的桶与不存在等价，可以直接丢弃
+                for full in [k for k, (_, _, full_at) in self._buckets.items() if full_at <= now]:
+                    del self._buckets[full]
+            self._buckets[key] = (tokens, now, now + (capacity - tokens) / rate)
+            return wait
+
+
+class SQLiteBucketStore:
+    """
+    基于 SQLite 文件的令牌桶，供多个 gunicorn 工作进程共享
+
+    取令牌是一条带条件的 UPSERT，令牌不足时不修改任何行；已补满的行定期删除。
+    """
+
+    PURGE_INTERVAL = 60  # 秒
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._last_purge = 0.0
+        self._connection().execute(
+            'CREATE TABLE IF NOT EXISTS buckets ('
+            'key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, full_at REAL NOT NULL)'
+        )
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def take(self, key, rate, capacity, now):
+        """取一个令牌，成功返回 0，否则返回需要等待的秒数"""
+        params = {'key': key, 'rate': rate, 'capacity': capacity, 'now': now}
+        connection = self._connection()
+        try:
+            if now - self._last_purge >= self.PURGE_INTERVAL:
+                self._last_purge = now
+                connection.execute('DELETE FROM buckets WHERE full_at <= ?', (now,))
+
+            # SET 中的 tokens、updated 都是更新前的值
+            cursor = connection.execute(
+                'INSERT INTO buckets (key, tokens, updated, full_at) '
+                'VALUES (:key, :capacity - 1, :now, :now + 1.0 / :rate) '
+                'ON CONFLICT (key) DO UPDATE SET '
+                'tokens = min(:capacity, tokens + (:now - updated) * :rate) - 1, '
+                'updated = :now, '
+                'full_at = :now + (:capacity - min(:capacity, tokens + (:now - updated) * :rate) + 1) / :rate '
+                'WHERE min(:capacity, tokens + (:now - updated) * :rate) >= 1',
+                params
+            )
+            if cursor.rowcount == 1:
+                return 0.0
+
+            row = connection.execute(
+                'SELECT min(:capacity, tokens + (:now - updated) * :rate) FROM buckets WHERE key = :key',
+                params
+            ).fetchone()
+        except sqlite3.OperationalError:
+            # 文件暂时被锁时放行，限流不能成为新的故障点
+            return 0.0
+        return (1 - row[0]) / rate if row else 0.0
+
+
+def _queue_seconds():
+    """请求在反向代理后排队的时间，支持 t=秒/毫秒/微秒 格式的 X-Request-Start"""
+    header = request.headers.get('X-Request-Start')
+    if not header:
+        return None
+    try:
+        started = float(header[2:] if header.startswith('t=') else header)
+    except ValueError:
+        return None
+    if started > 1e14:
+        started /= 1e6
+    elif started > 1e11:
+        started /= 1e3
+    return max(0.0, time.time() - started)
+
+
+def _client_key():
+    """带有效令牌时按用户，否则按 IP"""
+    token = request.headers.get('Authorization') or request.args.get('token')
+    if token:
+        if token.startswith('Bearer '):
+            token = token[7:]
+        try:
+            data = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
+            return f"user:{data['user_id']}"
+        except (jwt.InvalidTokenError, KeyError):
+            pass
+    return f'ip:{request.remote_addr}'
+
+
+def _limit_for(endpoint, config):
+    """返回 (桶的作用域, (每秒令牌数, 桶容量))，先按端点、再按蓝图查找"""
+    limits = config.get('RATELIMITS') or {}
+    if endpoint in limits:
+        return endpoint, limits[endpoint]
+    blueprint = endpoint.rpartition('.')[0]
+    if blueprint and blueprint in limits:
+        return blueprint, limits[blueprint]
+    return 'default', config.get('RATELIMIT_DEFAULT')
+
+
+def _reject(status, message, retry_after):
+    response = jsonify({'error': message})
+    response.status_code = status
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+class RateLimiter:
+    """令牌桶限流和按进程的准入控制"""
+
+    def __init__(self):
+        self.store = MemoryBucketStore()
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """在 metrics.init_app 之后调用，被拒绝的请求也计入指标"""
+        if app.config.get('RATELIMIT_STORAGE', 'memory') == 'sqlite':
+            self.store = SQLiteBucketStore(app.config['RATELIMIT_STORAGE_PATH'])
+        else:
+            self.store = MemoryBucketStore()
+        with self._lock:
+            self._in_flight = 0
+
+        app.before_request(self._admit)
+        app.teardown_request(self._release)
+
+    def _admit(self):
+        config = current_app.config
+        endpoint = request.endpoint
+        if endpoint is None or endpoint in config.get('RATELIMIT_EXEMPT', ()) or request.method == 'OPTIONS':
+            return None
+
+        retry_after = config.get('SHED_RETRY_AFTER', 1)
+        max_queue_ms = config.get('SHED_MAX_QUEUE_MS')
+        if max_queue_ms is not None:
+            queued = _queue_seconds()
+            if queued is not None and queued * 1000 > max_queue_ms:
+                return _reject(503, '服务繁忙，请稍后重试', retry_after)
+
+        max_in_flight = config.get('SHED_MAX_IN_FLIGHT')
+        with self._lock:
+            if max_in_flight is not None and self._in_flight >= max_in_flight:
+                return _reject(503, '服务繁忙，请稍后重试', retry_after)
+            self._in_flight += 1
+        g.admitted = True
+
+        scope, limit = _limit_for(endpoint, config)
+        if limit is None:
+            return None
+        rate, capacity = limit
+        wait = self.store.take(f'{scope}:{_client_key()}', rate, capacity, time.time())
+        if wait > 0:
+            return _reject(429, '请求过于频繁，请稍后重试', wait)
+        return None
+
+    def hold(self):
+        """
+        长连接在响应结束前一直占用线程：本请求的名额不在请求结束时释放，
+        改为在调用返回的函数时释放（通常交给 Response.call_on_close）
+        """
+        if g.pop('admitted', False):
+            return self._leave
+        return lambda: None
+
+    def _leave(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    def _release(self, exc):
+        if g.pop('admitted', False):
+            self._leave()
+
+
+limiter = RateLimiter()
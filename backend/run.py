@@ -57,15 +57,15 @@ def check_database():
             return False
 
 
-def init_database():
-    """初始化数据库"""
+def init_database(synthetic=None):
+    """初始化数据库；synthetic 为合成数据参数，见 init_db.generate_synthetic_data"""
     print("🚀 初始化数据库...")
 
     try:
         from init_db import init_all_data
         app = create_app()
         with app.app_context():
-            init_all_data()
+            init_all_data(synthetic)
         print("✅ 数据库初始化完成")
         return True
     except Exception as e:
@@ -99,11 +99,11 @@ def run_development_server(host='0.0.0.0', port=5000, debug=True):
         print(f"❌ 服务器启动失败: {e}")
 
 
-def run_production_server(host='0.0.0.0', port=5000, workers=4):
+def run_production_server(host='0.0.0.0', port=5000, workers=4, threads=8):
     """使用Gunicorn运行生产服务器"""
     print(f"🏭 启动生产服务器...")
     print(f"📍 地址: http://{host}:{port}")
-    print(f"👷 工作进程: {workers}")
+    print(f"👷 工作进程: {workers} × {threads} 线程")
 
     # 检查是否安装了gunicorn
     try:
@@ -112,13 +112,17 @@ def run_production_server(host='0.0.0.0', port=5000, workers=4):
         print("❌ 未安装gunicorn，正在安装...")
         subprocess.run([sys.executable, '-m', 'pip', 'install', 'gunicorn'])
 
-    # 设置生产环境
+    # 设置生产环境，SSE 连接数等上限按线程数计算
     os.environ['FLASK_CONFIG'] = 'production'
+    os.environ['WORKER_THREADS'] = str(threads)
 
     # 启动gunicorn
     cmd = [
         'gunicorn',
         '-w', str(workers),
+        # SSE 长连接会占住线程，使用多线程工作进程，连接数由 SSE_MAX_STREAMS 限制
+        '-k', 'gthread',
+        '--threads', str(threads),
         '-b', f'{host}:{port}',
         '--access-logfile', '-',
         '--error-logfile', '-',
@@ -153,6 +157,350 @@ def run_tests():
         runner.run(suite)
 
 
+def benchmark_login(total=200, concurrency=8, workers=None):
+    """对比请求线程内哈希与进程池哈希的登录吞吐量及其他接口延迟"""
+    import tempfile
+    import threading
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    import hashing
+    from models import User
+
+    if workers is None:
+        workers = max(2, (os.cpu_count() or 2) // 2)
+
+    print(f"⏱️  登录基准测试: {total} 次登录, 并发 {concurrency}")
+
+    for pool_workers in (0, workers):
+        with tempfile.TemporaryDirectory() as tmp:
+            app = create_app(
+                'testing',
+                SQLALCHEMY_DATABASE_URI=f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+                PASSWORD_HASH_WORKERS=pool_workers
+            )
+
+            with app.app_context():
+                db.create_all()
+                user = User(name='bench', phone='bench', user_type='passenger')
+                user.set_password('bench-password')
+                db.session.add(user)
+                db.session.commit()
+
+            def login(_):
+                client = app.test_client()
+                response = client.post('/api/login', json={'phone': 'bench', 'password': 'bench-password'})
+                assert response.status_code == 200
+
+            # 登录高峰期间持续探测一个非认证接口的延迟
+            health_latencies = []
+            stop = threading.Event()
+
+            def probe():
+                client = app.test_client()
+                while not stop.is_set():
+                    started = time.perf_counter()
+                    client.get('/api/health')
+                    health_latencies.append(time.perf_counter() - started)
+                    time.sleep(0.005)
+
+            login(None)  # 预热进程池
+
+            prober = threading.Thread(target=probe)
+            prober.start()
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                list(executor.map(login, range(total)))
+            elapsed = time.perf_counter() - started
+            stop.set()
+            prober.join()
+
+            with app.app_context():
+                hashing.shutdown()
+                db.engine.dispose()
+
+            health_latencies.sort()
+            p50 = health_latencies[len(health_latencies) // 2] * 1000
+            p95 = health_latencies[int(len(health_latencies) * 0.95)] * 1000
+            mode = f'进程池({pool_workers})' if pool_workers else '请求线程内'
+            print(f"  {mode:12} 登录 {total / elapsed:8.1f} 次/秒   /api/health p50 {p50:.2f}ms p95 {p95:.2f}ms")
+
+
+def benchmark_storage(duration=5, readers=4, writers=2):
+    """对比默认连接参数与生产 PRAGMA（WAL 等）下的并发读写吞吐量"""
+    import tempfile
+    import threading
+    import time
+    from datetime import datetime, timedelta
+    from sqlalchemy.exc import OperationalError
+
+    from config import SQLITE_PRODUCTION_PRAGMAS
+    from models import User, Trip, Message
+
+    print(f"⏱️  存储基准测试: {readers} 个读线程, {writers} 个写线程, 每组 {duration}s")
+
+    for label, pragmas in (('默认', {}), ('生产 PRAGMA', SQLITE_PRODUCTION_PRAGMAS)):
+        with tempfile.TemporaryDirectory() as tmp:
+            app = create_app(
+                'testing',
+                SQLALCHEMY_DATABASE_URI=f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+                SQLITE_PRAGMAS=pragmas
+            )
+
+            with app.app_context():
+                db.create_all()
+                driver = User(name='driver', phone='bench-driver', user_type='driver', password_hash='-')
+                passenger = User(name='passenger', phone='bench-passenger', user_type='passenger',
+                                 password_hash='-')
+                db.session.add_all([driver, passenger])
+                db.session.flush()
+                departure = datetime.utcnow() + timedelta(days=1)
+                db.session.add_all([
+                    Trip(driver_id=driver.id, start_point=f'起点{i % 20}', end_point=f'终点{i % 30}',
+                         departure_time=departure + timedelta(minutes=i), available_seats=3, price=20)
+                    for i in range(2000)
+                ])
+                db.session.commit()
+                sender_id, receiver_id = passenger.id, driver.id
+
+            counts = {'read': 0, 'write': 0, 'error': 0}
+            lock = threading.Lock()
+            deadline = time.perf_counter() + duration
+
+            def read():
+                with app.app_context():
+                    while time.perf_counter() < deadline:
+                        try:
+                            Trip.query.filter_by(status='active').order_by(
+                                Trip.departure_time, Trip.id).limit(20).all()
+                            db.session.rollback()
+                            kind = 'read'
+                        except OperationalError:
+                            db.session.rollback()
+                            kind = 'error'
+                        with lock:
+                            counts[kind] += 1
+
+            def write():
+                with app.app_context():
+                    while time.perf_counter() < deadline:
+                        try:
+                            db.session.add(Message(sender_id=sender_id, receiver_id=receiver_id,
+                                                   content='bench'))
+                            db.session.commit()
+                            kind = 'write'
+                        except OperationalError:
+                            db.session.rollback()
+                            kind = 'error'
+                        with lock:
+                            counts[kind] += 1
+
+            threads = [threading.Thread(target=read) for _ in range(readers)] + \
+                [threading.Thread(target=write) for _ in range(writers)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            with app.app_context():
+                db.engine.dispose()
+
+            print(f"  {label:10} 读 {counts['read'] / duration:8.1f} 次/秒   "
+                  f"写 {counts['write'] / duration:8.1f} 次/秒   锁冲突 {counts['error']}")
+
+
+def benchmark_json(trips=10000, repeat=5):
+    """对比 to_dict + 标准库 JSON、to_dict + JSONProvider 与预编译序列化器序列化行程列表的耗时"""
+    import statistics
+    import time
+    from flask.json.provider import DefaultJSONProvider
+    from sqlalchemy.orm import joinedload
+
+    from init_db import generate_synthetic_data
+    from models import Trip
+    from serializers import orjson, trip_serializer
+
+    app = create_app('testing', SQLALCHEMY_DATABASE_URI='sqlite://')
+    default_json = DefaultJSONProvider(app)
+
+    with app.app_context():
+        db.create_all()
+        generate_synthetic_data(users=max(trips // 20, 10), trips=trips, bookings=0, messages=0,
+                                ride_requests=0)
+
+        def orm_rows():
+            db.session.expunge_all()
+            return Trip.query.options(joinedload(Trip.driver)).order_by(Trip.id).all()
+
+        cases = (
+            ('to_dict + 标准库', lambda: default_json.dumps([t.to_dict() for t in orm_rows()])),
+            ('to_dict + JSONProvider', lambda: app.json.dumps([t.to_dict() for t in orm_rows()])),
+            ('预编译序列化器', lambda: app.json.dumps(
+                trip_serializer.dump(trip_serializer.query().order_by(Trip.id).all()))),
+        )
+
+        print(f"⏱️  JSON 序列化基准测试: {trips} 个行程（含查询）, 每项 {repeat} 次取中位数, "
+              f"orjson {'已启用' if orjson else '未安装'}")
+        baseline = None
+        for label, serialize in cases:
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                body = serialize()
+                timings.append(time.perf_counter() - started)
+            median = statistics.median(timings)
+            baseline = baseline or median
+            print(f"  {label:24} {median * 1000:8.1f}ms   {baseline / median:5.2f}x   {len(body.encode('utf-8'))} 字节")
+
+
+def benchmark_compression(repeat=20, bandwidth_kbps=(400, 1600, 10000)):
+    """在代表性的列表响应上对比不压缩、gzip 与 brotli 的字节数、服务端耗时和估算的传输耗时"""
+    import statistics
+    import time
+    from datetime import datetime, timedelta
+
+    import jwt
+    from sqlalchemy import func
+
+    import compression
+    from init_db import generate_synthetic_data
+    from models import Booking, Message, User
+
+    app = create_app('testing', SQLALCHEMY_DATABASE_URI='sqlite://')
+    with app.app_context():
+        db.create_all()
+        generate_synthetic_data(users=1000, trips=5000, bookings=20000, messages=20000, ride_requests=2000)
+
+        def busiest(column):
+            return db.session.query(column).group_by(column).order_by(func.count().desc()).limit(1).scalar()
+
+        def token(user_id):
+            return jwt.encode({'user_id': user_id, 'exp': datetime.utcnow() + timedelta(hours=1)},
+                              app.config['SECRET_KEY'], algorithm='HS256')
+
+        driver_id = db.session.query(User.id).filter_by(user_type='driver').order_by(User.id).limit(1).scalar()
+        passenger_id = busiest(Booking.passenger_id)
+        receiver_id = busiest(Message.receiver_id)
+
+    limit = app.config['MAX_PER_PAGE']
+    cases = (
+        ('get_trips', f'/api/trips?limit={limit}', None),
+        ('get_ride_requests', '/api/ride-requests', driver_id),
+        ('get_messages', f'/api/messages?limit={limit}', receiver_id),
+        ('get_my_trips', '/api/my-trips', passenger_id),
+    )
+    encodings = ('identity',) + compression.ENCODINGS
+    client = app.test_client()
+
+    print(f"⏱️  响应压缩基准测试: 每项 {repeat} 次取中位数, gzip 级别 {app.config['COMPRESS_LEVEL']}, "
+          f"brotli {'质量 ' + str(app.config['COMPRESS_BROTLI_QUALITY']) if compression.brotli else '未安装'}")
+    header = ''.join(f"{f'{kbps}kbps':>11}" for kbps in bandwidth_kbps)
+    print(f"  {'接口':18} {'编码':9} {'字节':>9} {'压缩率':>7} {'服务端':>9}{header}")
+    for name, path, user_id in cases:
+        headers = {'Authorization': f'Bearer {token(user_id)}'} if user_id else {}
+        for encoding in encodings:
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                response = client.get(path, headers=dict(headers, **{'Accept-Encoding': encoding}))
+                timings.append(time.perf_counter() - started)
+            size = len(response.get_data())
+            if encoding == 'identity':
+                raw_size = size
+            server = statistics.median(timings)
+            # 估算的客户端耗时 = 服务端耗时 + 传输耗时
+            transfer = ''.join(f'{(server + size * 8 / (kbps * 1000)) * 1000:9.1f}ms' for kbps in bandwidth_kbps)
+            print(f"  {name:18} {response.headers.get('Content-Encoding', 'identity'):9} {size:9d} "
+                  f"{raw_size / size:6.1f}x {server * 1000:7.2f}ms{transfer}")
+
+
+def run_bench(users=16, duration=20, drivers=50, passengers=200, trips=2000, seed=0, url=None, output=None):
+    """场景压测：准备数据后用虚拟用户并发执行浏览、登录、预订、取消、消息、完成行程等操作"""
+    import json
+    import tempfile
+    import hashing
+    import loadtest
+    from config import SQLITE_PRODUCTION_PRAGMAS
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if url:
+            # 压测已启动的服务：数据写入该服务使用的数据库
+            app = create_app()
+            make_client = lambda: loadtest.HttpClient(url)
+        else:
+            # 密码哈希使用进程池，与部署时一致
+            app = create_app(
+                'development',
+                SQLALCHEMY_DATABASE_URI=f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+                SQLALCHEMY_ECHO=False,
+                SQLITE_PRAGMAS=SQLITE_PRODUCTION_PRAGMAS,
+                SLOW_QUERY_THRESHOLD_MS=None
+            )
+            make_client = lambda: loadtest.InProcessClient(app)
+
+        print(f"🌱 准备数据: {drivers} 个司机, {passengers} 个乘客, {trips} 个行程")
+        with app.app_context():
+            db.create_all()
+            driver_phones, passenger_phones = loadtest.seed(
+                drivers=drivers, passengers=passengers, trips=trips, random_seed=seed)
+
+        print(f"⏱️  压测: {users} 个虚拟用户, {duration}s, 目标 {url or '进程内'}")
+        report = loadtest.run(make_client, driver_phones, passenger_phones,
+                              users=users, duration=duration, random_seed=seed)
+
+        with app.app_context():
+            hashing.shutdown()
+            db.engine.dispose()
+
+    print(f"  总计 {report['total_requests']} 个请求, {report['requests_per_second']} 次/秒")
+    print(f"  {'操作':16} {'次数':>7} {'错误':>5} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for name, stats in report['operations'].items():
+        print(f"  {name:16} {stats['count']:7d} {stats['server_errors']:5d} "
+              f"{stats['p50_ms']:7.2f}ms {stats['p95_ms']:7.2f}ms {stats['p99_ms']:7.2f}ms")
+    print(f"  {'端点':28} {'请求':>7} {'SQL/请求':>9} {'DB ms/请求':>11}")
+    for endpoint, stats in report['endpoints'].items():
+        print(f"  {endpoint:28} {stats['requests']:7d} {stats['sql_per_request']:9.2f} "
+              f"{stats['db_ms_per_request']:11.3f}")
+
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"  💾 报告已写入 {output}")
+
+
+def run_matching(top_k=None, window=None, output=None):
+    """批量匹配所有活跃的拼车请求和行程"""
+    import json
+    import time
+    from matching import load_requests, load_trips, match
+
+    app = create_app()
+
+    with app.app_context():
+        top_k = top_k or app.config['MATCH_TOP_K']
+        window = window or app.config['MATCH_TIME_WINDOW_MINUTES']
+
+        started = time.perf_counter()
+        request_rows = load_requests()
+        trip_rows = load_trips()
+        loaded = time.perf_counter()
+        by_request, by_trip = match(request_rows, trip_rows, top_k=top_k, window_minutes=window)
+        finished = time.perf_counter()
+
+    print(f"🔗 匹配完成: {len(request_rows)} 个请求 × {len(trip_rows)} 个行程")
+    print(f"  ⏱️  读取 {loaded - started:.2f}s, 匹配 {finished - loaded:.2f}s")
+    print(f"  📝 有匹配的请求: {len(by_request)}")
+    print(f"  🚗 有匹配的行程: {len(by_trip)}")
+
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'by_request': {rid: [m.to_dict() for m in ms] for rid, ms in by_request.items()},
+                'by_trip': {tid: [m.to_dict() for m in ms] for tid, ms in by_trip.items()}
+            }, f, ensure_ascii=False, indent=2)
+        print(f"  💾 结果已写入 {output}")
+
+
 def show_routes():
     """显示所有路由"""
     print("🗺️  应用路由:")
@@ -210,15 +558,81 @@ def show_status():
     if check_database():
         app = create_app()
         with app.app_context():
-            from models import User, Trip, RideRequest, Booking
-            print(f"  👥 用户数: {User.query.count()}")
-            print(f"  🚗 行程数: {Trip.query.count()}")
-            print(f"  📝 请求数: {RideRequest.query.count()}")
-            print(f"  🎫 预订数: {Booking.query.count()}")
+            from counters import get_stats
+            stats = get_stats()
+
+        def breakdown(table):
+            prefix = f'{table}:'
+            parts = [f'{key[len(prefix):]} {value}' for key, value in sorted(stats.items())
+                     if key.startswith(prefix)]
+            return f" ({', '.join(parts)})" if parts else ''
+
+        print(f"  👥 用户数: {stats.get('user', 0)}{breakdown('user')}")
+        print(f"  🚗 行程数: {stats.get('trip', 0)}{breakdown('trip')}")
+        print(f"  📝 请求数: {stats.get('ride_request', 0)}{breakdown('ride_request')}")
+        print(f"  🎫 预订数: {stats.get('booking', 0)}{breakdown('booking')}")
+
+
+def reconcile_stats(interval=0):
+    """按业务表校正统计计数器；interval > 0 时按该间隔（秒）周期运行"""
+    import time
+    from counters import reconcile_stats as reconcile
+
+    app = create_app()
+
+    while True:
+        with app.app_context():
+            drift = reconcile()
+
+        if drift:
+            print(f"🔧 统计计数器已校正: {drift}")
+        else:
+            print("✅ 统计计数器无偏差")
+
+        if interval <= 0:
+            break
+        time.sleep(interval)
+
+
+def sync_replicas(interval=0):
+    """
+    把 SQLite 主库整库复制到 SQLALCHEMY_REPLICA_URIS 中的副本文件，用于本地测试读副本路由；
+    interval > 0 时按该间隔（秒）周期复制，间隔即模拟的副本延迟
+    """
+    import sqlite3
+    import time
+    from sqlalchemy.engine import make_url
+
+    config = get_config()
+    primary = make_url(config.SQLALCHEMY_DATABASE_URI)
+    replicas = [make_url(uri) for uri in config.SQLALCHEMY_REPLICA_URIS]
+    if primary.get_backend_name() != 'sqlite' or not replicas or \
+            any(replica.get_backend_name() != 'sqlite' for replica in replicas):
+        print("❌ 主库和副本都必须是 SQLite 文件，并通过 DATABASE_REPLICA_URLS 配置副本")
+        return
+
+    while True:
+        source = sqlite3.connect(primary.database)
+        try:
+            for replica in replicas:
+                target = sqlite3.connect(replica.database, timeout=30)
+                try:
+                    source.backup(target)
+                finally:
+                    target.close()
+        finally:
+            source.close()
+        print(f"🔁 已同步 {len(replicas)} 个副本")
+
+        if interval <= 0:
+            break
+        time.sleep(interval)
 
 
 def main():
     """主函数"""
+    from init_db import add_synthetic_arguments, synthetic_options
+
     parser = argparse.ArgumentParser(description='拼车应用启动脚本')
 
     # 子命令
@@ -235,15 +649,47 @@ def main():
     prod_parser.add_argument('--host', default='0.0.0.0', help='主机地址')
     prod_parser.add_argument('--port', type=int, default=5000, help='端口号')
     prod_parser.add_argument('--workers', type=int, default=4, help='工作进程数')
+    prod_parser.add_argument('--threads', type=int, default=8, help='每个工作进程的线程数')
 
     # 数据库管理
-    subparsers.add_parser('init-db', help='初始化数据库')
+    init_db_parser = subparsers.add_parser('init-db', help='初始化数据库')
+    add_synthetic_arguments(init_db_parser)
     subparsers.add_parser('reset-db', help='重置数据库')
 
     # 其他工具
     subparsers.add_parser('test', help='运行测试')
+    bench_login_parser = subparsers.add_parser('bench-login', help='登录吞吐量基准测试')
+    bench_login_parser.add_argument('--requests', type=int, default=200, help='登录请求总数')
+    bench_login_parser.add_argument('--concurrency', type=int, default=8, help='并发数')
+    bench_login_parser.add_argument('--workers', type=int, help='哈希进程池大小')
+    bench_db_parser = subparsers.add_parser('bench-db', help='数据库并发读写基准测试')
+    bench_db_parser.add_argument('--duration', type=int, default=5, help='每组测试时长（秒）')
+    bench_db_parser.add_argument('--readers', type=int, default=4, help='读线程数')
+    bench_db_parser.add_argument('--writers', type=int, default=2, help='写线程数')
+    bench_json_parser = subparsers.add_parser('bench-json', help='行程列表 JSON 序列化基准测试')
+    bench_json_parser.add_argument('--trips', type=int, default=10000, help='行程数')
+    bench_json_parser.add_argument('--repeat', type=int, default=5, help='每项重复次数')
+    bench_compress_parser = subparsers.add_parser('bench-compress', help='响应压缩基准测试')
+    bench_compress_parser.add_argument('--repeat', type=int, default=20, help='每项重复次数')
+    bench_parser = subparsers.add_parser('bench', help='场景压测')
+    bench_parser.add_argument('--users', type=int, default=16, help='虚拟用户数')
+    bench_parser.add_argument('--duration', type=int, default=20, help='压测时长（秒）')
+    bench_parser.add_argument('--drivers', type=int, default=50, help='准备的司机数')
+    bench_parser.add_argument('--passengers', type=int, default=200, help='准备的乘客数')
+    bench_parser.add_argument('--trips', type=int, default=2000, help='准备的行程数')
+    bench_parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    bench_parser.add_argument('--url', help='压测已启动的服务，如 http://127.0.0.1:5000；默认进程内')
+    bench_parser.add_argument('--output', help='把报告写入 JSON 文件')
+    match_parser = subparsers.add_parser('match', help='批量匹配拼车请求和行程')
+    match_parser.add_argument('--top-k', type=int, help='每个请求/行程保留的匹配数')
+    match_parser.add_argument('--window', type=int, help='出发时间窗口（分钟）')
+    match_parser.add_argument('--output', help='把匹配结果写入 JSON 文件')
     subparsers.add_parser('routes', help='显示路由')
     subparsers.add_parser('status', help='显示状态')
+    reconcile_parser = subparsers.add_parser('reconcile-stats', help='校正统计计数器')
+    reconcile_parser.add_argument('--interval', type=int, default=0, help='周期运行的间隔（秒），0 表示只运行一次')
+    sync_replicas_parser = subparsers.add_parser('sync-replicas', help='把 SQLite 主库复制到副本文件（本地测试）')
+    sync_replicas_parser.add_argument('--interval', type=int, default=0, help='周期复制的间隔（秒），0 表示只复制一次')
     subparsers.add_parser('create-admin', help='创建管理员用户')
 
     args = parser.parse_args()
@@ -277,11 +723,12 @@ def main():
         run_production_server(
             host=args.host,
             port=args.port,
-            workers=args.workers
+            workers=args.workers,
+            threads=args.threads
         )
 
     elif args.command == 'init-db':
-        init_database()
+        init_database(synthetic_options(args))
 
     elif args.command == 'reset-db':
         from init_db import reset_database
@@ -292,12 +739,53 @@ def main():
     elif args.command == 'test':
         run_tests()
 
+    elif args.command == 'bench-login':
+        benchmark_login(
+            total=args.requests,
+            concurrency=args.concurrency,
+            workers=args.workers
+        )
+
+    elif args.command == 'bench-db':
+        benchmark_storage(
+            duration=args.duration,
+            readers=args.readers,
+            writers=args.writers
+        )
+
+    elif args.command == 'bench-json':
+        benchmark_json(trips=args.trips, repeat=args.repeat)
+
+    elif args.command == 'bench-compress':
+        benchmark_compression(repeat=args.repeat)
+
+    elif args.command == 'bench':
+        run_bench(
+            users=args.users,
+            duration=args.duration,
+            drivers=args.drivers,
+            passengers=args.passengers,
+            trips=args.trips,
+            seed=args.seed,
+            url=args.url,
+            output=args.output
+        )
+
+    elif args.command == 'match':
+        run_matching(top_k=args.top_k, window=args.window, output=args.output)
+
     elif args.command == 'routes':
         show_routes()
 
     elif args.command == 'status':
         show_status()
 
+    elif args.command == 'reconcile-stats':
+        reconcile_stats(interval=args.interval)
+
+    elif args.command == 'sync-replicas':
+        sync_replicas(interval=args.interval)
+
     elif args.command == 'create-admin':
         create_admin_user()
 
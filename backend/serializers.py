@@ -0,0 +1,347 @@
+"""
+JSON 序列化
+
+- JSONProvider：安装为 app.json。装了 orjson 时用 orjson 编解码，否则退回 Flask 默认的
+  标准库实现；datetime、Decimal 等类型仍按 Flask 的规则转换，输出与默认实现兼容。
+- Serializer：列表接口使用的预编译序列化器。字段到输出的映射在模块加载时构建一次，
+  查询只取需要的列，每行结果元组直接组装成输出字典，不实例化 ORM 对象，也不逐行调用
+  to_dict。输出与对应模型的 to_dict 相同。
+- 字段选择与侧载：我的行程接口支持 fields[类型]=a,b 只输出部分字段，以及
+  include=trip,driver,passenger 把关联的行程、司机、乘客放进 included 中按 id 各输出
+  一次，预订和行程只通过 trip_id、passenger_id、driver_id 引用它们。
+"""
+
+from flask.json.provider import DefaultJSONProvider
+
+from models import db, Booking, Trip, RideRequest, User
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - 未安装时使用标准库
+    orjson = None
+
+
+class JSONProvider(DefaultJSONProvider):
+    """优先使用 orjson 的 JSON 提供器"""
+
+    # 不排序键，保留字典的插入顺序
+    sort_keys = False
+
+    def _options(self):
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_SERIALIZE_NUMPY
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return option
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self._options()).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+
+        obj = self._prepare_response_obj(args, kwargs)
+        option = self._options() | orjson.OPT_APPEND_NEWLINE
+        if self.compact is False or (self.compact is None and self._app.debug):
+            option |= orjson.OPT_INDENT_2
+        body = orjson.dumps(obj, default=self.default, option=option)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def format_minutes(value):
+    """与 to_dict 中的 strftime('%Y-%m-%d %H:%M') 相同，但快得多"""
+    return value.isoformat(' ', 'minutes')
+
+
+class Serializer:
+    """
+    预编译的序列化器
+
+    fields 为 [(输出名, 列)]；nested 为 {输出名: (关系, [(输出名, 列)])}，关系用内连接
+    一起查出；formats 为 {输出名: 转换函数}，只作用于顶层字段；joins 为顶层字段引用
+    其他表时需要连接的关系。模型自身的列保留原来的键名，可直接用于 keyset_page 的游标。
+    """
+
+    def __init__(self, model, fields, nested=None, formats=None, joins=()):
+        self.model = model
+        self.columns = [column for _, column in fields]
+        self.joins = list(joins)
+        self._spec = (fields, nested or {}, formats or {}, joins)
+        self._subsets = {}
+        self._names = tuple(name for name, _ in fields)
+        self._formats = tuple((formats or {}).items())
+        self._nested = []
+
+        start = len(fields)
+        for key, (relationship, nested_fields) in (nested or {}).items():
+            self.joins.append(relationship)
+            self.columns.extend(column.label(f'{key}_{name}') for name, column in nested_fields)
+            end = start + len(nested_fields)
+            self._nested.append((key, tuple(name for name, _ in nested_fields), start, end))
+            start = end
+
+    def only(self, names):
+        """只输出 names 中字段的序列化器，按字段集缓存；names 中不是本序列化器字段的名称被忽略"""
+        names = frozenset(names)
+        serializer = self._subsets.get(names)
+        if serializer is None:
+            fields, nested, formats, joins = self._spec
+            serializer = Serializer(
+                self.model,
+                fields=[(name, column) for name, column in fields if name in names],
+                nested={key: value for key, value in nested.items() if key in names},
+                formats={key: value for key, value in formats.items() if key in names},
+                joins=joins
+            )
+            self._subsets[names] = serializer
+        return serializer
+
+    def query(self):
+        """只查询序列化需要的列"""
+        query = db.session.query(*self.columns).select_from(self.model)
+        for relationship in self.joins:
+            query = query.join(relationship)
+        return query
+
+    def dump_row(self, row):
+        # zip 在较短的一方结束，顶层字段正好是结果元组的前缀
+        data = dict(zip(self._names, row))
+        for name, convert in self._formats:
+            data[name] = convert(data[name])
+        for key, names, start, end in self._nested:
+            data[key] = dict(zip(names, row[start:end]))
+        return data
+
+    def dump(self, rows):
+        return [self.dump_row(row) for row in rows]
+
+
+_TRIP_FIELDS = [
+    ('id', Trip.id),
+    ('driver_id', Trip.driver_id),
+    ('start_point', Trip.start_point),
+    ('end_point', Trip.end_point),
+    ('departure_time', Trip.departure_time),
+    ('available_seats', Trip.available_seats),
+    ('price', Trip.price),
+    ('status', Trip.status),
+    ('start_lat', Trip.start_lat),
+    ('start_lng', Trip.start_lng),
+    ('end_lat', Trip.end_lat),
+    ('end_lng', Trip.end_lng),
+]
+
+# Trip.to_dict 中的司机信息
+_DRIVER_FIELDS = [
+    ('name', User.name),
+    ('car_model', User.car_model),
+    ('plate_number', User.plate_number),
+    ('rating', User.rating),
+]
+
+trip_serializer = Serializer(
+    Trip,
+    fields=_TRIP_FIELDS,
+    nested={'driver': (Trip.driver, _DRIVER_FIELDS)},
+    formats={'departure_time': format_minutes}
+)
+
+ride_request_serializer = Serializer(
+    RideRequest,
+    fields=[
+        ('id', RideRequest.id),
+        ('passenger_id', RideRequest.passenger_id),
+        ('passenger_name', User.name.label('passenger_name')),
+        ('start_point', RideRequest.start_point),
+        ('end_point', RideRequest.end_point),
+        ('departure_time', RideRequest.departure_time),
+        ('seats', RideRequest.seats),
+        ('note', RideRequest.note),
+        ('status', RideRequest.status),
+        ('start_lat', RideRequest.start_lat),
+        ('start_lng', RideRequest.start_lng),
+        ('end_lat', RideRequest.end_lat),
+        ('end_lng', RideRequest.end_lng),
+    ],
+    formats={'departure_time': format_minutes},
+    joins=[RideRequest.passenger]
+)
+
+# 以下序列化器不连接关联表，关联对象按 id 单独批量查询，用于字段选择和侧载
+trip_row_serializer = Serializer(Trip, fields=_TRIP_FIELDS, formats={'departure_time': format_minutes})
+
+driver_serializer = Serializer(User, fields=_DRIVER_FIELDS)
+
+# User.to_dict 的字段
+_PASSENGER_FIELDS = [
+    ('id', User.id),
+    ('name', User.name),
+    ('phone', User.phone),
+    ('user_type', User.user_type),
+    ('car_model', User.car_model),
+    ('plate_number', User.plate_number),
+    ('rating', User.rating),
+    ('completed_trips', User.completed_trips),
+]
+
+_BOOKING_FIELDS = [
+    ('id', Booking.id),
+    ('trip_id', Booking.trip_id),
+    ('passenger_id', Booking.passenger_id),
+    ('seats', Booking.seats),
+    ('amount', Booking.amount),
+    ('status', Booking.status),
+    ('paid', Booking.paid),
+]
+
+passenger_serializer = Serializer(User, fields=_PASSENGER_FIELDS)
+
+booking_serializer = Serializer(Booking, fields=_BOOKING_FIELDS)
+
+# 各资源类型可选的字段（默认顺序），trip、driver、passenger 为关系字段
+RESOURCE_FIELDS = {
+    'booking': tuple(name for name, _ in _BOOKING_FIELDS) + ('trip', 'passenger'),
+    'trip': tuple(name for name, _ in _TRIP_FIELDS) + ('driver',),
+    'driver': tuple(name for name, _ in _DRIVER_FIELDS),
+    'passenger': tuple(name for name, _ in _PASSENGER_FIELDS),
+}
+
+# include 中可用的类型及其在 included 中的键
+INCLUDE_KEYS = {'trip': 'trips', 'driver': 'drivers', 'passenger': 'passengers'}
+
+# IN 查询每批的 id 数
+_ID_BATCH = 500
+
+
+class FieldsetError(ValueError):
+    """fields 或 include 参数无效"""
+
+
+def _names(value):
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+def parse_fieldsets(args, types):
+    """解析 fields[类型]=a,b 参数，返回 {类型: 字段元组}；未给出的类型输出全部字段"""
+    fieldsets = {}
+    for key, value in args.items():
+        if not (key.startswith('fields[') and key.endswith(']')):
+            continue
+        resource = key[len('fields['):-1]
+        names = _names(value)
+        if resource not in types or not names or names - set(RESOURCE_FIELDS[resource]):
+            raise FieldsetError(key)
+        fieldsets[resource] = tuple(name for name in RESOURCE_FIELDS[resource] if name in names)
+    return fieldsets
+
+
+def parse_include(args, types):
+    """解析 include=a,b 参数，返回要侧载的类型集合"""
+    names = _names(args.get('include', ''))
+    if names - set(types):
+        raise FieldsetError('include')
+    return frozenset(names)
+
+
+def _load_by_id(serializer, ids, *extra):
+    """按主键分批查询，返回 {id: 输出}；给出 extra 列时返回 {id: (输出, 列值, ...)}"""
+    model = serializer.model
+    width = len(serializer.columns)
+    ids = sorted(ids)
+    loaded = {}
+    for start in range(0, len(ids), _ID_BATCH):
+        rows = serializer.query().add_columns(model.id.label('_id'), *extra).filter(
+            model.id.in_(ids[start:start + _ID_BATCH])).all()
+        for row in rows:
+            data = serializer.dump_row(row)
+            loaded[row[width]] = (data, *row[width + 1:]) if extra else data
+    return loaded
+
+
+def _attach_drivers(trips, driver_ids, fieldsets, include):
+    """查询行程的司机；不侧载时嵌入到每个行程的 driver 字段，返回 {id: 司机}"""
+    embed = 'driver' in fieldsets.get('trip', RESOURCE_FIELDS['trip']) and 'driver' not in include
+    if not embed and 'driver' not in include:
+        return {}
+
+    drivers = _load_by_id(driver_serializer.only(fieldsets.get('driver', RESOURCE_FIELDS['driver'])),
+                          set(driver_ids))
+    if embed:
+        for trip, driver_id in zip(trips, driver_ids):
+            trip['driver'] = drivers[driver_id]
+    return drivers
+
+
+def dump_trips(criteria, order_by, fieldsets=None, include=frozenset()):
+    """
+    序列化行程列表
+
+    默认与 Trip.to_dict 相同；include 含 driver 时返回 {'trips': [...], 'included': {'drivers': {...}}}。
+    """
+    fieldsets = fieldsets or {}
+    serializer = trip_row_serializer.only(fieldsets.get('trip', RESOURCE_FIELDS['trip']))
+    width = len(serializer.columns)
+    rows = serializer.query().add_columns(Trip.driver_id.label('_driver_id')).filter(
+        *criteria).order_by(*order_by).all()
+
+    trips = [serializer.dump_row(row) for row in rows]
+    drivers = _attach_drivers(trips, [row[width] for row in rows], fieldsets, include)
+
+    if not include:
+        return trips
+    return {'trips': trips, 'included': {'drivers': drivers}}
+
+
+def dump_bookings(criteria, order_by, fieldsets=None, include=frozenset()):
+    """
+    序列化预订列表
+
+    默认与 Booking.to_dict 相同，行程（含司机）和乘客嵌入每个预订。include 中的类型
+    不再嵌入，而是在 included 中按 id 各输出一次，返回 {'bookings': [...], 'included': {...}}。
+    """
+    fieldsets = fieldsets or {}
+    booking_fields = fieldsets.get('booking', RESOURCE_FIELDS['booking'])
+    embed_trip = 'trip' in booking_fields and 'trip' not in include
+    embed_passenger = 'passenger' in booking_fields and 'passenger' not in include
+
+    serializer = booking_serializer.only(booking_fields)
+    width = len(serializer.columns)
+    rows = serializer.query().add_columns(
+        Booking.trip_id.label('_trip_id'), Booking.passenger_id.label('_passenger_id')
+    ).filter(*criteria).order_by(*order_by).all()
+
+    trips, drivers = {}, {}
+    if embed_trip or include & {'trip', 'driver'}:
+        trip_fields = fieldsets.get('trip', RESOURCE_FIELDS['trip'])
+        loaded = _load_by_id(trip_row_serializer.only(trip_fields), {row[width] for row in rows},
+                             Trip.driver_id)
+        trips = {trip_id: trip for trip_id, (trip, _) in loaded.items()}
+        drivers = _attach_drivers(list(trips.values()), [driver_id for _, driver_id in loaded.values()],
+                                  fieldsets, include)
+
+    passengers = {}
+    if embed_passenger or 'passenger' in include:
+        passenger_fields = fieldsets.get('passenger', RESOURCE_FIELDS['passenger'])
+        passengers = _load_by_id(passenger_serializer.only(passenger_fields), {row[width + 1] for row in rows})
+
+    bookings = []
+    for row in rows:
+        booking = serializer.dump_row(row)
+        if embed_trip:
+            booking['trip'] = trips[row[width]]
+        if embed_passenger:
+            booking['passenger'] = passengers[row[width + 1]]
+        bookings.append(booking)
+
+    if not include:
+        return bookings
+    included = {'trips': trips, 'drivers': drivers, 'passengers': passengers}
+    return {'bookings': bookings, 'included': {INCLUDE_KEYS[name]: included[INCLUDE_KEYS[name]]
+                                               for name in sorted(include)}}
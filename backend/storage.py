@@ -0,0 +1,243 @@
+"""
+数据库连接配置
+
+- SQLite：连接建立时执行 SQLITE_PRAGMAS（生产环境启用 WAL 等），并设置忙等待超时，
+  避免多个 gunicorn 工作进程并发写入时直接报 "database is locked"；
+- 其他数据库：按 DB_POOL_* 配置连接池大小、溢出、回收和获取超时；
+- 读副本：配置 SQLALCHEMY_REPLICA_URIS 后，标记为 @read_only 的接口从副本读取。
+  写入（flush、UPDATE/INSERT/DELETE、SELECT ... FOR UPDATE）始终走主库；同一请求
+  写过之后、以及同一用户/IP 提交写事务后的 REPLICA_STICKY_SECONDS 秒内，读取也走
+  主库，保证读到自己的写入。最近写入的时间记录在进程内（REPLICA_STICKY_STORAGE=
+  'memory'，仅限单进程），或记录在 REPLICA_STICKY_STORAGE_PATH 指定的 SQLite 文件中，
+  由多个工作进程共享（'sqlite'）。
+"""
+
+import os
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy.session import Session as FlaskSession
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+REPLICA_BIND_PREFIX = 'replica_'
+
+
+class MemoryWriteMarks:
+    """进程内的最近写入时间，仅限单进程部署"""
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._marks = {}  # 客户端标识 -> 写入时间
+        self._lock = threading.Lock()
+
+    def mark(self, keys, now, window):
+        with self._lock:
+            if len(self._marks) >= self.max_entries:
+                for key in [key for key, at in self._marks.items() if now - at >= window]:
+                    del self._marks[key]
+            for key in keys:
+                self._marks[key] = now
+
+    def last(self, keys):
+        """返回这些客户端最近一次写入的时间，没有记录时返回 None"""
+        with self._lock:
+            return max((self._marks[key] for key in keys if key in self._marks), default=None)
+
+
+class SQLiteWriteMarks:
+    """基于 SQLite 文件的最近写入时间，供多个 gunicorn 工作进程共享；过期的行定期删除"""
+
+    PURGE_INTERVAL = 60  # 秒
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._last_purge = 0.0
+        self._connection().execute(
+            'CREATE TABLE IF NOT EXISTS write_marks (key TEXT PRIMARY KEY, at REAL NOT NULL)'
+        )
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def mark(self, keys, now, window):
+        connection = self._connection()
+        try:
+            if now - self._last_purge >= self.PURGE_INTERVAL:
+                self._last_purge = now
+                connection.execute('DELETE FROM write_marks WHERE at <= ?', (now - window,))
+            connection.executemany(
+                'INSERT INTO write_marks (key, at) VALUES (?, ?) '
+                'ON CONFLICT (key) DO UPDATE SET at = max(at, excluded.at)',
+                [(key, now) for key in keys]
+            )
+        except sqlite3.OperationalError:
+            # 文件暂时被锁时放弃记录，最多读到稍旧的副本数据
+            pass
+
+    def last(self, keys):
+        """返回这些客户端最近一次写入的时间，没有记录时返回 None；读取失败时按刚写入处理"""
+        placeholders = ', '.join('?' * len(keys))
+        try:
+            row = self._connection().execute(
+                f'SELECT max(at) FROM write_marks WHERE key IN ({placeholders})', keys
+            ).fetchone()
+        except sqlite3.OperationalError:
+            return time.time()
+        return row[0]
+
+
+# 最近提交过写事务的客户端，init_app 时按配置替换
+_write_marks = MemoryWriteMarks()
+
+
+def engine_options(config, uri=None):
+    """根据数据库类型生成引擎参数，SQLALCHEMY_ENGINE_OPTIONS 中显式配置的项优先"""
+    url = make_url(uri or config['SQLALCHEMY_DATABASE_URI'])
+
+    if url.get_backend_name() == 'sqlite':
+        options = {'connect_args': {'timeout': config.get('SQLITE_BUSY_TIMEOUT', 5)}}
+    else:
+        options = {
+            'pool_size': config.get('DB_POOL_SIZE', 10),
+            'max_overflow': config.get('DB_MAX_OVERFLOW', 20),
+            'pool_recycle': config.get('DB_POOL_RECYCLE', 1800),
+            'pool_timeout': config.get('DB_POOL_TIMEOUT', 30),
+            'pool_pre_ping': True,
+        }
+
+    options.update(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    return options
+
+
+def _apply_pragmas(engine, pragmas):
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+
+def init_app(app):
+    """在 db.init_app 之前调用，写入主库和副本的引擎参数"""
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    replica_keys = []
+    for index, uri in enumerate(app.config.get('SQLALCHEMY_REPLICA_URIS') or []):
+        key = f'{REPLICA_BIND_PREFIX}{index}'
+        binds[key] = dict(engine_options(app.config, uri), url=uri)
+        replica_keys.append(key)
+    app.config['SQLALCHEMY_BINDS'] = binds
+    app.extensions['replica_binds'] = replica_keys
+
+    global _write_marks
+    if replica_keys and app.config.get('REPLICA_STICKY_STORAGE', 'memory') == 'sqlite':
+        _write_marks = SQLiteWriteMarks(app.config['REPLICA_STICKY_STORAGE_PATH'])
+    else:
+        _write_marks = MemoryWriteMarks()
+
+
+def configure_engine(app):
+    """在 db.init_app 之后调用，为 SQLite 连接注册 PRAGMA"""
+    pragmas = app.config.get('SQLITE_PRAGMAS')
+    if not pragmas:
+        return
+
+    with app.app_context():
+        engines = app.extensions['sqlalchemy'].engines
+        for engine in engines.values():
+            if engine.dialect.name == 'sqlite':
+                _apply_pragmas(engine, pragmas)
+
+
+def _client_keys():
+    keys = [f'ip:{request.remote_addr}']
+    if g.get('user_id') is not None:
+        keys.append(f"user:{g.user_id}")
+    return keys
+
+
+def _recently_wrote():
+    # 写入时间要在进程间比较，使用墙上时间而不是 time.monotonic()
+    last = _write_marks.last(_client_keys())
+    return last is not None and time.time() - last < current_app.config.get('REPLICA_STICKY_SECONDS', 5)
+
+
+def _record_write():
+    if current_app.extensions.get('replica_binds'):
+        _write_marks.mark(_client_keys(), time.time(), current_app.config.get('REPLICA_STICKY_SECONDS', 5))
+
+
+def _is_write(clause):
+    return clause is not None and (
+        getattr(clause, 'is_dml', False) or getattr(clause, '_for_update_arg', None) is not None
+    )
+
+
+class RoutingSession(FlaskSession):
+    """只读请求从副本读取，其余情况交给 Flask-SQLAlchemy 选择主库"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if _is_write(clause):
+            self.info['wrote'] = True
+        elif bind is None and self._can_use_replica():
+            replica_keys = current_app.extensions.get('replica_binds')
+            if replica_keys:
+                return self._db.engines[random.choice(replica_keys)]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _can_use_replica(self):
+        if not has_request_context() or not g.get('read_only') or g.get('use_primary'):
+            return False
+        if self._flushing or self.info.get('wrote'):
+            return False
+        return not _recently_wrote()
+
+
+@event.listens_for(RoutingSession, 'before_flush')
+def _mark_written(session, flush_context, instances):
+    session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _remember_writer(session):
+    if session.info.pop('wrote', False) and has_request_context():
+        _record_write()
+        # 本请求后续的读取也走主库
+        g.use_primary = True
+
+
+def read_only(f):
+    """标记只读接口，配置了副本时从副本读取"""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        g.read_only = True
+        return f(*args, **kwargs)
+
+    return decorated
+
+
+@contextmanager
+def use_primary():
+    """在只读接口中强制从主库读取"""
+    previous = g.get('use_primary', False)
+    g.use_primary = True
+    try:
+        yield
+    finally:
+        g.use_primary = previous
@@ -0,0 +1,108 @@
+"""
+增量同步
+
+每个写事务从 change_sequence 表分配一个单调递增的序号，写入的 Trip、Booking、
+RideRequest、Message 行都记上该序号，删除的行留下墓碑（见 models.next_change_seq）。
+客户端保存上次同步得到的高水位，/api/sync?since=N 只返回序号大于 N 的行。
+
+SQLite 的写事务是串行的，序号在持有写锁后分配，因此提交顺序与序号顺序一致；
+换用支持并发写事务的数据库时需要另行保证这一点。
+"""
+
+from flask import Blueprint, current_app, request, jsonify
+from sqlalchemy import or_, select
+from sqlalchemy.orm import joinedload
+
+from auth import token_required
+from models import db, Trip, RideRequest, Booking, Message, ChangeSequence, SyncTombstone, SYNC_MODELS
+
+sync_bp = Blueprint('sync', __name__)
+
+
+def _changed(query, model, since, high_water_mark, limit=None):
+    query = query.filter(
+        model.change_seq > since,
+        model.change_seq <= high_water_mark
+    ).order_by(model.change_seq, model.id)
+    if limit is not None:
+        query = query.limit(limit + 1)
+    return query.all()
+
+
+@sync_bp.route('/sync', methods=['GET'])
+@token_required
+def sync_changes(current_user):
+    """返回自 since 以来变更的行、墓碑和新的高水位"""
+    since = request.args.get('since', 0, type=int)
+    limit = current_app.config['SYNC_MAX_ROWS']
+
+    # 先读高水位，之后只返回不超过它的行
+    high_water_mark = db.session.execute(
+        select(ChangeSequence.value).where(ChangeSequence.id == 1)
+    ).scalar_one()
+
+    # 行程对所有人可见，司机还能看到所有拼车请求；其余墓碑只发给被删除行的参与者
+    public_tables = [SYNC_MODELS[Trip]]
+    if current_user.user_type == 'driver':
+        bookings = Booking.query.join(Trip, Booking.trip_id == Trip.id).filter(
+            Trip.driver_id == current_user.id)
+        ride_requests = RideRequest.query
+        public_tables.append(SYNC_MODELS[RideRequest])
+    else:
+        bookings = Booking.query.filter(Booking.passenger_id == current_user.id)
+        ride_requests = RideRequest.query.filter(RideRequest.passenger_id == current_user.id)
+    tombstone_query = SyncTombstone.query.filter(or_(
+        SyncTombstone.table_name.in_(public_tables),
+        SyncTombstone.owner_id == current_user.id,
+        SyncTombstone.other_id == current_user.id
+    ))
+
+    queries = {
+        'trips': (Trip.query.options(joinedload(Trip.driver)), Trip),
+        'bookings': (bookings.options(joinedload(Booking.trip).joinedload(Trip.driver),
+                                      joinedload(Booking.passenger)), Booking),
+        'ride_requests': (ride_requests.options(joinedload(RideRequest.passenger)), RideRequest),
+        'messages': (Message.query.filter(or_(
+            Message.sender_id == current_user.id,
+            Message.receiver_id == current_user.id
+        )), Message),
+        'deleted': (tombstone_query, SyncTombstone),
+    }
+    changes = {
+        name: _changed(query, model, since, high_water_mark, limit)
+        for name, (query, model) in queries.items()
+    }
+
+    # 任一类结果被截断时，把高水位降到第一条未返回行的序号之前，其余类别也只返回
+    # 不超过它的行。若这样无法前进（单个事务写入的行数超过上限），则整组返回该事务的行。
+    has_more = False
+    for rows in changes.values():
+        if len(rows) > limit:
+            has_more = True
+            cut = rows[limit].change_seq - 1
+            high_water_mark = min(high_water_mark, cut if cut > since else cut + 1)
+
+    for name, rows in changes.items():
+        if len(rows) > limit and rows[-1].change_seq == high_water_mark:
+            query, model = queries[name]
+            changes[name] = [row for row in rows if row.change_seq < high_water_mark] + \
+                _changed(query, model, high_water_mark - 1, high_water_mark)
+    tombstones = changes.pop('deleted')
+
+    result = {
+        'since': since,
+        'high_water_mark': high_water_mark,
+        'has_more': has_more,
+        'deleted': {name: [] for name in SYNC_MODELS.values()}
+    }
+    for name, rows in changes.items():
+        result[name] = [
+            dict(row.to_dict(include_sender=False) if name == 'messages' else row.to_dict(),
+                 change_seq=row.change_seq)
+            for row in rows if row.change_seq <= high_water_mark
+        ]
+    for tombstone in tombstones:
+        if tombstone.change_seq <= high_water_mark:
+            result['deleted'][tombstone.table_name].append(tombstone.row_id)
+
+    return jsonify(result)
@@ -0,0 +1,90 @@
+"""
+测试夹具
+
+每个测试使用 tmp_path 下独立的 SQLite 文件，而不是 TestingConfig 默认的内存数据库，
+多个线程（各自的连接）才能看到同一份数据。
+"""
+
+import os
+import sys
+from datetime import datetime, timedelta
+
+import jwt
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+from config import SQLITE_PRODUCTION_PRAGMAS  # noqa: E402
+from models import db, Trip, User  # noqa: E402
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app(
+        'testing',
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'test.db'}",
+        SQLITE_PRAGMAS=SQLITE_PRODUCTION_PRAGMAS
+    )
+    with app.app_context():
+        # 只建主库的表；其他测试的应用配置过的副本会在 db 上留下对应的元数据
+        db.create_all(bind_key=None)
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_user(app):
+    """创建用户，返回其 id"""
+    counter = iter(range(1, 1000000))
+
+    def make(user_type='passenger', name=None):
+        index = next(counter)
+        with app.app_context():
+            user = User(name=name or f'{user_type}{index}', phone=f'138{index:08d}', user_type=user_type)
+            user.set_password('password')
+            db.session.add(user)
+            db.session.commit()
+            return user.id
+
+    return make
+
+
+@pytest.fixture
+def make_trip(app):
+    """创建行程，返回其 id"""
+    def make(driver_id, seats=3, price=20.0, start_point='北京', end_point='天津', departure_time=None):
+        with app.app_context():
+            trip = Trip(
+                driver_id=driver_id,
+                start_point=start_point,
+                end_point=end_point,
+                departure_time=departure_time or datetime.utcnow() + timedelta(days=1),
+                available_seats=seats,
+                price=price
+            )
+            db.session.add(trip)
+            db.session.commit()
+            return trip.id
+
+    return make
+
+
+@pytest.fixture
+def auth_header(app):
+    """生成与 /login 相同格式的令牌"""
+    def header(user_id):
+        token = jwt.encode({
+            'user_id': user_id,
+            'exp': datetime.utcnow() + timedelta(hours=1)
+        }, app.config['SECRET_KEY'], algorithm='HS256')
+        return {'Authorization': f'Bearer {token}'}
+
+    return header
@@ -0,0 +1,57 @@
+"""并发预订和取消：座位不超卖，重复取消只归还一次座位"""
+
+import threading
+from collections import Counter
+
+from models import db, Booking, Trip
+
+
+def _run_concurrently(app, requests):
+    """每个线程用自己的测试客户端同时发出一个请求，返回各自的状态码"""
+    barrier = threading.Barrier(len(requests))
+    statuses = [None] * len(requests)
+
+    def worker(index, send):
+        client = app.test_client()
+        barrier.wait()
+        statuses[index] = send(client).status_code
+
+    threads = [threading.Thread(target=worker, args=item) for item in enumerate(requests)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return Counter(statuses)
+
+
+def test_concurrent_bookings_do_not_oversell(app, make_user, make_trip, auth_header):
+    seats, passengers = 3, 12
+    trip_id = make_trip(make_user('driver'), seats=seats)
+    headers = [auth_header(make_user()) for _ in range(passengers)]
+
+    statuses = _run_concurrently(app, [
+        lambda client, h=h: client.post('/api/bookings', json={'trip_id': trip_id, 'seats': 1}, headers=h)
+        for h in headers
+    ])
+
+    assert statuses == {201: seats, 400: passengers - seats}
+    with app.app_context():
+        assert Booking.query.filter_by(trip_id=trip_id, status='confirmed').count() == seats
+        assert db.session.get(Trip, trip_id).available_seats == 0
+
+
+def test_concurrent_cancels_release_seats_once(app, client, make_user, make_trip, auth_header):
+    trip_id = make_trip(make_user('driver'), seats=3)
+    headers = auth_header(make_user())
+    response = client.post('/api/bookings', json={'trip_id': trip_id, 'seats': 2}, headers=headers)
+    assert response.status_code == 201
+    booking_id = response.get_json()['booking']['id']
+
+    statuses = _run_concurrently(app, [
+        lambda client: client.put(f'/api/bookings/{booking_id}/cancel', headers=headers)
+    ] * 8)
+
+    assert statuses == {200: 1, 400: 7}
+    with app.app_context():
+        assert db.session.get(Booking, booking_id).status == 'cancelled'
+        assert db.session.get(Trip, trip_id).available_seats == 3
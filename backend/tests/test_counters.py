@@ -0,0 +1,52 @@
+"""计数器在没有原生 upsert 的数据库上的回退写法"""
+
+import pytest
+from sqlalchemy import insert
+
+import counters
+from counters import get_unread_total
+from models import db, UnreadCounter
+
+
+class RacingSession:
+    """第一条语句执行后，模拟另一个事务抢先插入同一个计数器行"""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.raced = False
+
+    @property
+    def dialect(self):
+        return db.session.get_bind().dialect
+
+    def begin_nested(self):
+        return db.session.begin_nested()
+
+    def execute(self, stmt):
+        result = db.session.execute(stmt)
+        if not self.raced:
+            self.raced = True
+            db.session.execute(insert(UnreadCounter).values(user_id=self.user_id, unread=5))
+        return result
+
+
+@pytest.fixture
+def without_upsert(monkeypatch):
+    monkeypatch.setattr(counters, '_UPSERT_INSERTS', {})
+
+
+def test_fallback_inserts_then_increments(app, make_user, without_upsert):
+    user_id = make_user()
+    with app.app_context():
+        counters._increment(UnreadCounter, {'user_id': user_id}, 1)
+        counters._increment(UnreadCounter, {'user_id': user_id}, 2)
+        db.session.commit()
+        assert get_unread_total(user_id) == 3
+
+
+def test_fallback_retries_update_when_insert_races(app, make_user, without_upsert):
+    user_id = make_user()
+    with app.app_context():
+        counters._increment(UnreadCounter, {'user_id': user_id}, 1, executor=RacingSession(user_id))
+        db.session.commit()
+        assert get_unread_total(user_id) == 6
@@ -0,0 +1,22 @@
+"""事件轮询线程：出错后继续投递"""
+
+import time
+
+from events import SQLiteBackend
+
+
+def test_poller_survives_a_bad_event(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / 'events.db'), poll_interval=0.01)
+    subscription = backend.subscribe(1)
+    time.sleep(0.05)
+
+    # 无法解析的事件只被跳过，之后的事件照常投递
+    backend._connection().execute(
+        "INSERT INTO events (user_id, type, data, created_at) VALUES (1, 'message', 'not json', ?)",
+        (time.time(),)
+    )
+    backend.publish(1, 'message', {'id': 2})
+
+    event = subscription.get(timeout=2)
+    assert event is not None
+    assert event[1:] == ('message', {'id': 2})
@@ -0,0 +1,19 @@
+"""密码哈希进程池繁忙时，注册和登录返回 503 而不是 500"""
+
+import hashing
+
+
+def test_busy_hash_pool_returns_503(app, client, make_user):
+    make_user(name='张三')
+    app.config.update(PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_MAX_PENDING=1, PASSWORD_HASH_TIMEOUT=0.001)
+    try:
+        # 新建的进程池来不及在超时内完成哈希
+        login = client.post('/api/login', json={'phone': '13800000001', 'password': 'password'})
+        register = client.post('/api/register', json={
+            'name': '李四', 'phone': '13900000000', 'password': 'password', 'user_type': 'passenger'})
+    finally:
+        hashing.shutdown()
+
+    for response in (login, register):
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == str(app.config['PASSWORD_HASH_RETRY_AFTER'])
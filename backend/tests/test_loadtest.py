@@ -0,0 +1,16 @@
+"""压测脚本的冒烟测试：进程内跑一秒，确保客户端和报告的接口没有被改坏"""
+
+import loadtest
+
+
+def test_loadtest_runs_in_process(app):
+    with app.app_context():
+        driver_phones, passenger_phones = loadtest.seed(drivers=2, passengers=4, trips=20, ride_requests=5)
+
+    report = loadtest.run(lambda: loadtest.InProcessClient(app), driver_phones, passenger_phones,
+                          users=3, duration=1)
+
+    assert report['total_requests'] > 0
+    assert 'login' in report['operations']
+    assert all(op['server_errors'] == 0 for op in report['operations'].values()), report['operations']
+    assert report['endpoints']
@@ -0,0 +1,28 @@
+"""匹配接口：同一对 (行程, 拼车请求) 从两个方向查询得分相同"""
+
+from datetime import datetime, timedelta
+
+from models import db, RideRequest
+
+
+def test_match_score_is_the_same_from_both_sides(app, client, make_user, make_trip, auth_header):
+    departure = datetime.utcnow() + timedelta(days=1)
+    driver_id = make_user('driver')
+    trip_id = make_trip(driver_id, price=20.0, departure_time=departure)
+    # 更贵的行程不在时间窗口内，但决定了价格得分的归一化基准
+    make_trip(make_user('driver'), price=80.0, departure_time=departure + timedelta(days=3))
+    passenger_id = make_user()
+    with app.app_context():
+        ride_request = RideRequest(passenger_id=passenger_id, start_point='北京', end_point='天津',
+                                   departure_time=departure + timedelta(minutes=30), seats=1)
+        db.session.add(ride_request)
+        db.session.commit()
+        request_id = ride_request.id
+
+    by_request = client.get(f'/api/ride-requests/{request_id}/matches', headers=auth_header(passenger_id))
+    by_trip = client.get(f'/api/trips/{trip_id}/matches', headers=auth_header(driver_id))
+
+    assert by_request.status_code == by_trip.status_code == 200
+    [from_request] = [m for m in by_request.get_json()['matches'] if m['trip_id'] == trip_id]
+    [from_trip] = [m for m in by_trip.get_json()['matches'] if m['request_id'] == request_id]
+    assert from_request['score'] == from_trip['score']
@@ -0,0 +1,60 @@
+"""游标分页约定：响应体是数组，沿 Link rel="next" 翻页能不重不漏地取到全部行"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from counters import record_message_sent
+from models import db, Message, Trip, User
+
+
+@pytest.fixture
+def data(app):
+    """一个用户与 5 个联系人各有 1 条消息，与第一个联系人另有 4 条；7 个行程"""
+    with app.app_context():
+        users = [User(name=f'用户{i}', phone=f'137{i:08d}', user_type='driver', password_hash='-')
+                 for i in range(6)]
+        db.session.add_all(users)
+        db.session.flush()
+        me, peers = users[0].id, [user.id for user in users[1:]]
+        for index, peer in enumerate(peers + [peers[0]] * 4):
+            message = Message(sender_id=me if index % 2 else peer, receiver_id=peer if index % 2 else me,
+                              content=str(index))
+            db.session.add(message)
+            db.session.flush()
+            record_message_sent(message)
+        for hours in range(7):
+            db.session.add(Trip(driver_id=me, start_point='北京', end_point='天津', available_seats=2, price=20.0,
+                                departure_time=datetime.utcnow() + timedelta(hours=hours + 1)))
+        db.session.commit()
+    return me, peers
+
+
+def _walk(client, path, headers):
+    rows = []
+    while path:
+        response = client.get(path, headers=headers)
+        assert response.status_code == 200
+        page = response.get_json()
+        assert isinstance(page, list) and len(page) <= 2
+        rows.extend(page)
+        link = response.headers.get('Link')
+        assert (link is None) == (response.headers.get('X-Next-Cursor') is None)
+        path = link[1:link.index('>')] if link else None
+    return rows
+
+
+@pytest.mark.parametrize('path, expected', [
+    ('/api/trips?limit=2', 7),
+    ('/api/trips/search?start_point=北京&limit=2', 7),
+    ('/api/messages?limit=2', 9),
+    ('/api/conversations?limit=2', 5),
+    ('/api/conversations/{peer}/messages?limit=2', 5),
+])
+def test_pages_follow_link_header(client, auth_header, data, path, expected):
+    me, peers = data
+    rows = _walk(client, path.format(peer=peers[0]), auth_header(me))
+
+    assert len(rows) == expected
+    ids = [row['last_message']['id'] if 'last_message' in row else row['id'] for row in rows]
+    assert len(set(ids)) == expected
@@ -0,0 +1,110 @@
+"""列表接口的查询次数不随返回行数增长（没有 N+1）"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from cache import trip_list_cache, user_cache
+from counters import record_message_sent
+from models import db, Booking, Message, RideRequest, Trip, User
+
+
+class Seeder:
+    """在同一个库里为一个查看者逐步添加数据，每行关联一个新用户"""
+
+    def __init__(self, app):
+        self.app = app
+        self.users = 0
+
+    def user(self, user_type):
+        self.users += 1
+        # 直接写入哈希，避免为几十个用户计算密码哈希
+        user = User(name=f'{user_type}{self.users}', phone=f'139{self.users:08d}',
+                    user_type=user_type, password_hash='-')
+        db.session.add(user)
+        db.session.flush()
+        return user.id
+
+    def trip(self, driver_id=None):
+        trip = Trip(driver_id=driver_id or self.user('driver'), start_point='北京', end_point='天津',
+                    departure_time=datetime.utcnow() + timedelta(days=1), available_seats=3, price=20.0)
+        db.session.add(trip)
+        db.session.flush()
+        return trip.id
+
+    def add(self, kind, viewer_id, count):
+        with self.app.app_context():
+            for _ in range(count):
+                if kind == 'trips':
+                    self.trip()
+                elif kind == 'driver_trips':
+                    self.trip(viewer_id)
+                elif kind == 'bookings':
+                    db.session.add(Booking(trip_id=self.trip(), passenger_id=viewer_id, seats=1, amount=20.0))
+                elif kind == 'ride_requests':
+                    db.session.add(RideRequest(passenger_id=self.user('passenger'), start_point='北京',
+                                               end_point='天津', seats=1,
+                                               departure_time=datetime.utcnow() + timedelta(days=1)))
+                elif kind == 'messages':
+                    db.session.add(Message(sender_id=self.user('passenger'), receiver_id=viewer_id, content='你好'))
+                elif kind == 'conversations':
+                    message = Message(sender_id=self.user('passenger'), receiver_id=viewer_id, content='你好')
+                    db.session.add(message)
+                    db.session.flush()
+                    record_message_sent(message)
+            db.session.commit()
+
+
+# (数据类型, 查看者类型, 请求路径)
+ENDPOINTS = [
+    ('trips', None, '/api/trips?limit=100'),
+    ('driver_trips', 'driver', '/api/my-trips'),
+    ('bookings', 'passenger', '/api/my-trips'),
+    ('ride_requests', 'driver', '/api/ride-requests'),
+    ('messages', 'passenger', '/api/messages?limit=100'),
+    ('conversations', 'passenger', '/api/conversations?limit=100'),
+]
+
+
+def _count_selects(app, client, path, headers):
+    """清空缓存后发出请求，返回执行的 SELECT 语句数"""
+    trip_list_cache.clear()
+    user_cache.clear()
+    selects = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            selects.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        response = client.get(path, headers=headers)
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    assert response.status_code == 200
+    return len(selects), response
+
+
+@pytest.mark.parametrize('kind, viewer_type, path', ENDPOINTS, ids=[e[0] for e in ENDPOINTS])
+def test_query_count_does_not_grow_with_rows(app, client, auth_header, kind, viewer_type, path):
+    seeder = Seeder(app)
+    viewer_id = None
+    headers = {}
+    if viewer_type:
+        with app.app_context():
+            viewer_id = seeder.user(viewer_type)
+            db.session.commit()
+        headers = auth_header(viewer_id)
+
+    seeder.add(kind, viewer_id, 1)
+    one_row, response = _count_selects(app, client, path, headers)
+    assert len(response.get_json()) == 1
+
+    seeder.add(kind, viewer_id, 49)
+    fifty_rows, response = _count_selects(app, client, path, headers)
+    assert len(response.get_json()) == 50
+
+    assert fifty_rows == one_row
@@ -0,0 +1,26 @@
+"""限流：部署在反向代理之后时按转发的客户端地址分桶"""
+
+import pytest
+
+from app import create_app
+from models import db
+
+
+@pytest.mark.parametrize('proxies, separate_buckets', [(1, True), (0, False)])
+def test_anonymous_buckets_use_forwarded_address(tmp_path, proxies, separate_buckets):
+    app = create_app(
+        'testing',
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'test.db'}",
+        RATELIMITS={'trips.get_trips': (0.001, 1)},
+        PROXY_FIX_X_FOR=proxies
+    )
+    with app.app_context():
+        db.create_all(bind_key=None)
+    client = app.test_client()
+
+    def get(address):
+        return client.get('/api/trips', headers={'X-Forwarded-For': address}).status_code
+
+    assert get('203.0.113.1') == 200
+    assert get('203.0.113.1') == 429
+    assert get('203.0.113.2') == (200 if separate_buckets else 429)
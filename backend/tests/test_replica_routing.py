@@ -0,0 +1,73 @@
+"""读副本路由：主库和副本是两个内容不同的 SQLite 文件，按返回的数据判断读取走了哪个库"""
+
+import shutil
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app import create_app
+from models import db, Message
+
+
+@pytest.fixture
+def databases(tmp_path, app, make_user):
+    """主库和副本都有两个用户，但各有一条只在自己库中的消息"""
+    sender_id, receiver_id = make_user(), make_user()
+    with app.app_context():
+        db.engine.dispose()
+    primary, replica = tmp_path / 'test.db', tmp_path / 'replica.db'
+    shutil.copy(primary, replica)
+
+    for path, content in ((primary, '主库'), (replica, '副本')):
+        engine = create_engine(f'sqlite:///{path}')
+        with Session(engine) as session:
+            session.add(Message(sender_id=sender_id, receiver_id=receiver_id, content=content))
+            session.commit()
+        engine.dispose()
+    return primary, replica, sender_id, receiver_id
+
+
+def _make_app(tmp_path, primary, replica):
+    return create_app(
+        'testing',
+        SQLALCHEMY_DATABASE_URI=f'sqlite:///{primary}',
+        SQLALCHEMY_REPLICA_URIS=[f'sqlite:///{replica}'],
+        REPLICA_STICKY_STORAGE='sqlite',
+        REPLICA_STICKY_STORAGE_PATH=str(tmp_path / 'writes.db')
+    )
+
+
+def _contents(client, user_id, peer_id, headers, remote_addr):
+    response = client.get(f'/api/conversations/{peer_id}/messages', headers=headers(user_id),
+                          environ_base={'REMOTE_ADDR': remote_addr})
+    assert response.status_code == 200
+    return {message['content'] for message in response.get_json()}
+
+
+def test_reads_go_to_replica_until_the_client_writes(tmp_path, databases, auth_header):
+    primary, replica, sender_id, receiver_id = databases
+    client = _make_app(tmp_path, primary, replica).test_client()
+
+    assert _contents(client, receiver_id, sender_id, auth_header, '10.0.0.1') == {'副本'}
+
+    response = client.post('/api/messages', json={'receiver_id': sender_id, 'content': '回复'},
+                           headers=auth_header(receiver_id), environ_base={'REMOTE_ADDR': '10.0.0.1'})
+    assert response.status_code == 201
+
+    # 写入只到主库；写入者随后的读取走主库，能看到自己的写入
+    assert _contents(client, receiver_id, sender_id, auth_header, '10.0.0.1') == {'主库', '回复'}
+    # 其他用户、其他 IP 的读取仍走副本
+    assert _contents(client, sender_id, receiver_id, auth_header, '10.0.0.2') == {'副本'}
+
+
+def test_recent_write_marker_is_shared_between_processes(tmp_path, databases, auth_header):
+    primary, replica, sender_id, receiver_id = databases
+    writer = _make_app(tmp_path, primary, replica).test_client()
+    response = writer.post('/api/messages', json={'receiver_id': sender_id, 'content': '回复'},
+                           headers=auth_header(receiver_id), environ_base={'REMOTE_ADDR': '10.0.0.1'})
+    assert response.status_code == 201
+
+    # 另一个应用实例（相当于另一个工作进程）从同一个 SQLite 文件读到写入标记
+    reader = _make_app(tmp_path, primary, replica).test_client()
+    assert _contents(reader, receiver_id, sender_id, auth_header, '10.0.0.3') == {'主库', '回复'}
@@ -0,0 +1,50 @@
+"""GET /api/trips/search 的每种过滤组合都应是索引范围扫描，并且由索引满足 ORDER BY"""
+
+import pytest
+from sqlalchemy import event
+
+from models import db
+
+SHAPES = [
+    {},
+    {'start_point': '北京'},
+    {'end_point': '天津'},
+    {'start_point': '北京', 'end_point': '天津'},
+    {'departure_from': '2030-01-01T08:00', 'departure_to': '2030-01-01T20:00'},
+    {'start_point': '北京', 'departure_from': '2030-01-01T08:00', 'departure_to': '2030-01-01T20:00'},
+    {'end_point': '天津', 'departure_from': '2030-01-01T08:00', 'departure_to': '2030-01-01T20:00'},
+    {'start_point': '北京', 'end_point': '天津',
+     'departure_from': '2030-01-01T08:00', 'departure_to': '2030-01-01T20:00'},
+]
+
+
+def _trip_selects(app, client, params):
+    """发出搜索请求，返回其中查询 trip 表的 (SQL, 参数)"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT') and 'FROM trip' in statement:
+            statements.append((statement, parameters))
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        response = client.get('/api/trips/search', query_string=dict(params, seats=1, max_price=100))
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    assert response.status_code == 200
+    return engine, statements
+
+
+@pytest.mark.parametrize('params', SHAPES, ids=lambda params: '+'.join(params) or 'all')
+def test_search_uses_index_without_sort(app, client, params):
+    engine, statements = _trip_selects(app, client, params)
+    assert statements
+
+    with engine.connect() as connection:
+        for statement, parameters in statements:
+            plan = [row[-1] for row in connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters)]
+            trip_steps = [step for step in plan if ' trip ' in f'{step} ']
+            assert trip_steps and all('USING' in step and 'INDEX ix_trip_' in step for step in trip_steps), plan
+            assert not any('TEMP B-TREE' in step for step in plan), plan
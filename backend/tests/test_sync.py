@@ -0,0 +1,54 @@
+"""增量同步：墓碑只发给能看到被删除行的用户，消息变更走 (参与者, change_seq) 索引"""
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_
+
+from models import db, Booking, Message, RideRequest
+
+
+def _sync(client, headers):
+    response = client.get('/api/sync?since=0', headers=headers)
+    assert response.status_code == 200
+    return response.get_json()['deleted']
+
+
+def test_tombstones_are_filtered_by_participant(app, client, make_user, make_trip, auth_header):
+    driver_id, other_driver_id = make_user('driver'), make_user('driver')
+    alice, bob = make_user(), make_user()
+    trip_id = make_trip(driver_id)
+    with app.app_context():
+        rows = [
+            Booking(trip_id=trip_id, passenger_id=bob, seats=1, amount=20.0),
+            Message(sender_id=bob, receiver_id=driver_id, content='你好'),
+            RideRequest(passenger_id=bob, start_point='北京', end_point='天津', seats=1,
+                        departure_time=datetime.utcnow() + timedelta(days=1)),
+        ]
+        db.session.add_all(rows)
+        db.session.commit()
+        booking_id, message_id, request_id = (row.id for row in rows)
+        for row in rows:
+            db.session.delete(row)
+        db.session.commit()
+
+    assert _sync(client, auth_header(alice)) == {'trips': [], 'bookings': [], 'ride_requests': [], 'messages': []}
+    assert _sync(client, auth_header(bob)) == {
+        'trips': [], 'bookings': [booking_id], 'ride_requests': [request_id], 'messages': [message_id]}
+    # 行程的司机能看到预订和发给他的消息；所有司机都能看到拼车请求
+    assert _sync(client, auth_header(driver_id)) == {
+        'trips': [], 'bookings': [booking_id], 'ride_requests': [request_id], 'messages': [message_id]}
+    assert _sync(client, auth_header(other_driver_id)) == {
+        'trips': [], 'bookings': [], 'ride_requests': [request_id], 'messages': []}
+
+
+def test_message_changes_use_participant_indexes(app):
+    with app.app_context():
+        query = Message.query.filter(
+            or_(Message.sender_id == 1, Message.receiver_id == 1),
+            Message.change_seq > 0, Message.change_seq <= 10
+        )
+        statement = query.statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+        with db.engine.connect() as connection:
+            plan = [row[-1] for row in connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}')]
+    assert any('ix_message_sender_change' in step for step in plan), plan
+    assert any('ix_message_receiver_change' in step for step in plan), plan
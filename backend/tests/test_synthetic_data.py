@@ -0,0 +1,49 @@
+"""合成数据生成和计数器重建"""
+
+import logging
+
+from sqlalchemy import select
+
+from counters import mark_conversation_read, rebuild_unread_counters, record_message_sent
+from init_db import generate_synthetic_data
+from models import db, ConversationUnread, Message, UnreadCounter
+
+
+def _counter_rows():
+    conversations = db.session.execute(select(
+        ConversationUnread.user_id, ConversationUnread.peer_id,
+        ConversationUnread.unread, ConversationUnread.last_message_id
+    ).order_by(ConversationUnread.user_id, ConversationUnread.peer_id)).all()
+    totals = db.session.execute(select(UnreadCounter.user_id, UnreadCounter.unread).where(
+        UnreadCounter.unread > 0
+    ).order_by(UnreadCounter.user_id)).all()
+    return conversations, totals
+
+
+def test_rebuild_matches_incremental_counters(app, make_user):
+    alice, bob, carol = make_user(), make_user(), make_user()
+    with app.app_context():
+        for sender_id, receiver_id in [(alice, bob), (bob, alice), (alice, bob), (carol, bob),
+                                       (bob, carol), (carol, alice)]:
+            message = Message(sender_id=sender_id, receiver_id=receiver_id, content='hi')
+            db.session.add(message)
+            db.session.flush()
+            record_message_sent(message)
+        mark_conversation_read(bob, carol)
+        db.session.commit()
+        incremental = _counter_rows()
+
+        total = rebuild_unread_counters()
+
+        assert _counter_rows() == incremental
+        assert total == sum(unread for _, unread in incremental[1]) == 5
+
+
+def test_generation_does_not_log_slow_queries(app, caplog):
+    app.config['SLOW_QUERY_THRESHOLD_MS'] = 0
+    with app.app_context(), caplog.at_level(logging.WARNING):
+        generate_synthetic_data(users=20, trips=20, bookings=20, messages=50, ride_requests=5)
+
+        assert not [record for record in caplog.records if '慢查询' in record.getMessage()]
+        assert app.config['SLOW_QUERY_THRESHOLD_MS'] == 0
+        assert ConversationUnread.query.count() > 0
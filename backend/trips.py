@@ -1,20 +1,215 @@
-from flask import Blueprint, request, jsonify
-from datetime import datetime
-from models import db, Trip, RideRequest, Booking, User
+from flask import Blueprint, Response, current_app, request, jsonify
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+from sqlalchemy import case, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+from models import db, Trip, RideRequest, Booking, User, next_change_seq
 from auth import token_required
+from idempotency import idempotent
+from geo import covering_cells, haversine_km, is_valid_point
+from cache import trip_list_cache
+from compression import use_cached_encodings
+from events import broker
+from counters import adjust_stats
+from pagination import CursorError, decode_cursor, get_page_limit, keyset_page, set_next_cursor
+from storage import read_only, use_primary
+from serializers import (FieldsetError, dump_bookings, dump_trips, parse_fieldsets, parse_include,
+                         ride_request_serializer, trip_serializer)
 
 trips_bp = Blueprint('trips', __name__)
 
 
+def _reserve_seats(trip_id, seats):
+    """
+    原子地扣减座位：一条带条件的 UPDATE，座位不足或行程不可预订时不修改任何行
+
+    返回是否预订成功。座位扣到 0 时同时把行程改为 ongoing。
+    """
+    updated = Trip.query.filter(
+        Trip.id == trip_id,
+        Trip.status == 'active',
+        Trip.available_seats >= seats
+    ).update({
+        Trip.available_seats: Trip.available_seats - seats,
+        Trip.status: case((Trip.available_seats == seats, 'ongoing'), else_=Trip.status),
+        Trip.change_seq: next_change_seq()
+    }, synchronize_session=False)
+    if updated != 1:
+        return False
+
+    # 行已被本事务锁定，读到的就是刚写入的状态
+    status = db.session.execute(select(Trip.status).where(Trip.id == trip_id)).scalar_one()
+    if status == 'ongoing':
+        adjust_stats(Trip, {'active': -1, 'ongoing': 1})
+    return True
+
+
+def _release_seats(trip_id, seats):
+    """原子地归还座位，ongoing 的行程恢复为 active"""
+    status = db.session.execute(
+        select(Trip.status).where(Trip.id == trip_id).with_for_update()
+    ).scalar_one()
+
+    Trip.query.filter(Trip.id == trip_id).update({
+        Trip.available_seats: Trip.available_seats + seats,
+        Trip.status: case((Trip.status == 'ongoing', 'active'), else_=Trip.status),
+        Trip.change_seq: next_change_seq()
+    }, synchronize_session=False)
+
+    if status == 'ongoing':
+        adjust_stats(Trip, {'ongoing': -1, 'active': 1})
+
+
+def _parse_coordinates(data):
+    """解析可选的起终点坐标，坐标需成对提供，格式错误时抛出 ValueError"""
+    coordinates = {}
+    for prefix in ('start', 'end'):
+        lat, lng = data.get(f'{prefix}_lat'), data.get(f'{prefix}_lng')
+        if lat is None and lng is None:
+            continue
+        if lat is None or lng is None:
+            raise ValueError(prefix)
+        lat, lng = float(lat), float(lng)
+        if not is_valid_point(lat, lng):
+            raise ValueError(prefix)
+        coordinates[f'{prefix}_lat'] = lat
+        coordinates[f'{prefix}_lng'] = lng
+    return coordinates
+
+
 @trips_bp.route('/trips', methods=['GET'])
+@read_only
 def get_trips():
-    """获取可用行程列表"""
-    trips = Trip.query.filter_by(status='active').order_by(Trip.departure_time).all()
-    return jsonify([trip.to_dict() for trip in trips])
+    """获取可用行程列表（按出发时间游标分页，带缓存和 ETag）"""
+    limit = get_page_limit()
+    after = request.args.get('after')
+    cache_key = (limit, after)
+
+    entry = trip_list_cache.get(cache_key)
+    if entry is None:
+        # 先读版本号再查库，避免把旧数据存成新版本
+        version = trip_list_cache.version()
+
+        try:
+            after_key = decode_cursor(after, datetime, int) if after else None
+        except CursorError:
+            return jsonify({'error': '分页游标无效'}), 400
+
+        # 刚失效时副本可能还没有同步到这次写入，从主库读取，避免把旧数据存成新版本
+        recently_changed = trip_list_cache.version_age() < current_app.config['REPLICA_STICKY_SECONDS']
+        with use_primary() if recently_changed else nullcontext():
+            trips, next_cursor = keyset_page(
+                trip_serializer.query().filter(Trip.status == 'active'),
+                (Trip.departure_time, Trip.id),
+                limit,
+                after=after_key
+            )
+
+        body = jsonify(trip_serializer.dump(trips)).get_data()
+        entry = trip_list_cache.set(cache_key, body, version, next_cursor)
+
+    use_cached_encodings(entry.encoded)
+    response = Response(entry.body, mimetype='application/json')
+    response.set_etag(entry.etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    set_next_cursor(response, entry.next_cursor)
+    return response.make_conditional(request)
+
+
+@trips_bp.route('/trips/search', methods=['GET'])
+@read_only
+def search_trips():
+    """
+    按起点、终点、出发时间窗口、最少空座和最高价格搜索可用行程
+
+    起点/终点为等值过滤，与出发时间窗口一起命中 ix_trip_search_* 索引的范围扫描；
+    空座和价格在扫描到的行上过滤。
+    """
+    args = request.args
+    limit = get_page_limit()
+    after = args.get('after')
+
+    try:
+        after_key = decode_cursor(after, datetime, int) if after else None
+    except CursorError:
+        return jsonify({'error': '分页游标无效'}), 400
+
+    try:
+        departure_from = args.get('departure_from')
+        departure_to = args.get('departure_to')
+        departure_from = datetime.strptime(departure_from, '%Y-%m-%dT%H:%M') if departure_from else None
+        departure_to = datetime.strptime(departure_to, '%Y-%m-%dT%H:%M') if departure_to else None
+    except ValueError:
+        return jsonify({'error': '时间格式错误，应为 YYYY-MM-DDTHH:MM'}), 400
+
+    min_seats = args.get('seats', type=int)
+    max_price = args.get('max_price', type=float)
+
+    query = trip_serializer.query().filter(Trip.status == 'active')
+    if args.get('start_point'):
+        query = query.filter(Trip.start_point == args['start_point'])
+    if args.get('end_point'):
+        query = query.filter(Trip.end_point == args['end_point'])
+    if departure_from:
+        query = query.filter(Trip.departure_time >= departure_from)
+    if departure_to:
+        query = query.filter(Trip.departure_time <= departure_to)
+    if min_seats:
+        query = query.filter(Trip.available_seats >= min_seats)
+    if max_price is not None:
+        query = query.filter(Trip.price <= max_price)
+
+    trips, next_cursor = keyset_page(
+        query,
+        (Trip.departure_time, Trip.id),
+        limit,
+        after=after_key
+    )
+
+    return set_next_cursor(jsonify(trip_serializer.dump(trips)), next_cursor)
+
+
+@trips_bp.route('/trips/nearby', methods=['GET'])
+@read_only
+def get_nearby_trips():
+    """获取起点在指定半径内的可用行程，按距离排序"""
+    lat = request.args.get('lat', type=float)
+    lng = request.args.get('lng', type=float)
+    if lat is None or lng is None or not is_valid_point(lat, lng):
+        return jsonify({'error': '缺少或无效的坐标'}), 400
+
+    radius_km = request.args.get('radius_km', 5.0, type=float)
+    if not 0 < radius_km <= current_app.config['GEO_MAX_RADIUS_KM']:
+        return jsonify({'error': '搜索半径无效'}), 400
+
+    limit = get_page_limit()
+
+    # 先用网格索引取出候选行，再精确计算距离
+    candidates = trip_serializer.query().filter(
+        Trip.status == 'active',
+        Trip.start_cell.in_(covering_cells(lat, lng, radius_km))
+    ).all()
+
+    nearby = []
+    for trip in candidates:
+        distance = haversine_km(lat, lng, trip.start_lat, trip.start_lng)
+        if distance <= radius_km:
+            nearby.append((distance, trip))
+    nearby.sort(key=lambda item: (item[0], item[1].id))
+
+    results = []
+    for distance, trip in nearby[:limit]:
+        trip_data = trip_serializer.dump_row(trip)
+        trip_data['distance_km'] = round(distance, 3)
+        results.append(trip_data)
+
+    return jsonify({'trips': results})
 
 
 @trips_bp.route('/trips', methods=['POST'])
 @token_required
+@idempotent
 def create_trip(current_user):
     """司机创建行程"""
     if current_user.user_type != 'driver':
@@ -38,6 +233,11 @@ def create_trip(current_user):
     except ValueError:
         return jsonify({'error': '时间格式错误，应为 YYYY-MM-DDTHH:MM'}), 400
 
+    try:
+        coordinates = _parse_coordinates(data)
+    except (TypeError, ValueError):
+        return jsonify({'error': '坐标格式错误'}), 400
+
     try:
         trip = Trip(
             driver_id=current_user.id,
@@ -45,11 +245,13 @@ def create_trip(current_user):
             end_point=data['end_point'],
             departure_time=departure_time,
             available_seats=int(data['available_seats']),
-            price=float(data['price'])
+            price=float(data['price']),
+            **coordinates
         )
 
         db.session.add(trip)
         db.session.commit()
+        trip_list_cache.invalidate()
 
         return jsonify({
             'message': '行程创建成功',
@@ -64,19 +266,35 @@ def create_trip(current_user):
 @trips_bp.route('/my-trips', methods=['GET'])
 @token_required
 def get_my_trips(current_user):
-    """获取我的行程"""
+    """
+    获取我的行程
+
+    支持 fields[类型]=a,b 只返回部分字段，以及 include=... 把关联对象按 id 放进 included：
+    司机的类型为 trip、driver，乘客的类型为 booking、trip、driver、passenger。
+    """
+    if current_user.user_type == 'driver':
+        types, includable = ('trip', 'driver'), ('driver',)
+    else:
+        types, includable = ('booking', 'trip', 'driver', 'passenger'), ('trip', 'driver', 'passenger')
+    try:
+        fieldsets = parse_fieldsets(request.args, types)
+        include = parse_include(request.args, includable)
+    except FieldsetError:
+        return jsonify({'error': 'fields 或 include 参数无效'}), 400
+
     if current_user.user_type == 'driver':
         # 司机查看自己创建的行程
-        trips = Trip.query.filter_by(driver_id=current_user.id).order_by(Trip.departure_time.desc()).all()
-        return jsonify([trip.to_dict() for trip in trips])
+        return jsonify(dump_trips([Trip.driver_id == current_user.id], [Trip.departure_time.desc()],
+                                  fieldsets, include))
     else:
         # 乘客查看自己的预订
-        bookings = Booking.query.filter_by(passenger_id=current_user.id).order_by(Booking.created_at.desc()).all()
-        return jsonify([booking.to_dict() for booking in bookings])
+        return jsonify(dump_bookings([Booking.passenger_id == current_user.id], [Booking.created_at.desc()],
+                                     fieldsets, include))
 
 
 @trips_bp.route('/bookings', methods=['POST'])
 @token_required
+@idempotent
 def create_booking(current_user):
     """预订行程"""
     if current_user.user_type != 'passenger':
@@ -84,11 +302,18 @@ def create_booking(current_user):
 
     data = request.get_json()
     trip_id = data.get('trip_id')
-    seats = data.get('seats', 1)
 
     if not trip_id:
         return jsonify({'error': '缺少行程ID'}), 400
 
+    try:
+        seats = int(data.get('seats', 1))
+    except (TypeError, ValueError):
+        return jsonify({'error': '座位数无效'}), 400
+
+    if seats < 1:
+        return jsonify({'error': '座位数无效'}), 400
+
     trip = Trip.query.get(trip_id)
     if not trip:
         return jsonify({'error': '行程不存在'}), 404
@@ -109,6 +334,11 @@ def create_booking(current_user):
         return jsonify({'error': '您已经预订过这个行程'}), 400
 
     try:
+        # 以上检查只用于快速失败，真正的座位扣减由条件 UPDATE 保证不会超卖
+        if not _reserve_seats(trip_id, seats):
+            db.session.rollback()
+            return jsonify({'error': '座位不足'}), 400
+
         # 计算总价
         amount = trip.price * seats
 
@@ -119,39 +349,49 @@ def create_booking(current_user):
             amount=amount
         )
 
-        # 更新可用座位数
-        trip.available_seats -= seats
-
-        # 如果座位订满，更新行程状态
-        if trip.available_seats == 0:
-            trip.status = 'ongoing'
-
         db.session.add(booking)
         db.session.commit()
+        trip_list_cache.invalidate()
 
-        return jsonify({
-            'message': '预订成功',
-            'booking': booking.to_dict()
-        }), 201
+        booking_data = booking.to_dict()
+
+    except IntegrityError:
+        # 并发的重复预订被唯一约束拦截，座位扣减随事务一起回滚
+        db.session.rollback()
+        return jsonify({'error': '您已经预订过这个行程'}), 400
 
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': '预订失败'}), 500
 
+    broker.publish(booking_data['trip']['driver_id'], 'booking_created', {
+        'booking_id': booking_data['id'],
+        'trip_id': booking_data['trip_id'],
+        'passenger_id': booking_data['passenger_id'],
+        'seats': booking_data['seats']
+    })
+
+    return jsonify({
+        'message': '预订成功',
+        'booking': booking_data
+    }), 201
+
 
 @trips_bp.route('/ride-requests', methods=['GET'])
+@read_only
 @token_required
 def get_ride_requests(current_user):
     """获取拼车请求列表"""
     if current_user.user_type == 'driver':
         # 司机查看所有活跃的拼车请求
-        requests = RideRequest.query.filter_by(status='active').order_by(RideRequest.departure_time).all()
+        query = ride_request_serializer.query().filter(RideRequest.status == 'active').order_by(
+            RideRequest.departure_time)
     else:
         # 乘客查看自己的拼车请求
-        requests = RideRequest.query.filter_by(passenger_id=current_user.id).order_by(
-            RideRequest.created_at.desc()).all()
+        query = ride_request_serializer.query().filter(
+            RideRequest.passenger_id == current_user.id).order_by(RideRequest.created_at.desc())
 
-    return jsonify([req.to_dict() for req in requests])
+    return jsonify(ride_request_serializer.dump(query.all()))
 
 
 @trips_bp.route('/ride-requests', methods=['POST'])
@@ -179,6 +419,11 @@ def create_ride_request(current_user):
     except ValueError:
         return jsonify({'error': '时间格式错误'}), 400
 
+    try:
+        coordinates = _parse_coordinates(data)
+    except (TypeError, ValueError):
+        return jsonify({'error': '坐标格式错误'}), 400
+
     try:
         ride_request = RideRequest(
             passenger_id=current_user.id,
@@ -186,7 +431,8 @@ def create_ride_request(current_user):
             end_point=data['end_point'],
             departure_time=departure_time,
             seats=int(data['seats']),
-            note=data.get('note', '')
+            note=data.get('note', ''),
+            **coordinates
         )
 
         db.session.add(ride_request)
@@ -202,6 +448,87 @@ def create_ride_request(current_user):
         return jsonify({'error': '发布失败'}), 500
 
 
+def _match_window(departure_time, window_minutes):
+    """与 departure_time 相差不超过窗口的出发时间范围"""
+    window = timedelta(minutes=max(int(window_minutes), 1))
+    return departure_time - window, departure_time + window
+
+
+def _match_top_k():
+    """读取 k 参数，限制在 [1, MATCH_MAX_TOP_K] 之间"""
+    default = current_app.config['MATCH_TOP_K']
+    k = request.args.get('k', default, type=int)
+    return max(1, min(k or default, current_app.config['MATCH_MAX_TOP_K']))
+
+
+@trips_bp.route('/ride-requests/<int:request_id>/matches', methods=['GET'])
+@token_required
+def get_request_matches(current_user, request_id):
+    """获取与拼车请求最匹配的行程"""
+    from matching import load_requests, load_trips, match, max_trip_price
+
+    ride_request = RideRequest.query.get(request_id)
+    if not ride_request:
+        return jsonify({'error': '拼车请求不存在'}), 404
+
+    if current_user.user_type != 'driver' and ride_request.passenger_id != current_user.id:
+        return jsonify({'error': '无权查看此拼车请求'}), 403
+
+    # 只加载出发时间窗口内的行程，价格仍按全部可预订行程归一化，与批量匹配的得分一致
+    window = current_app.config['MATCH_TIME_WINDOW_MINUTES']
+    by_request, _ = match(
+        load_requests([request_id]),
+        load_trips(departure_between=_match_window(ride_request.departure_time, window)),
+        top_k=_match_top_k(),
+        window_minutes=window,
+        max_price=max_trip_price()
+    )
+    matches = by_request.get(request_id, [])
+
+    trips = Trip.query.filter(Trip.id.in_([m.trip_id for m in matches])).options(
+        joinedload(Trip.driver)
+    ).all()
+    trips = {trip.id: trip for trip in trips}
+
+    return jsonify({
+        'matches': [dict(m.to_dict(), trip=trips[m.trip_id].to_dict()) for m in matches]
+    })
+
+
+@trips_bp.route('/trips/<int:trip_id>/matches', methods=['GET'])
+@token_required
+def get_trip_matches(current_user, trip_id):
+    """获取与行程最匹配的拼车请求（司机操作）"""
+    from matching import load_requests, load_trips, match, max_trip_price
+
+    trip = Trip.query.get(trip_id)
+    if not trip:
+        return jsonify({'error': '行程不存在'}), 404
+
+    if trip.driver_id != current_user.id:
+        return jsonify({'error': '无权操作此行程'}), 403
+
+    # 只加载了一个行程，价格同样按全部可预订行程归一化，两个方向查询同一对的得分相同
+    window = current_app.config['MATCH_TIME_WINDOW_MINUTES']
+    _, by_trip = match(
+        load_requests(departure_between=_match_window(trip.departure_time, window)),
+        load_trips([trip_id]),
+        top_k=_match_top_k(),
+        window_minutes=window,
+        max_price=max_trip_price()
+    )
+    matches = by_trip.get(trip_id, [])
+
+    requests = RideRequest.query.filter(RideRequest.id.in_([m.request_id for m in matches])).options(
+        joinedload(RideRequest.passenger)
+    ).all()
+    requests = {req.id: req for req in requests}
+
+    return jsonify({
+        'matches': [dict(m.to_dict(), request=requests[m.request_id].to_dict()) for m in matches]
+    })
+
+
 @trips_bp.route('/bookings/<int:booking_id>/cancel', methods=['PUT'])
 @token_required
 def cancel_booking(current_user, booking_id):
@@ -218,28 +545,42 @@ def cancel_booking(current_user, booking_id):
         return jsonify({'error': '预订状态不允许取消'}), 400
 
     try:
-        # 恢复行程座位数
-        trip = Trip.query.get(booking.trip_id)
-        trip.available_seats += booking.seats
+        # 条件更新预订状态，并发的重复取消只有一个能成功
+        cancelled = Booking.query.filter_by(id=booking_id, status='confirmed').update(
+            {Booking.status: 'cancelled', Booking.change_seq: next_change_seq()},
+            synchronize_session=False
+        )
+        if not cancelled:
+            db.session.rollback()
+            return jsonify({'error': '预订状态不允许取消'}), 400
+        adjust_stats(Booking, {'confirmed': -1, 'cancelled': 1})
 
-        # 如果行程状态是ongoing，改回active
-        if trip.status == 'ongoing' and trip.available_seats > 0:
-            trip.status = 'active'
+        # 恢复行程座位数
+        _release_seats(booking.trip_id, booking.seats)
 
-        # 更新预订状态
-        booking.status = 'cancelled'
+        # 提交后访问属性会重新加载，事件内容在提交前取出
+        driver_id = booking.trip.driver_id
+        event_data = {
+            'booking_id': booking.id,
+            'trip_id': booking.trip_id,
+            'passenger_id': booking.passenger_id,
+            'seats': booking.seats
+        }
 
         db.session.commit()
-
-        return jsonify({'message': '取消预订成功'})
+        trip_list_cache.invalidate()
 
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': '取消失败'}), 500
 
+    broker.publish(driver_id, 'booking_cancelled', event_data)
+
+    return jsonify({'message': '取消预订成功'})
+
 
 @trips_bp.route('/trips/<int:trip_id>/complete', methods=['PUT'])
-@token_required
+@token_required(live=True)
 def complete_trip(current_user, trip_id):
     """结束行程（司机操作）"""
     trip = Trip.query.get(trip_id)
@@ -259,17 +600,22 @@ def complete_trip(current_user, trip_id):
 
         # 更新所有相关预订状态
         bookings = Booking.query.filter_by(trip_id=trip_id).all()
+        passenger_ids = []
         for booking in bookings:
             if booking.status == 'confirmed':
                 booking.status = 'completed'
+                passenger_ids.append(booking.passenger_id)
 
         # 更新司机完成行程数
         current_user.completed_trips += 1
 
         db.session.commit()
-
-        return jsonify({'message': '行程已结束'})
+        trip_list_cache.invalidate()
 
     except Exception as e:
         db.session.rollback()
-        return jsonify({'error': '操作失败'}), 500
\ No newline at end of file
+        return jsonify({'error': '操作失败'}), 500
+
+    broker.publish(passenger_ids, 'trip_completed', {'trip_id': trip_id})
+
+    return jsonify({'message': '行程已结束'})
\ No newline at end of file